@@ -231,7 +231,6 @@ class PackageManagerApp:
             self.installed_tree.delete(item)
             
         # Get installed apps from database
-        self.os_app.db.connect()
         self.os_app.db.cursor.execute('''
             SELECT name, version, author, installed_at 
             FROM installed_apps 
@@ -279,14 +278,43 @@ class PackageManagerApp:
             messagebox.showwarning("No Selection", "Please select packages to install")
             return
             
-        for pkg_id in selected:
-            self.install_package(pkg_id)
+        # Ask every question before taking the database write lock
+        packages = [pkg_id for pkg_id in selected if self.confirm_install(pkg_id)]
+        if not packages:
+            return
             
+        names = [self.available_packages[pkg_id]['name'] for pkg_id in packages]
+        self.status_bar.config(text=f"Installing {', '.join(names)}...")
+        self.window.update()
+        
+        # One commit for the whole selection
+        with self.os_app.db.transaction():
+            for pkg_id in packages:
+                self.register_package(pkg_id, self.available_packages[pkg_id])
+                
+        self.installation_finished(names)
+        
     def install_package(self, pkg_id):
         """Install a package"""
+        if not self.confirm_install(pkg_id):
+            return
+            
+        pkg_info = self.available_packages[pkg_id]
+        
+        # Simulate installation
+        self.status_bar.config(text=f"Installing {pkg_info['name']}...")
+        self.window.update()
+        
+        with self.os_app.db.transaction():
+            self.register_package(pkg_id, pkg_info)
+            
+        self.installation_finished([pkg_info['name']])
+        
+    def confirm_install(self, pkg_id):
+        """Check that a package exists and its dependencies are acceptable"""
         if pkg_id not in self.available_packages:
             messagebox.showerror("Error", f"Package '{pkg_id}' not found")
-            return
+            return False
             
         pkg_info = self.available_packages[pkg_id]
         
@@ -296,18 +324,24 @@ class PackageManagerApp:
                 if not messagebox.askyesno("Dependencies", 
                       f"Missing dependencies: {', '.join(pkg_info['dependencies'])}\n"
                       "Continue anyway?"):
-                    return
-                    
-        # Simulate installation
-        self.status_bar.config(text=f"Installing {pkg_info['name']}...")
-        self.window.update()
+                    return False
+        return True
         
+    def register_package(self, pkg_id, pkg_info):
+        """Record a package as installed and create its application stub"""
         # Add to database
-        self.os_app.db.connect()
         self.os_app.db.cursor.execute('''
-            INSERT OR REPLACE INTO installed_apps 
+            INSERT INTO installed_apps 
             (name, version, author, description, entry_point, category, is_system_app)
             VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+            version = excluded.version,
+            author = excluded.author,
+            description = excluded.description,
+            entry_point = excluded.entry_point,
+            category = excluded.category,
+            is_system_app = excluded.is_system_app,
+            installed_at = CURRENT_TIMESTAMP
         ''', (
             pkg_info['name'],
             pkg_info['version'],
@@ -317,20 +351,22 @@ class PackageManagerApp:
             pkg_info['category'],
             0
         ))
-        self.os_app.db.connection.commit()
         
         # Create stub application file
         self.create_stub_application(pkg_id, pkg_info)
         
+    def installation_finished(self, names):
+        """Refresh package lists after an install"""
         # Update installed packages list
         self.populate_installed_packages()
         
         # Update OS app list
         self.os_app.installed_apps = self.os_app.load_installed_apps()
         
-        self.status_bar.config(text=f"Successfully installed {pkg_info['name']}")
+        installed = ', '.join(names)
+        self.status_bar.config(text=f"Successfully installed {installed}")
         messagebox.showinfo("Installation Complete", 
-                          f"{pkg_info['name']} has been installed successfully!")
+                          f"{installed} has been installed successfully!")
                           
     def create_stub_application(self, pkg_id, pkg_info):
         """Create a stub application file for the package"""
@@ -417,7 +453,6 @@ if __name__ == "__main__":
                              f"Are you sure you want to uninstall {package_name}?"):
             
             # Remove from database
-            self.os_app.db.connect()
             self.os_app.db.cursor.execute('''
                 DELETE FROM installed_apps WHERE name = ?
             ''', (package_name,))
@@ -155,8 +155,7 @@ class SettingsApp:
     def show_trash_stats(self):
         """Show trash statistics dialog"""
         try:
-            items = self.os_app.db.get_trash_items(self.os_app.current_user, 1000)
-            total_size = self.os_app.db.get_trash_size(self.os_app.current_user)
+            stats = self.os_app.db.get_trash_stats(self.os_app.current_user)
             
             stats_window = tk.Toplevel(self.window)
             stats_window.title("Trash Statistics")
@@ -169,12 +168,12 @@ class SettingsApp:
             ).pack(pady=10)
             
             stats_text = f"""
-Items in trash: {len(items)}
-Total size: {self.format_size(total_size)}
+Items in trash: {stats['entries']}
+Total size: {self.format_size(stats['total_size'])}
 
 Breakdown:
-  Files: {sum(1 for item in items if item['type'] == 'file')}
-  Directories: {sum(1 for item in items if item['type'] == 'directory')}
+  Files: {stats['files']}
+  Directories: {stats['directories']}
 
 Items will be automatically removed after 30 days.
             """
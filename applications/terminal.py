@@ -3,6 +3,7 @@ from tkinter import scrolledtext
 import os
 import subprocess
 import platform
+from database import join_path, parse_id_list
 
 class TerminalApp:
     def __init__(self, parent, os_app):
@@ -198,6 +199,8 @@ Available commands:
 - clear: Clear terminal
 - echo [text]: Print text
 - ls [dir]: List directory
+- find <name> [dir]: Find files by name
+- grep <text> [dir]: Find files containing text
 - pwd: Print working directory
 - date: Show date and time
 - whoami: Show current user
@@ -222,7 +225,9 @@ Available commands:
             path = command[3:] if len(command) > 2 else '/home/admin'
             try:
                 files = self.os_app.db.list_directory(path)
-                if files:
+                if files is None:
+                    self.text_area.insert(tk.END, f"\nls: {path}: No such directory")
+                elif files:
                     for name, ftype, size, modified in files:
                         self.text_area.insert(tk.END, f"\n{ftype[0]} {name:20} {size:8}")
                 else:
@@ -230,6 +235,13 @@ Available commands:
             except Exception as e:
                 self.text_area.insert(tk.END, f"\nError: {e}")
                 
+        # Handle find/grep (full-text index, names or contents)
+        elif command.startswith('find ') or command.startswith('grep '):
+            args = command[5:].split()
+            if args:
+                self.search_files(args[0], args[1] if len(args) > 1 else '/',
+                                  names_only=command.startswith('find '))
+                
         # Handle pwd
         elif command == 'pwd':
             self.text_area.insert(tk.END, f"\n/home/admin")
@@ -288,7 +300,7 @@ Available commands:
                 self.text_area.insert(tk.END, f"\nTrash is empty.")
                 
             self.text_area.insert(tk.END, f"\n")
-            self.text_area.insert(tk.END, f"\nCommands: trash list, trash empty, trash restore <id>")
+            self.text_area.insert(tk.END, f"\nCommands: trash list, trash empty, trash restore <ids>")
             
         except Exception as e:
             self.text_area.insert(tk.END, f"\nError getting trash info: {e}")
@@ -336,17 +348,18 @@ Available commands:
         except Exception as e:
             self.text_area.insert(tk.END, f"\nError emptying trash: {e}")
             
-    def restore_trash_item(self, item_id):
-        """Restore item from trash"""
+    def restore_trash_item(self, item_ids):
+        """Restore items from trash ("5", "1,2,7" or "3-9")"""
         try:
-            success, new_name = self.os_app.db.restore_from_trash(int(item_id))
+            results = self.os_app.db.restore_many(parse_id_list(item_ids))
             
-            if success:
-                self.text_area.insert(tk.END, f"\n✓ Item restored from trash.")
-                if new_name:
-                    self.text_area.insert(tk.END, f"\n  Renamed to: {new_name}")
-            else:
-                self.text_area.insert(tk.END, f"\n✗ Failed to restore item.")
+            for trash_id, success, new_name in results:
+                if success:
+                    self.text_area.insert(tk.END, f"\n✓ Item {trash_id} restored from trash.")
+                    if new_name:
+                        self.text_area.insert(tk.END, f"\n  Renamed to: {new_name}")
+                else:
+                    self.text_area.insert(tk.END, f"\n✗ Failed to restore item {trash_id}.")
                 
         except Exception as e:
             self.text_area.insert(tk.END, f"\nError restoring item: {e}")
@@ -359,6 +372,20 @@ Available commands:
             size /= 1024.0
         return f"{size:.1f} TB"
         
+    def search_files(self, query, path='/', names_only=False):
+        """Show full-text search results"""
+        results = self.os_app.db.search(query, path, 50, names_only)
+        if not results:
+            self.text_area.insert(tk.END, f"\nNo matches for '{query}'")
+            return
+            
+        for result in results:
+            full_path = join_path(result['path'], result['name'])
+            if names_only or not result['snippet']:
+                self.text_area.insert(tk.END, f"\n{full_path}")
+            else:
+                self.text_area.insert(tk.END, f"\n{full_path}: {result['snippet']}")
+                
     def show_cli_help(self):
         """Show CLI help in terminal"""
         help_text = """
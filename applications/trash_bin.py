@@ -2,11 +2,18 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime
+from itertools import islice
 
 class TrashBin:
+    # Rows fetched per page; more are loaded when the list is scrolled down
+    PAGE_SIZE = 200
+    
     def __init__(self, parent, os_app):
         self.os_app = os_app
         self.parent = parent
+        self.trash_pages = iter(())
+        self.has_more = False
+        self.page_pending = False
         
         # Create window
         self.window = tk.Toplevel(parent)
@@ -106,7 +113,8 @@ class TrashBin:
             
         # Scrollbar
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.scrollbar = scrollbar
+        self.tree.configure(yscrollcommand=self.on_scroll)
         
         # Pack treeview
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -129,13 +137,26 @@ class TrashBin:
         self.update_status()
         
     def load_trash_items(self):
-        """Load trash items from database"""
+        """Load the first page of trash items from database"""
         # Clear tree
         for item in self.tree.get_children():
             self.tree.delete(item)
             
-        # Get trash items
-        items = self.os_app.db.get_trash_items(self.os_app.current_user)
+        # Keyset-paged iterator; each page resumes after the last row shown
+        self.trash_pages = self.os_app.db.iter_trash_items(
+            self.os_app.current_user, page_size=self.PAGE_SIZE
+        )
+        self.has_more = True
+        self.load_more_items()
+        
+    def load_more_items(self):
+        """Append the next page of trash items"""
+        self.page_pending = False
+        if not self.has_more:
+            return
+            
+        items = list(islice(self.trash_pages, self.PAGE_SIZE))
+        self.has_more = len(items) == self.PAGE_SIZE
         
         # Add to tree
         for item in items:
@@ -156,9 +177,20 @@ class TrashBin:
                 tags=(item['id'],)
             )
             
+        # Keep new rows consistent with an active search
+        if self.search_var.get():
+            self.filter_items()
+            
         # Update status
         self.update_status()
         
+    def on_scroll(self, first, last):
+        """Track the scrollbar and fetch the next page at the bottom"""
+        self.scrollbar.set(first, last)
+        if self.has_more and not self.page_pending and float(last) >= 1.0:
+            self.page_pending = True
+            self.window.after_idle(self.load_more_items)
+            
     def format_size(self, size):
         """Format file size"""
         for unit in ['B', 'KB', 'MB', 'GB']:
@@ -223,17 +255,22 @@ class TrashBin:
         if not confirm:
             return
             
+        # Names for the rename report, read before the list is refreshed
+        names = {}
+        for item in self.tree.selection():
+            tags = self.tree.item(item, 'tags')
+            if tags:
+                names[int(tags[0])] = self.tree.item(item)['values'][0]
+                
         restored_count = 0
         renamed_items = []
         
-        for trash_id in selected_ids:
-            success, new_name = self.os_app.db.restore_from_trash(trash_id)
+        # Restore the whole selection in a single transaction
+        for trash_id, success, new_name in self.os_app.db.restore_many(selected_ids):
             if success:
                 restored_count += 1
                 if new_name:
-                    item = self.tree.item(self.tree.selection()[0])
-                    original_name = item['values'][0]
-                    renamed_items.append(f"{original_name} → {new_name}")
+                    renamed_items.append(f"{names.get(trash_id, trash_id)} → {new_name}")
                     
         # Refresh list
         self.load_trash_items()
@@ -264,15 +301,9 @@ class TrashBin:
             return
             
         try:
-            # Delete from trash table
-            placeholders = ','.join('?' * len(selected_ids))
-            self.os_app.db.cursor.execute(
-                f'DELETE FROM trash WHERE id IN ({placeholders})',
-                selected_ids
-            )
-            
-            deleted_count = self.os_app.db.cursor.rowcount
-            self.os_app.db.connection.commit()
+            # Delete from trash table in a single transaction
+            results = self.os_app.db.purge_many(selected_ids)
+            deleted_count = sum(1 for _, deleted in results if deleted)
             
             # Refresh list
             self.load_trash_items()
@@ -320,8 +351,10 @@ class TrashBin:
             
     def update_status(self):
         """Update status bar with trash info"""
-        trash_count = len(self.tree.get_children())
-        trash_size = self.os_app.db.get_trash_size(self.os_app.current_user)
+        # Totals for the whole trash, not just the pages loaded so far
+        stats = self.os_app.db.get_trash_stats(self.os_app.current_user)
+        trash_count = stats['entries']
+        trash_size = stats['total_size']
         
         self.status_bar.config(
             text=f"Items: {trash_count} | "
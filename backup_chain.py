@@ -0,0 +1,206 @@
+# backup_chain.py - Incremental page-level database backups
+import os
+import json
+import hashlib
+import sqlite3
+from datetime import datetime
+from parallel_gzip import ParallelGzipReader, ParallelGzipWriter
+
+class BackupChain:
+    """A base backup followed by page-level deltas, kept in one directory
+
+    Entry NNNNNN.pages holds the gzipped database pages that changed since
+    the previous entry, in page order, and NNNNNN.json (the manifest) says
+    which pages they are. A base entry holds every page. NNNNNN.hashes
+    keeps the page hashes of the newest entry, which is all the next delta
+    needs, so a backup only writes what changed.
+    """
+
+    # blake2b digest bytes per page hash
+    HASH_SIZE = 16
+
+    # Pages copied per read/write while backing up or restoring
+    COPY_BATCH = 256
+
+    def __init__(self, directory, threads=None):
+        self.directory = directory
+        self.threads = threads
+
+    def path(self, sequence, suffix):
+        """File of an entry ('.json', '.pages' or '.hashes')"""
+        return os.path.join(self.directory, f"{sequence:06d}{suffix}")
+
+    def entries(self):
+        """Manifests of every entry, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+
+        manifests = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.directory, name)) as f:
+                    manifests.append(json.load(f))
+        return manifests
+
+    def load_hashes(self, manifest):
+        """Page hashes stored for an entry, or None if they are gone"""
+        try:
+            with open(self.path(manifest['sequence'], '.hashes'), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        return [data[start:start + self.HASH_SIZE] for start in range(0, len(data), self.HASH_SIZE)]
+
+    def append(self, image_path, page_size, full=False):
+        """Add an entry for a database image file and return its manifest
+
+        Only pages whose hash differs from the previous entry are stored.
+        A base is written instead for the first entry, when full is set, or
+        when the previous entry cannot be diffed against (its hashes are
+        missing or the page size changed). The image is read once, COPY_BATCH
+        pages at a time, each changed page going straight to the compressor.
+        """
+        entries = self.entries()
+        previous = None
+        if entries and not full and entries[-1]['page_size'] == page_size:
+            previous = self.load_hashes(entries[-1])
+
+        sequence = entries[-1]['sequence'] + 1 if entries else 0
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Pages first and the manifest last: an entry only exists once its
+        # manifest does
+        pages_path = self.path(sequence, '.pages')
+        hashes = []
+        changed = []
+        image_hash = hashlib.sha256()
+        with open(image_path, 'rb') as f_in, \
+                ParallelGzipWriter(pages_path + '.tmp', self.threads) as f_out:
+            for block in iter(lambda: f_in.read(self.COPY_BATCH * page_size), b''):
+                image_hash.update(block)
+                block = memoryview(block)
+                for start in range(0, len(block), page_size):
+                    page = block[start:start + page_size]
+                    digest = hashlib.blake2b(page, digest_size=self.HASH_SIZE).digest()
+                    number = len(hashes)
+                    hashes.append(digest)
+                    if previous is None or number >= len(previous) or previous[number] != digest:
+                        changed.append(number)
+                        f_out.write(page)
+        os.replace(pages_path + '.tmp', pages_path)
+
+        with open(self.path(sequence, '.hashes'), 'wb') as f:
+            f.write(b''.join(hashes))
+
+        manifest = {
+            'sequence': sequence,
+            'base': previous is None,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'page_size': page_size,
+            'page_count': len(hashes),
+            'changed_pages': len(changed),
+            'ranges': self.to_ranges(changed),
+            'stored_bytes': os.path.getsize(pages_path),
+            'sha256': image_hash.hexdigest(),
+        }
+        manifest_path = self.path(sequence, '.json')
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+        # Older hashes are never diffed against again
+        if entries and os.path.exists(self.path(entries[-1]['sequence'], '.hashes')):
+            os.remove(self.path(entries[-1]['sequence'], '.hashes'))
+        return manifest
+
+    def chain_to(self, sequence=None):
+        """Entries to apply, base first, to rebuild an entry (default newest)"""
+        entries = self.entries()
+        if not entries:
+            raise ValueError(f"No backups in '{self.directory}'")
+        if sequence is None:
+            sequence = entries[-1]['sequence']
+
+        by_sequence = {entry['sequence']: entry for entry in entries}
+        if sequence not in by_sequence:
+            raise ValueError(f"Backup {sequence} not found in '{self.directory}'")
+
+        chain = []
+        current = sequence
+        while True:
+            entry = by_sequence.get(current)
+            if entry is None:
+                raise ValueError(f"Backup chain is broken: entry {current} is missing")
+            chain.append(entry)
+            if entry['base']:
+                break
+            current -= 1
+        chain.reverse()
+        return chain
+
+    def restore(self, target_path, sequence=None, progress=None):
+        """Rebuild an entry into target_path and return its manifest
+
+        Streams the base and then each delta into a temporary file, checks
+        it against the manifest's sha256 and integrity_check, and only then
+        moves it over target_path. progress(applied, total) counts entries.
+        """
+        chain = self.chain_to(sequence)
+        manifest = chain[-1]
+        temp_path = target_path + '.tmp'
+
+        try:
+            with open(temp_path, 'wb') as f_out:
+                for applied, entry in enumerate(chain, 1):
+                    self.apply(entry, f_out)
+                    if progress:
+                        progress(applied, len(chain))
+
+            digest = hashlib.sha256()
+            with open(temp_path, 'rb') as f_in:
+                for block in iter(lambda: f_in.read(1 << 20), b''):
+                    digest.update(block)
+            if digest.hexdigest() != manifest['sha256']:
+                raise ValueError(f"Backup {manifest['sequence']} failed its checksum")
+
+            check = sqlite3.connect(temp_path)
+            try:
+                result = check.execute('PRAGMA integrity_check').fetchone()[0]
+            finally:
+                check.close()
+            if result != 'ok':
+                raise sqlite3.DatabaseError(f"Restored database failed integrity check: {result}")
+
+            os.replace(temp_path, target_path)
+            return manifest
+
+        except BaseException:
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                if os.path.exists(temp_path + suffix):
+                    os.remove(temp_path + suffix)
+            raise
+
+    def apply(self, entry, f_out):
+        """Write an entry's pages into an open database image file"""
+        page_size = entry['page_size']
+        with ParallelGzipReader(self.path(entry['sequence'], '.pages'), self.threads) as f_in:
+            for first, count in entry['ranges']:
+                f_out.seek(first * page_size)
+                for start in range(0, count, self.COPY_BATCH):
+                    size = min(self.COPY_BATCH, count - start) * page_size
+                    block = f_in.read(size)
+                    if len(block) != size:
+                        raise ValueError(f"Backup {entry['sequence']} is truncated")
+                    f_out.write(block)
+        f_out.truncate(entry['page_count'] * page_size)
+
+    @staticmethod
+    def to_ranges(numbers):
+        """Sorted page numbers as [first, count] runs"""
+        ranges = []
+        for number in numbers:
+            if ranges and ranges[-1][0] + ranges[-1][1] == number:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([number, 1])
+        return ranges
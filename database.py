@@ -4,19 +4,1513 @@ import json
 from datetime import datetime
 import os
 import hashlib
+import threading
+import time
+import calendar
+import queue
+import atexit
+import zlib
+import base64
+import posixpath
+import itertools
+import re
+import urllib.parse
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from parallel_gzip import ParallelGzipWriter
+from host_tree import DEFAULT_THREADS, TreeEntry, prefetch
+
+# Schema version stored in PRAGMA user_version
+SCHEMA_VERSION = 10
+
+# Indexes backing the hot lookups in database.py, os_cli.py and trash_bin.py
+SCHEMA_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_filesystem_path_name ON filesystem (path, name)',
+    'CREATE INDEX IF NOT EXISTS idx_trash_deleted_by ON trash (deleted_by, deleted_at)',
+    'CREATE INDEX IF NOT EXISTS idx_trash_deleted_at ON trash (deleted_at)',
+    'CREATE INDEX IF NOT EXISTS idx_trash_expires_at ON trash (expires_at)',
+    'CREATE INDEX IF NOT EXISTS idx_system_log_timestamp ON system_log (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_system_log_event ON system_log (event_type, timestamp)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_settings_user_key ON settings (user_id, setting_key)',
+    # NULLs are distinct in a unique index, so system settings need their own
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_settings_system_key ON settings (setting_key) WHERE user_id IS NULL',
+]
+
+# Indexes on columns added by later migrations
+TRASH_GROUP_INDEX = 'CREATE INDEX IF NOT EXISTS idx_trash_group ON trash (group_id)'
+FILESYSTEM_PARENT_INDEX = 'CREATE INDEX IF NOT EXISTS idx_filesystem_parent ON filesystem (parent_id, name)'
+TRASH_TYPE_INDEX = 'CREATE INDEX IF NOT EXISTS idx_trash_user_type ON trash (deleted_by, type, deleted_at)'
+INSTALLED_APPS_NAME_INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS idx_installed_apps_name ON installed_apps (name)'
+
+# Ids of every entry below the directory whose id is bound to the
+# placeholder, walked through the parent_id index; use as "id IN (...)"
+SUBTREE_IDS = '''
+    WITH RECURSIVE subtree(id) AS (
+        SELECT id FROM filesystem WHERE parent_id = ?
+        UNION ALL
+        SELECT filesystem.id FROM filesystem
+        JOIN subtree ON filesystem.parent_id = subtree.id
+    )
+    SELECT id FROM subtree
+'''
+
+# Ids of an entry and all of its ancestors, innermost first
+ANCESTOR_IDS = '''
+    WITH RECURSIVE ancestors(id) AS (
+        SELECT ?
+        UNION ALL
+        SELECT filesystem.parent_id FROM filesystem
+        JOIN ancestors ON filesystem.id = ancestors.id
+        WHERE filesystem.parent_id IS NOT NULL
+    )
+    SELECT id FROM ancestors
+'''
+
+# Indexes existing filesystem rows for full-text search, as the
+# filesystem_fts_insert trigger would; append a WHERE to pick the rows
+FILESYSTEM_FTS_FILL = '''
+    INSERT INTO filesystem_fts (rowid, name, body)
+    SELECT filesystem.id, filesystem.name,
+           vfs_text(blobs.data, blobs.compressed, filesystem.content)
+    FROM filesystem LEFT JOIN blobs ON blobs.hash = filesystem.blob_hash
+'''
+
+# A system_log row as one JSON line, built by SQLite; event_data is already
+# JSON text (log_event() stores json.dumps output) and is embedded as is
+LOG_JSON_LINE = '''json_object(
+    'id', id, 'timestamp', timestamp, 'event_type', event_type, 'severity', severity,
+    'data', CASE WHEN json_valid(event_data) THEN json(event_data) ELSE event_data END
+) AS line'''
+
+# A trash root is inserted before its group_id is set (children with it),
+# imported roots already carry group_id = id; either marks a top-level entry
+TRASH_STATS_INSERT_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS trash_stats_insert
+    AFTER INSERT ON trash
+    BEGIN
+        INSERT INTO trash_stats
+        (deleted_by, type, entry_count, item_count, total_size, oldest, newest)
+        VALUES (IFNULL(NEW.deleted_by, ''), NEW.type,
+                NEW.group_id IS NULL OR NEW.group_id = NEW.id, 1,
+                IFNULL(NEW.size, 0), NEW.deleted_at, NEW.deleted_at)
+        ON CONFLICT (deleted_by, type) DO UPDATE SET
+            entry_count = entry_count + excluded.entry_count,
+            item_count = item_count + 1,
+            total_size = total_size + excluded.total_size,
+            oldest = IFNULL(min(oldest, excluded.oldest), excluded.oldest),
+            newest = IFNULL(max(newest, excluded.newest), excluded.newest);
+    END
+'''
+
+# Tables whose row count is kept in row_counts by triggers
+COUNTED_TABLES = ('users', 'filesystem', 'trash', 'system_log',
+                  'settings', 'installed_apps', 'sessions')
+
+# Tables with fewer rows than this may be scanned by hot queries
+TINY_TABLE_ROWS = 100
+
+# Queries on the hot path; none of them may fall back to a full table scan
+HOT_QUERIES = {
+    'filesystem.lookup': 'SELECT id FROM filesystem WHERE path = ? AND name = ? AND type = ?',
+    'filesystem.list': '''
+        SELECT name, type, size, modified_at, owner, permissions
+        FROM filesystem WHERE path = ? ORDER BY type DESC, name
+    ''',
+    'filesystem.children': '''
+        SELECT id, name, type, size, modified_at, owner, permissions
+        FROM filesystem WHERE parent_id = ? ORDER BY type DESC, name
+    ''',
+    'filesystem.subtree': SUBTREE_IDS,
+    'trash.items': '''
+        SELECT id, name, type, original_path, size, deleted_by, deleted_at, expires_at
+        FROM trash WHERE (group_id IS NULL OR group_id = id)
+        ORDER BY deleted_at DESC LIMIT ?
+    ''',
+    'trash.items_by_user': '''
+        SELECT id, name, type, original_path, size, deleted_by, deleted_at, expires_at
+        FROM trash WHERE (group_id IS NULL OR group_id = id) AND deleted_by = ?
+        ORDER BY deleted_at DESC LIMIT ?
+    ''',
+    'trash.group': 'SELECT id FROM trash WHERE group_id = ?',
+    'trash.size_by_user': 'SELECT SUM(size) FROM trash WHERE deleted_by = ?',
+    'trash.expired': "SELECT id FROM trash WHERE expires_at < datetime('now')",
+    'trash.by_id': 'SELECT * FROM trash WHERE id = ?',
+    'settings.system': '''
+        SELECT setting_value FROM settings
+        WHERE user_id IS NULL AND setting_key = ?
+    ''',
+    'settings.user': '''
+        SELECT setting_value FROM settings
+        WHERE user_id = ? AND setting_key = ?
+    ''',
+    'system_log.last': '''
+        SELECT event_type, timestamp FROM system_log
+        ORDER BY timestamp DESC LIMIT 1
+    ''',
+    'system_log.window': '''
+        SELECT id, event_type, event_data, timestamp FROM system_log
+        ORDER BY timestamp LIMIT ?
+    ''',
+    'system_log.by_event': '''
+        SELECT id, event_type, event_data, timestamp FROM system_log
+        WHERE event_type = ? ORDER BY timestamp DESC LIMIT ?
+    ''',
+    'system_log.follow': '''
+        SELECT id, event_type, event_data, severity, timestamp FROM system_log
+        WHERE id > ? AND id <= ? ORDER BY id LIMIT ?
+    ''',
+    'users.by_name': 'SELECT id FROM users WHERE username = ?',
+    'trash_stats.by_user': '''
+        SELECT type, entry_count, item_count, total_size, oldest, newest
+        FROM trash_stats WHERE deleted_by = ?
+    ''',
+    'row_counts.table': 'SELECT row_count FROM row_counts WHERE table_name = ?',
+}
+
+def join_path(path, name):
+    """Full virtual path of an entry named name inside directory path"""
+    return f"{path.rstrip('/')}/{name}"
+
+def normalize_path(full_path):
+    """Canonical absolute form of a virtual path ('/a//b/' -> '/a/b')"""
+    return posixpath.normpath('/' + full_path.strip('/'))
+
+def split_path(full_path):
+    """Split a virtual path into (parent path, name); '/' has no name"""
+    full_path = normalize_path(full_path)
+    if full_path == '/':
+        return '/', ''
+    return posixpath.dirname(full_path), posixpath.basename(full_path)
+
+def chunked(items, size):
+    """Yield successive lists of at most size items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def parse_id_list(text):
+    """Parse "5", "1,2,7" or "3-9,12" into a list of integer ids"""
+    ids = []
+    for part in str(text).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            low, high = (int(bound) for bound in part.split('-', 1))
+            if high < low:
+                raise ValueError(f"invalid range: {part}")
+            ids.extend(range(low, high + 1))
+        else:
+            ids.append(int(part))
+    if not ids:
+        raise ValueError(f"no ids in: {text!r}")
+    return ids
+
+# Characters of a file body indexed for full-text search
+FTS_BODY_LIMIT = 1024 * 1024
+
+def vfs_text(data, compressed, content):
+    """SQL function: searchable text of a file from its blob or inline content
+
+    Registered on every pool connection; the filesystem_fts triggers call
+    it so compressed blobs are indexed as their plain text.
+    """
+    if data is None:
+        return content[:FTS_BODY_LIMIT] if content else None
+    data = bytes(data)
+    if compressed:
+        data = zlib.decompress(data)
+    # Binary files are found by name only
+    if b'\0' in data[:1024]:
+        return None
+    return data[:FTS_BODY_LIMIT].decode('utf-8', 'ignore')
+
+def vfs_body(data, compressed, content):
+    """File body as bytes from its blob or inline content (None if neither)"""
+    if data is None:
+        return content.encode('utf-8') if content is not None else None
+    data = bytes(data)
+    return zlib.decompress(data) if compressed else data
+
+def vfs_export_text(data, compressed, content):
+    """SQL function: a file body as text, or None if it is not UTF-8"""
+    body = vfs_body(data, compressed, content)
+    try:
+        return body.decode('utf-8') if body is not None else None
+    except UnicodeDecodeError:
+        return None
+
+def vfs_export_base64(data, compressed, content):
+    """SQL function: a file body as base64 when it is not UTF-8 text"""
+    body = vfs_body(data, compressed, content)
+    try:
+        body.decode('utf-8')
+        return None
+    except AttributeError:
+        return None
+    except UnicodeDecodeError:
+        return base64.b64encode(body).decode('ascii')
+
+def tree_body(data, compressed, content):
+    """File body as bytes for a tree export (b'' for an empty file)"""
+    body = vfs_body(data, compressed, content)
+    return body if body is not None else b''
+
+def pack_blob(content, threshold, blob_hash=None):
+    """Row for the blobs table: (hash, data, compressed, size)
+
+    Only hashing and zlib, which release the GIL, so bulk imports run it
+    on a thread pool.
+    """
+    blob_hash = blob_hash or hashlib.sha256(content).hexdigest()
+    data, compressed = content, 0
+    if len(content) >= threshold:
+        packed = zlib.compress(content, 6)
+        if len(packed) < len(content):
+            data, compressed = packed, 1
+    return blob_hash, data, compressed, len(content)
+
+def timestamp_text(seconds):
+    """Epoch seconds as a UTC timestamp in CURRENT_TIMESTAMP's format"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(int(seconds)))
+
+def timestamp_seconds(text):
+    """Inverse of timestamp_text(); 0 for a missing or unreadable value"""
+    try:
+        return calendar.timegm(time.strptime(text[:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S'))
+    except (TypeError, ValueError):
+        return 0
+
+def fts_terms(text):
+    """Words of text as FTS5 tokens split them (underscores separate too)"""
+    return re.findall(r'[^\W_]+', text)
+
+def find_query_plan_scans(cursor, queries=None):
+    """Return (name, detail) for every hot query that scans a whole table"""
+    # Once ANALYZE has run, the planner rightly scans a table sqlite_stat1
+    # says is tiny rather than use its index
+    try:
+        cursor.execute('''
+            SELECT tbl FROM sqlite_stat1 GROUP BY tbl
+            HAVING MAX(CAST(stat AS INTEGER)) < ?
+        ''', (TINY_TABLE_ROWS,))
+        tiny = {row[0] for row in cursor.fetchall()}
+    except sqlite3.OperationalError:
+        tiny = set()
+
+    scans = []
+    for name, query in (queries or HOT_QUERIES).items():
+        params = [None] * query.count('?')
+        # Reading a recursive CTE's own work queue is not a table scan
+        ctes = set(re.findall(r'(\w+)\([\w, ]*\)\s+AS\s+\(', query))
+        cursor.execute(f'EXPLAIN QUERY PLAN {query}', params)
+        for row in cursor.fetchall():
+            detail = row[-1]
+            # "SCAN t USING INDEX ..." walks an index in order and is fine
+            if (detail.startswith('SCAN ') and ' USING ' not in detail
+                    and detail.split()[1] not in ctes | tiny):
+                scans.append((name, detail))
+    return scans
+
+class UnitOfWorkConnection(sqlite3.Connection):
+    """Connection whose commit() and rollback() respect DatabaseManager.transaction()
+
+    While a transaction() scope is open, commit() is deferred to the
+    outermost scope and rollback() only undoes the innermost savepoint,
+    so methods that commit on their own can be composed into one unit.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.savepoints = 0
+
+        # Counters
+        self.commits = 0
+        self.deferred_commits = 0
+
+    def commit(self):
+        if self.savepoints:
+            self.deferred_commits += 1
+            return
+        if self.in_transaction:
+            self.commits += 1
+        super().commit()
+
+    def rollback(self):
+        if self.savepoints:
+            self.execute(f'ROLLBACK TO uow_{self.savepoints}')
+            return
+        super().rollback()
+
+class ConnectionPool:
+    """Hands out one WAL-mode SQLite connection per thread"""
+
+    # Seconds a connection waits on a locked database before giving up
+    BUSY_TIMEOUT = 10.0
+
+    # Prepared statements kept per connection; a pos shell or batch runs
+    # far more distinct queries on one connection than the default 128
+    STATEMENT_CACHE = 512
+
+    def __init__(self, db_path, timeout=BUSY_TIMEOUT):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def open(self, read_only=False):
+        """Open a new connection configured for concurrent use
+
+        A read_only connection cannot write even by accident; callers
+        doing long parallel reads open these themselves, outside the pool.
+        """
+        database = self.db_path
+        if read_only:
+            database = f'file:{urllib.parse.quote(os.path.abspath(self.db_path))}?mode=ro'
+
+        # Ownership is per thread, but close_all() runs on whichever
+        # thread shuts the pool down
+        connection = sqlite3.connect(
+            database,
+            timeout=self.timeout,
+            check_same_thread=False,
+            factory=UnitOfWorkConnection,
+            cached_statements=self.STATEMENT_CACHE,
+            uri=read_only
+        )
+        connection.row_factory = sqlite3.Row  # Return rows as dictionaries
+
+        # WAL lets readers run while one writer is active; NORMAL sync
+        # is durable across application crashes in WAL mode. Free pages
+        # are handed back by incremental_vacuum, which only works if the
+        # mode is set before the file's first table (existing files need
+        # one full VACUUM; see DatabaseManager.maintain_vacuum)
+        if not read_only:
+            connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+
+        # Used by the full-text index triggers on filesystem and by exports
+        connection.create_function('vfs_text', 3, vfs_text, deterministic=True)
+        connection.create_function('vfs_export_text', 3, vfs_export_text, deterministic=True)
+        connection.create_function('vfs_export_base64', 3, vfs_export_base64, deterministic=True)
+        return connection
+
+    def get(self):
+        """Get the calling thread's connection, opening it on first use"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.open()
+            self.local.connection = connection
+            self.local.cursor = connection.cursor()
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def cursor(self):
+        """Get the calling thread's cursor"""
+        self.get()
+        return self.local.cursor
+
+    def release(self):
+        """Close the calling thread's connection (for worker threads)"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            return
+        self.local.connection = None
+        self.local.cursor = None
+        with self.lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+        connection.close()
+
+    def close_all(self):
+        """Close every connection handed out by this pool"""
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+        self.local = threading.local()
+
+class EventLogger:
+    """Writes system_log events from a background thread in batches"""
+
+    def __init__(self, pool, max_queue=10000, batch_size=500,
+                 flush_interval=0.5, policy='drop'):
+        self.pool = pool
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # 'drop' discards events when the queue is full, 'block' waits
+        # up to block_timeout seconds for room before discarding
+        self.policy = policy
+        self.block_timeout = 0.1
+        self.thread = None
+        self.lock = threading.Lock()
+        # Set by stop(); the writer drains the queue and exits. A stop flag
+        # rather than a queued sentinel, so stopping never waits for room
+        self.stopping = threading.Event()
+
+        # Counters
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def start(self):
+        """Start the writer thread if it is not running"""
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(
+                target=self.run,
+                name='EventLogger',
+                daemon=True
+            )
+            self.thread.start()
+        atexit.register(self.stop)
+
+    def log(self, event_type, event_data=None, severity='info'):
+        """Queue an event; returns False if it had to be dropped"""
+        if event_data is not None and not isinstance(event_data, str):
+            event_data = json.dumps(event_data, default=str)
+
+        # Stamp at queue time, in the same format as CURRENT_TIMESTAMP
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        record = (event_type, event_data, severity, timestamp)
+
+        self.start()
+        try:
+            if self.policy == 'block':
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+
+        with self.lock:
+            self.queued += 1
+        return True
+
+    def run(self):
+        """Drain the queue into system_log until stopped and empty"""
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    break
+                continue
+
+            batch = []
+            waiters = []
+            while True:
+                # None only wakes the writer up for stop()
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item is not None:
+                    batch.append(item)
+
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self.write_batch(batch)
+            for waiter in waiters:
+                waiter.set()
+            if self.stopping.is_set() and self.queue.empty():
+                break
+
+        self.pool.release()
+
+    def write_batch(self, batch):
+        """Insert one batch of events in a single transaction"""
+        connection = self.pool.get()
+        try:
+            connection.executemany('''
+                INSERT INTO system_log (event_type, event_data, severity, timestamp)
+                VALUES (?, ?, ?, ?)
+            ''', batch)
+            connection.commit()
+            with self.lock:
+                self.flushed += len(batch)
+                self.batches += 1
+        except Exception as e:
+            print(f"Error writing system log: {e}")
+            connection.rollback()
+            with self.lock:
+                self.dropped += len(batch)
+
+    def flush(self, timeout=5.0):
+        """Block until every event queued so far has been written
+        
+        Gives up after timeout seconds, including time spent waiting for
+        room in a full queue; returns whether everything was written.
+        """
+        if not self.thread or not self.thread.is_alive():
+            return True
+        deadline = time.monotonic() + timeout
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(max(0.0, deadline - time.monotonic()))
+
+    def drain(self):
+        """Write every queued event on the calling thread's connection
+        
+        Used inside a transaction(), where waiting on the writer thread
+        could block on the lock the caller holds.
+        """
+        batch = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not None:
+                batch.append(item)
+
+        for start in range(0, len(batch), self.batch_size):
+            self.write_batch(batch[start:start + self.batch_size])
+        return True
+
+    def stop(self, timeout=5.0):
+        """Flush remaining events and stop the writer thread
+        
+        Waits at most timeout seconds, even when the queue is full.
+        """
+        if not self.thread or not self.thread.is_alive():
+            return
+        self.stopping.set()
+        try:
+            # Wake the writer now rather than at its next poll; a full
+            # queue means it has work and will see the flag anyway
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+
+    def stats(self):
+        """Get logger counters"""
+        with self.lock:
+            return {
+                'queued': self.queued,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'batches': self.batches,
+                'pending': self.queue.qsize(),
+            }
+
+class DirectoryCache:
+    """LRU cache of directory listings keyed by full directory path"""
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, path):
+        """Get the cached listing of path, or None on a miss"""
+        path = normalize_path(path)
+        with self.lock:
+            listing = self.entries.get(path)
+            if listing is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return listing
+
+    def put(self, path, listing):
+        """Cache a listing, evicting the least recently used directory"""
+        path = normalize_path(path)
+        with self.lock:
+            self.entries[path] = listing
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, *paths):
+        """Drop the listings of the given directories"""
+        with self.lock:
+            for path in paths:
+                if self.entries.pop(normalize_path(path), None) is not None:
+                    self.invalidations += 1
+
+    def invalidate_tree(self, path):
+        """Drop the listings of path and every directory below it"""
+        path = normalize_path(path)
+        prefix = path.rstrip('/') + '/'
+        with self.lock:
+            for cached in [cached for cached in self.entries
+                           if cached == path or cached.startswith(prefix)]:
+                del self.entries[cached]
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every cached listing"""
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+    def stats(self):
+        """Get cache counters"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'entries': len(self.entries),
+                'capacity': self.capacity,
+            }
+
+class DataVersionWatch:
+    """Tells a cache whether other connections changed the database
+
+    PRAGMA data_version only counts commits made by other connections and
+    is only comparable with earlier values from the same connection, so
+    the value last seen is kept per connection (weakly: closed connections
+    drop out). A connection is polled at most once per interval.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.seen = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    def mark(self, connection):
+        """Record that the cache now matches what connection sees"""
+        version = connection.execute('PRAGMA data_version').fetchone()[0]
+        with self.lock:
+            self.seen[connection] = (version, time.monotonic())
+
+    def changed(self, connection):
+        """Whether the cache may be stale as seen from connection
+
+        True on a connection's first check (nothing it saw vouches for the
+        cache) and whenever its data_version moved since it last looked.
+        """
+        now = time.monotonic()
+        with self.lock:
+            seen = self.seen.get(connection)
+        if seen is not None and now - seen[1] < self.interval:
+            return False
+
+        version = connection.execute('PRAGMA data_version').fetchone()[0]
+        with self.lock:
+            self.seen[connection] = (version, now)
+        return seen is None or seen[0] != version
+
+class TrashSweeper:
+    """Applies the trash retention policy from a background thread
+
+    Every interval seconds (or sooner after wake()) it deletes expired
+    trash and evicts over-quota trash, in small batches with a pause
+    between them, so no single write transaction holds the lock for long.
+    """
+
+    def __init__(self, db, pause=0.05):
+        self.db = db
+        self.pause = pause
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+        # Counters
+        self.sweeps = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def start(self):
+        """Start the sweeper thread if it is not running"""
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(
+                target=self.run,
+                name='TrashSweeper',
+                daemon=True
+            )
+            self.thread.start()
+        atexit.register(self.stop)
+
+    def wake(self):
+        """Run a sweep as soon as possible"""
+        self.wakeup.set()
+
+    def run(self):
+        """Sweep on every interval until stopped"""
+        try:
+            while not self.stopping.is_set():
+                self.sweep()
+                self.wakeup.wait(self.db.retention_setting('trash_sweep_interval'))
+                self.wakeup.clear()
+        finally:
+            self.db.pool.release()
+
+    def sweep(self):
+        """One pass: expired items first, then per-user quotas"""
+        try:
+            expired = self.db.sweep_expired_trash(pause=self.pause, stop=self.stopping)
+            evicted = self.db.enforce_trash_quotas(pause=self.pause, stop=self.stopping)
+        except sqlite3.Error as e:
+            print(f"Error sweeping trash: {e}")
+            return
+
+        with self.lock:
+            self.sweeps += 1
+            self.expired += expired
+            self.evicted += evicted
+
+    def stop(self, timeout=5.0):
+        """Stop the sweeper thread after its current batch"""
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def stats(self):
+        """Get sweeper counters"""
+        with self.lock:
+            return {
+                'sweeps': self.sweeps,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
+
+class DatabaseMaintainer:
+    """Runs planned database maintenance while the user is idle
+
+    The GUI calls touch() on every input event. Once there has been none
+    for idle_after seconds, the thread works through plan_maintenance()
+    one task at a time. Each statement that holds the database is
+    time-boxed to budget seconds, and input interrupts whatever is
+    running, so the UI never waits on maintenance for more than a few
+    milliseconds.
+    """
+
+    def __init__(self, db, idle_after=60.0, interval=600.0, budget=0.005, pause=0.05):
+        self.db = db
+        self.idle_after = idle_after
+        self.interval = interval
+        self.budget = budget
+        self.pause = pause
+        self.last_input = time.monotonic()
+        self.activity = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+        # Counters
+        self.passes = 0
+        self.finished = 0
+        self.interrupted = 0
+
+    def start(self):
+        """Start the maintenance thread if it is not running"""
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(
+                target=self.run,
+                name='DatabaseMaintainer',
+                daemon=True
+            )
+            self.thread.start()
+        atexit.register(self.stop)
+
+    def touch(self, event=None):
+        """Note user input; interrupts the running task (a Tk event handler)"""
+        self.last_input = time.monotonic()
+        self.activity.set()
+
+    def run(self):
+        """Maintain whenever the user has been idle long enough, until stopped"""
+        try:
+            while not self.stopping.is_set():
+                idle = time.monotonic() - self.last_input
+                if idle < self.idle_after:
+                    self.stopping.wait(self.idle_after - idle)
+                    continue
+                self.activity.clear()
+                self.maintain()
+                # Interrupted passes resume at the next idle spell
+                if not self.activity.is_set():
+                    self.stopping.wait(self.interval)
+        finally:
+            self.db.pool.release()
+
+    def maintain(self):
+        """One pass over the current plan, skipping offline tasks"""
+        finished = interrupted = 0
+        for task, reason in self.db.plan_maintenance():
+            if task in self.db.OFFLINE_TASKS:
+                continue
+            if self.activity.is_set() or self.stopping.is_set():
+                break
+            try:
+                if self.db.run_maintenance(task, self.budget, self.pause, self.activity):
+                    finished += 1
+                else:
+                    interrupted += 1
+            except (sqlite3.Error, ValueError) as e:
+                print(f"Error during database maintenance ({task}): {e}")
+                self.db.log_event('maintenance_error', {'task': task, 'error': str(e)}, 'error')
+
+        with self.lock:
+            self.passes += 1
+            self.finished += finished
+            self.interrupted += interrupted
+
+    def stop(self, timeout=5.0):
+        """Stop the maintenance thread, interrupting its current task"""
+        self.stopping.set()
+        self.activity.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def stats(self):
+        """Get maintainer counters"""
+        with self.lock:
+            return {
+                'passes': self.passes,
+                'finished': self.finished,
+                'interrupted': self.interrupted,
+            }
 
 class DatabaseManager:
+    # Bound parameters per statement for chunked IN (...) lists
+    MAX_SQL_PARAMS = 900
+
+    # Blobs at least this many bytes are zlib-compressed when it helps
+    BLOB_COMPRESS_THRESHOLD = 1024
+
+    # Minimum seconds between PRAGMA data_version checks of the settings cache
+    SETTINGS_REFRESH_INTERVAL = 1.0
+
+    # Default rows per page for the iter_* keyset iterators
+    PAGE_SIZE = 500
+
+    # Directory listings kept by list_directory()
+    DENTRY_CACHE_SIZE = 256
+
+    # Minimum seconds between checks for VFS writes by other connections
+    DENTRY_REFRESH_INTERVAL = 1.0
+
+    # Trash retention policy; each can be overridden by the system setting
+    # of the same name (and trash_quota_mb per user as well)
+    RETENTION_DEFAULTS = {
+        'trash_retention_days': 30,     # days before trashed items expire
+        'trash_quota_mb': 0,            # trash bytes per user, 0 = unlimited
+        'trash_sweep_interval': 300,    # seconds between sweeps
+        'trash_sweep_batch': 500,       # rows deleted per transaction
+    }
+
+    # Tables pos export/import can move between systems
+    EXPORT_TABLES = ('system_log', 'filesystem', 'users', 'settings', 'trash')
+    
+    # Exportable tables init_database puts rows in (/home and /home/.trash);
+    # importing into them skips colliding rows unless told otherwise
+    SEEDED_TABLES = ('filesystem',)
+
+    # Rows per executemany() and per transaction when importing
+    IMPORT_CHUNK = 5000
+    IMPORT_BATCH = 100000
+    
+    # Files per transaction, and body bytes held before one, when loading
+    # a host tree into the virtual filesystem
+    TREE_BATCH = 5000
+    TREE_BATCH_BYTES = 64 * 1024 * 1024
+
+    # Points of a boot that boot_metrics times
+    BOOT_MILESTONES = ('login_seconds', 'desktop_seconds', 'desktop_load_seconds')
+
+    # Online backups copy this many pages per step, pausing between steps
+    # so other connections keep getting the lock
+    BACKUP_PAGES = 256
+    BACKUP_PAUSE = 0.005
+
+    # Index rows ANALYZE samples per index when refreshing planner
+    # statistics; row estimates stay within a few percent and the pass
+    # takes milliseconds on any size of database
+    ANALYZE_LIMIT = 1000
+
+    # sqlite_stat1 is stale once it is off from a row_counts counter by
+    # more than this factor
+    STATS_DRIFT = 2.0
+
+    # Maintenance tasks in the order plan_maintenance() schedules them;
+    # offline ones rewrite the whole file and only run when asked for
+    MAINTENANCE_TASKS = ('quick_check', 'analyze', 'optimize', 'incremental_vacuum',
+                         'checkpoint', 'vacuum')
+    OFFLINE_TASKS = ('vacuum',)
+
+    # Free pages are worth reclaiming once they are this fraction of the
+    # file and at least this many
+    FREELIST_RATIO = 0.1
+    FREELIST_MIN_PAGES = 256
+
+    # WAL size that calls for a checkpoint, and days between quick checks
+    WAL_CHECKPOINT_BYTES = 16 * 1024 * 1024
+    QUICK_CHECK_DAYS = 7
+
+    # Pages incremental_vacuum frees per time-boxed call to begin with,
+    # and at most
+    VACUUM_PAGES = 64
+    VACUUM_MAX_PAGES = 4096
+
+    # Virtual machine steps between deadline checks; incremental_vacuum
+    # frees a page per step, and a page can take a millisecond
+    PROGRESS_STEPS = 1000
+    VACUUM_PROGRESS_STEPS = 4
+
     def __init__(self, db_path='system.db'):
         self.db_path = db_path
-        self.connection = None
-        self.cursor = None
-        
+        self.pool = ConnectionPool(db_path)
+
+        # Settings cache keyed by (user_id, setting_key); None until loaded
+        self.settings_cache = None
+        self.pending_settings = {}
+        self.settings_lock = threading.Lock()
+        self.settings_watch = DataVersionWatch(self.SETTINGS_REFRESH_INTERVAL)
+
+        # Callable that defers flush_settings() (e.g. to Tk idle time);
+        # without one, set_setting() writes through immediately
+        self.settings_flush_scheduler = None
+
+        # Background writer for system_log
+        self.event_logger = EventLogger(self.pool)
+
+        # Directory listings; VFS writes here invalidate exactly the
+        # directories they touch, writes elsewhere clear it via data_version
+        self.dentry_cache = DirectoryCache(self.DENTRY_CACHE_SIZE)
+        self.dentry_watch = DataVersionWatch(self.DENTRY_REFRESH_INTERVAL)
+
+        # Background expiry/quota enforcement, started by the GUI
+        self.trash_sweeper = TrashSweeper(self)
+
+        # Idle-time maintenance, started by the GUI; quick_check resumes
+        # from the tables an interrupted pass did not reach
+        self.maintainer = DatabaseMaintainer(self)
+        self.quick_check_pending = []
+
+    @property
+    def connection(self):
+        """Connection owned by the calling thread"""
+        return self.pool.get()
+
+    @property
+    def cursor(self):
+        """Cursor owned by the calling thread"""
+        return self.pool.cursor()
+
     def connect(self):
         """Connect to SQLite database"""
-        self.connection = sqlite3.connect(self.db_path)
-        self.cursor = self.connection.cursor()
-        self.connection.row_factory = sqlite3.Row  # Return rows as dictionaries
-        return self.connection
+        # Idempotent: repeated calls reuse the calling thread's connection
+        return self.pool.get()
+
+    @contextmanager
+    def transaction(self):
+        """Run a block of writes as one unit of work
+        
+            with db.transaction():
+                db.set_system_info('setup_completed', 'true')
+                db.create_file('/home/admin', 'welcome.txt', text)
+        
+        Commits once when the outermost block exits and rolls back the whole
+        unit if it raises. Nested blocks are savepoints: an exception escaping
+        one undoes only that block. Methods called inside that commit are
+        deferred; their rollback() on error undoes the innermost block only.
+        """
+        connection = self.connection
+        if not connection.savepoints and not connection.in_transaction:
+            # Take the write lock up front rather than failing to upgrade
+            # a read snapshot later
+            connection.execute('BEGIN IMMEDIATE')
+        connection.savepoints += 1
+        name = f'uow_{connection.savepoints}'
+        connection.execute(f'SAVEPOINT {name}')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute(f'ROLLBACK TO {name}')
+            connection.execute(f'RELEASE {name}')
+            connection.savepoints -= 1
+            if not connection.savepoints:
+                connection.rollback()
+            # Listings may have been cached from rolled back rows
+            self.dentry_cache.clear()
+            raise
+        else:
+            connection.execute(f'RELEASE {name}')
+            connection.savepoints -= 1
+            if not connection.savepoints:
+                connection.commit()
+                
+    def table_columns(self, table):
+        """Column names of an exportable table, in schema order"""
+        if table not in self.EXPORT_TABLES:
+            raise ValueError(f"Table '{table}' cannot be exported or imported")
+        return [row['name'] for row in self.connection.execute(f'PRAGMA table_info({table})')]
+        
+    def export_columns(self, table):
+        """(name, SQL expression) pairs making up a table's portable form
+        
+        Blob-backed tables export each file body as content (UTF-8 text) or
+        content_base64 (anything else) instead of blob_hash, which means
+        nothing on another system.
+        """
+        names = self.table_columns(table)
+        columns = []
+        for name in names:
+            if name == 'blob_hash':
+                continue
+            if name == 'content' and 'blob_hash' in names:
+                body = 'b.data, b.compressed, t.content'
+                columns.append(('content', f'vfs_export_text({body})'))
+                columns.append(('content_base64', f'vfs_export_base64({body})'))
+            else:
+                columns.append((name, f't.{name}'))
+        return columns
+        
+    def export_rows(self, table, as_json=False):
+        """Stream a table in its portable form, in id order
+        
+        Returns (column names, row iterator). Rows come straight off one
+        cursor, so memory stays flat however large the table is. With
+        as_json every row is one JSON object string built by SQLite.
+        """
+        columns = self.export_columns(table)
+        if as_json:
+            select = 'json_object(' + ', '.join(f"'{name}', {expr}" for name, expr in columns) + ')'
+        else:
+            select = ', '.join(expr for name, expr in columns)
+            
+        query = f'SELECT {select} FROM {table} t'
+        if any(name == 'content_base64' for name, expr in columns):
+            query += ' LEFT JOIN blobs b ON b.hash = t.blob_hash'
+        query += ' ORDER BY t.id'
+        
+        cursor = self.connection.cursor()
+        cursor.row_factory = None
+        cursor.execute(query)
+        rows = (row[0] for row in cursor) if as_json else cursor
+        return [name for name, expr in columns], rows
+        
+    def import_rows(self, table, columns, rows, on_conflict=None, chunk_size=None,
+                    batch_size=None, progress=None):
+        """Insert rows (sequences ordered like columns) into an exportable table
+        
+        Rows go in with executemany() chunk_size at a time, batch_size rows
+        per transaction. on_conflict decides what happens to a row that
+        collides with an existing one: 'abort' stops the import (earlier
+        batches stay committed), 'ignore' skips it and 'update' overwrites
+        the existing row. The default is 'ignore' for SEEDED_TABLES, so an
+        export loads into a new system, and 'abort' otherwise. File bodies in content/content_base64 go to the
+        blob store. progress(rows_read) is called after every batch.
+        Returns (rows read, rows written).
+        """
+        chunk_size = chunk_size or self.IMPORT_CHUNK
+        batch_size = batch_size or self.IMPORT_BATCH
+        on_conflict = on_conflict or ('ignore' if table in self.SEEDED_TABLES else 'abort')
+        columns = list(columns)
+        
+        names = self.table_columns(table)
+        allowed = set(names) - {'blob_hash'}
+        if 'blob_hash' in names:
+            allowed.add('content_base64')
+        unknown = [name for name in columns if name not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown column(s) for {table}: {', '.join(unknown)}")
+            
+        convert = None
+        if 'blob_hash' in names and {'content', 'content_base64'} & set(columns):
+            text_at = columns.index('content') if 'content' in columns else None
+            base64_at = columns.index('content_base64') if 'content_base64' in columns else None
+            keep = [at for at, name in enumerate(columns) if name not in ('content', 'content_base64')]
+            
+            def convert(row):
+                body = None
+                if base64_at is not None and row[base64_at]:
+                    body = base64.b64decode(row[base64_at])
+                elif text_at is not None and row[text_at] is not None:
+                    body = row[text_at]
+                blob_hash = self.store_blob(body) if body is not None else None
+                return [row[at] for at in keep] + [blob_hash]
+                
+            columns = [columns[at] for at in keep] + ['blob_hash']
+            
+        placeholders = ', '.join('?' * len(columns))
+        sql = f"INSERT {'OR IGNORE ' if on_conflict == 'ignore' else ''}INTO {table} " \
+              f"({', '.join(columns)}) VALUES ({placeholders})"
+        if on_conflict == 'update':
+            updates = [f'{name} = excluded.{name}' for name in columns if name != 'id']
+            sql += ' ON CONFLICT DO ' + (f"UPDATE SET {', '.join(updates)}" if updates else 'NOTHING')
+        elif on_conflict not in ('abort', 'ignore'):
+            raise ValueError(f"Unknown conflict policy '{on_conflict}'")
+            
+        # Plain inserts keep row_counts right with one update per batch
+        # instead of the per-row trigger (an upsert may not add a row)
+        suspend = [f'{table}_count_insert'] if on_conflict != 'update' else []
+        
+        rows = iter(rows)
+        cursor = self.connection.cursor()
+        read = written = 0
+        try:
+            while True:
+                in_batch = inserted = 0
+                with self.transaction(), self.suspended_triggers(*suspend) as suspended:
+                    while in_batch < batch_size:
+                        chunk = list(itertools.islice(rows, min(chunk_size, batch_size - in_batch)))
+                        if not chunk:
+                            break
+                        if convert:
+                            chunk = [convert(row) for row in chunk]
+                        cursor.executemany(sql, chunk)
+                        inserted += max(cursor.rowcount, 0)
+                        in_batch += len(chunk)
+                    if suspended:
+                        self.add_row_count(table, inserted)
+                    if table == 'trash' and on_conflict == 'update' and in_batch < batch_size:
+                        # Overwritten rows change stats no trigger sees;
+                        # recount once, with the last batch
+                        self.rebuild_trash_stats()
+                written += inserted
+                read += in_batch
+                if progress:
+                    progress(read)
+                if in_batch < batch_size:
+                    return read, written
+        finally:
+            if table == 'filesystem':
+                self.dentry_cache.clear()
+                
+    @contextmanager
+    def suspended_triggers(self, *names):
+        """Drop triggers for the length of a block inside transaction()
+        
+        For bulk loads that do a trigger's work once per batch rather than
+        once per row. Yields the names that existed and were dropped; they
+        are created again before the transaction can commit, so no other
+        connection ever sees them missing. If the block raises, rolling the
+        transaction back restores them.
+        """
+        cursor = self.connection.cursor()
+        saved = {}
+        for name in names:
+            cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)
+            )
+            result = cursor.fetchone()
+            if result:
+                saved[name] = result['sql']
+                cursor.execute(f'DROP TRIGGER {name}')
+                
+        yield set(saved)
+        for sql in saved.values():
+            cursor.execute(sql)
+                
+    def add_row_count(self, table, delta):
+        """Adjust row_counts by hand while table's count trigger is suspended"""
+        self.cursor.execute(
+            'UPDATE row_counts SET row_count = row_count + ? WHERE table_name = ?',
+            (delta, table)
+        )
+        
+    def tree_rows(self, root, bodies=False):
+        """Rows of everything below a virtual directory, parents first
+        
+        With bodies, rows also carry content, data and compressed for
+        vfs_body(). Returns (cursor, prefix length): slicing a row's full
+        path at the prefix length gives its path relative to root.
+        """
+        root = normalize_path(root)
+        query = '''
+            SELECT filesystem.id, filesystem.path, filesystem.name, filesystem.type,
+                   filesystem.size, filesystem.modified_at
+        '''
+        if bodies:
+            query += ''', filesystem.content, blobs.data, blobs.compressed
+                FROM filesystem LEFT JOIN blobs ON blobs.hash = filesystem.blob_hash
+            '''
+        else:
+            query += ' FROM filesystem'
+        params = ()
+        if split_path(root)[1]:
+            root_id = self.resolve_path(root, 'directory')
+            if root_id is None:
+                raise ValueError(f"'{root}' is not a directory")
+            query += f' WHERE filesystem.id IN ({SUBTREE_IDS})'
+            params = (root_id,)
+        
+        cursor = self.connection.cursor()
+        cursor.execute(query + ' ORDER BY filesystem.path, filesystem.name, filesystem.id', params)
+        return cursor, len(root.rstrip('/')) + 1
+        
+    def import_tree(self, entries, vfs_path, owner='admin', threads=None, batch_size=None,
+                    progress=None):
+        """Load TreeEntry items (see host_tree) below a virtual directory
+        
+        Missing directories are created. A file whose size and modified
+        time match the existing entry is skipped; any other existing file
+        gets the new body. Bodies are read, hashed and compressed on a
+        thread pool while rows go in batch_size files per transaction.
+        progress(entries seen) is called after every batch. Returns a dict
+        of counts.
+        """
+        batch_size = batch_size or self.TREE_BATCH
+        root = normalize_path(vfs_path)
+        counts = {'directories': 0, 'files': 0, 'updated': 0, 'skipped': 0,
+                  'failed': 0, 'bytes': 0}
+                  
+        with self.transaction():
+            root_id = self.ensure_directory(root, owner)
+            
+        # What is already there, by path relative to root; the first of
+        # any duplicate names wins, as in resolve_path()
+        directories = {'': root_id}
+        files = {}
+        existing, prefix = self.tree_rows(root)
+        for row in existing:
+            relative = join_path(row['path'], row['name'])[prefix:]
+            if row['type'] == 'directory':
+                directories.setdefault(relative, row['id'])
+            else:
+                files.setdefault(relative, (row['id'], row['size'], row['modified_at']))
+                
+        # Directories waiting for the next batch, parents first
+        new_directories = []
+        
+        def add_directory(relative, mtime=None):
+            if relative in directories:
+                return
+            parent = posixpath.dirname(relative)
+            add_directory(parent)
+            directories[relative] = None
+            new_directories.append((relative, mtime))
+            
+        def changed(entries):
+            for entry in entries:
+                if entry.type == 'directory':
+                    add_directory(entry.path, entry.mtime)
+                    continue
+                add_directory(posixpath.dirname(entry.path))
+                current = files.get(entry.path)
+                if (current and current[1] == entry.size
+                        and current[2] == timestamp_text(entry.mtime)):
+                    counts['skipped'] += 1
+                    continue
+                yield entry
+                
+        def pack(entry):
+            content = entry.read()
+            return pack_blob(content, self.BLOB_COMPRESS_THRESHOLD) if content else None
+            
+        def write(batch):
+            cursor = self.connection.cursor()
+            suspend = ('filesystem_count_insert', 'filesystem_fts_insert')
+            with self.transaction(), self.suspended_triggers(*suspend) as suspended:
+                # New rows get ids above every existing one (AUTOINCREMENT),
+                # which is how the batch is indexed afterwards
+                cursor.execute('SELECT IFNULL(MAX(id), 0) FROM filesystem')
+                first_id = cursor.fetchone()[0]
+                
+                for relative, mtime in new_directories:
+                    parent, name = posixpath.split(relative)
+                    cursor.execute('''
+                        INSERT INTO filesystem (name, type, path, owner, parent_id, modified_at)
+                        VALUES (?, 'directory', ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                    ''', (name, join_path(root, parent) if parent else root, owner,
+                          directories[parent], timestamp_text(mtime) if mtime is not None else None))
+                    directories[relative] = cursor.lastrowid
+                    counts['directories'] += 1
+                    
+                blobs, inserts, updates = [], [], []
+                for entry, blob in batch:
+                    blob_hash, size = (blob[0], blob[3]) if blob else (None, 0)
+                    if blob:
+                        blobs.append(blob)
+                    modified = timestamp_text(entry.mtime)
+                    current = files.get(entry.path)
+                    if current:
+                        updates.append((blob_hash, size, modified, current[0]))
+                    else:
+                        parent, name = posixpath.split(entry.path)
+                        inserts.append((name, join_path(root, parent) if parent else root,
+                                        blob_hash, size, owner, directories[parent], modified))
+                        
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO blobs (hash, data, compressed, size, refcount)
+                    VALUES (?, ?, ?, ?, 0)
+                ''', blobs)
+                cursor.executemany('''
+                    INSERT INTO filesystem (name, type, path, blob_hash, size, owner, parent_id, modified_at)
+                    VALUES (?, 'file', ?, ?, ?, ?, ?, ?)
+                ''', inserts)
+                cursor.executemany('''
+                    UPDATE filesystem SET blob_hash = ?, size = ?, modified_at = ?
+                    WHERE id = ?
+                ''', updates)
+                
+                # FTS5 flushes its pending terms after every statement, so
+                # indexing the batch in one statement beats a trigger per row
+                if 'filesystem_fts_insert' in suspended:
+                    cursor.execute(FILESYSTEM_FTS_FILL + ' WHERE filesystem.id > ?', (first_id,))
+                if 'filesystem_count_insert' in suspended:
+                    self.add_row_count('filesystem', len(new_directories) + len(inserts))
+            new_directories.clear()
+            counts['files'] += len(inserts)
+            counts['updated'] += len(updates)
+            if progress:
+                progress(sum(counts[key] for key in ('files', 'updated', 'skipped', 'failed')))
+                
+        try:
+            batch, held = [], 0
+            for entry, blob in prefetch(pack, changed(entries), threads):
+                if isinstance(blob, Exception):
+                    print(f"Error reading {entry.path}: {blob}")
+                    counts['failed'] += 1
+                    continue
+                batch.append((entry, blob))
+                held += blob[3] if blob else 0
+                counts['bytes'] += blob[3] if blob else 0
+                if len(batch) >= batch_size or held >= self.TREE_BATCH_BYTES:
+                    write(batch)
+                    batch, held = [], 0
+            write(batch)
+        finally:
+            self.dentry_cache.clear()
+        return counts
+        
+    def iter_tree(self, vfs_path):
+        """TreeEntry items for everything below a virtual directory
+        
+        Parents come before their contents. File bodies are fetched with
+        the rows and decompressed by read(), so a thread pool can do it.
+        """
+        rows, prefix = self.tree_rows(vfs_path, bodies=True)
+        for row in rows:
+            relative = join_path(row['path'], row['name'])[prefix:]
+            mtime = timestamp_seconds(row['modified_at'])
+            if row['type'] == 'directory':
+                yield TreeEntry(relative, 'directory', 0, mtime, None)
+            else:
+                yield TreeEntry(relative, 'file', row['size'] or 0, mtime,
+                                partial(tree_body, row['data'], row['compressed'], row['content']))
+            
+    def snapshot(self, target=':memory:', pages=None, pause=None, progress=None):
+        """Copy the live database with the SQLite backup API
+        
+        Copies pages per step and sleeps pause seconds between steps, so the
+        running system keeps working; progress(copied, total) is called after
+        every step. Returns an open connection to the copy (a file path or
+        an in-memory database) that has passed integrity_check.
+        """
+        pages = pages or self.BACKUP_PAGES
+        pause = self.BACKUP_PAUSE if pause is None else pause
+        
+        def step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            if remaining:
+                time.sleep(pause)
+                
+        # A stepped backup restarts whenever another connection writes;
+        # holding a WAL read snapshot on a private connection pins the copy
+        # to one consistent state while writers carry on
+        source = self.pool.open()
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        
+        copy = sqlite3.connect(target)
+        try:
+            source.backup(copy, pages=pages, progress=step)
+            
+            result = copy.execute('PRAGMA integrity_check').fetchone()[0]
+            if result != 'ok':
+                raise sqlite3.DatabaseError(f"Backup failed integrity check: {result}")
+            return copy
+            
+        except BaseException:
+            copy.close()
+            raise
+            
+        finally:
+            source.close()
+            
+    def backup(self, target_path, compress=False, pages=None, pause=None, progress=None,
+               threads=None):
+        """Write a verified snapshot() of the live database to target_path
+        
+        The copy is only moved into place once it is complete. With compress
+        the snapshot goes to a scratch file next to target_path and is
+        streamed through gzip on threads compression threads, 1 MiB at a
+        time, so memory stays flat however large the database is.
+        Returns the number of pages.
+        """
+        temp_path = target_path + '.tmp'
+        image_path = target_path + '.snapshot' if compress else temp_path
+        try:
+            copy = self.snapshot(image_path, pages, pause, progress)
+            try:
+                page_count = copy.execute('PRAGMA page_count').fetchone()[0]
+            finally:
+                copy.close()
+            if compress:
+                with open(image_path, 'rb') as f_in, ParallelGzipWriter(temp_path, threads) as f_out:
+                    for block in iter(lambda: f_in.read(1 << 20), b''):
+                        f_out.write(block)
+                os.remove(image_path)
+            os.replace(temp_path, target_path)
+            return page_count
+            
+        except BaseException:
+            for path in {temp_path, image_path}:
+                for suffix in ('', '-journal'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            raise
+            
+    def close(self):
+        """Close all database connections"""
+        self.flush_settings()
+        self.trash_sweeper.stop()
+        self.maintainer.stop()
+        self.event_logger.stop()
+        
+        # SQLite's advice: optimize just before closing, on the connection
+        # whose queries tell it which tables want fresh statistics
+        if getattr(self.pool.local, 'connection', None) is not None:
+            try:
+                self.maintain_optimize(self.maintainer.budget)
+            except sqlite3.Error:
+                pass
+        self.pool.close_all()
         
     def init_database(self):
         """Initialize database tables with first boot support"""
@@ -120,149 +1614,1027 @@ class DatabaseManager:
             )
         ''')
 
-        # Trash table
+        # Trash table
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trash (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                original_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL,
+                original_path TEXT NOT NULL,
+                content TEXT,
+                size INTEGER DEFAULT 0,
+                deleted_by TEXT,
+                deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP,
+                FOREIGN KEY (original_id) REFERENCES filesystem (id)
+            )
+        ''')
+        
+        self.migrate_schema()
+
+        # Create trash directory (filesystem has no unique key, so look
+        # before inserting rather than relying on INSERT OR IGNORE)
+        self.ensure_directory('/home/.trash')
+        
+        # Create user trash directories
+        self.cursor.execute('SELECT username FROM users')
+        users = self.cursor.fetchall()
+        for user in users:
+            self.ensure_directory(f'/home/{user[0]}/.trash', owner=user[0])
+
+        self.connection.commit()
+
+    def migrate_schema(self):
+        """Upgrade an existing database to SCHEMA_VERSION"""
+        self.cursor.execute('PRAGMA user_version')
+        version = self.cursor.fetchone()[0]
+
+        migrations = [
+            (1, self.migrate_v1_indexes),
+            (2, self.migrate_v2_trash_groups),
+            (3, self.migrate_v3_blob_store),
+            (4, self.migrate_v4_inode_tree),
+            (5, self.migrate_v5_search_index),
+            (6, self.migrate_v6_aggregates),
+            (7, self.migrate_v7_trash_expiry),
+            (8, self.migrate_v8_boot_metrics),
+            (9, self.migrate_v9_upsert_keys),
+            (10, self.migrate_v10_trash_import_stats),
+        ]
+
+        for target, migrate in migrations:
+            if version < target:
+                # A step and its version bump land together, so an
+                # interrupted upgrade leaves the previous version to retry
+                with self.transaction():
+                    migrate()
+                    self.cursor.execute(f'PRAGMA user_version = {target}')
+                version = target
+
+    def migrate_v1_indexes(self):
+        """Create the hot-path index set"""
+        # set_setting used INSERT OR REPLACE without a unique key, so older
+        # databases can hold duplicates; keep the newest row for each key
+        self.cursor.execute('''
+            DELETE FROM settings WHERE id NOT IN (
+                SELECT MAX(id) FROM settings
+                GROUP BY IFNULL(user_id, 0), setting_key
+            )
+        ''')
+
+        for statement in SCHEMA_INDEXES:
+            self.cursor.execute(statement)
+
+    def migrate_v2_trash_groups(self):
+        """Group trashed directory trees so they restore as one unit"""
+        self.cursor.execute('ALTER TABLE trash ADD COLUMN group_id INTEGER')
+        self.cursor.execute(TRASH_GROUP_INDEX)
+
+    def migrate_v3_blob_store(self):
+        """Move file bodies out of filesystem/trash rows into the blob store"""
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                compressed BOOLEAN DEFAULT 0,
+                size INTEGER DEFAULT 0,
+                refcount INTEGER DEFAULT 0
+            )
+        ''')
+        
+        for table in ('filesystem', 'trash'):
+            self.cursor.execute(f'ALTER TABLE {table} ADD COLUMN blob_hash TEXT')
+            
+            # Reference counts follow the rows, so a trash move (insert
+            # into trash, delete from filesystem) never drops the blob
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_blob_insert
+                AFTER INSERT ON {table} WHEN NEW.blob_hash IS NOT NULL
+                BEGIN
+                    UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.blob_hash;
+                END
+            ''')
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_blob_delete
+                AFTER DELETE ON {table} WHEN OLD.blob_hash IS NOT NULL
+                BEGIN
+                    UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.blob_hash;
+                    DELETE FROM blobs WHERE hash = OLD.blob_hash AND refcount <= 0;
+                END
+            ''')
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_blob_update
+                AFTER UPDATE OF blob_hash ON {table}
+                WHEN OLD.blob_hash IS NOT NEW.blob_hash
+                BEGIN
+                    UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.blob_hash;
+                    UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.blob_hash;
+                    DELETE FROM blobs WHERE hash = OLD.blob_hash AND refcount <= 0;
+                END
+            ''')
+            
+            # Convert inline content a chunk of rows at a time
+            self.cursor.execute(f'SELECT id FROM {table} WHERE content IS NOT NULL')
+            row_ids = [row[0] for row in self.cursor.fetchall()]
+            
+            for chunk in chunked(row_ids, self.MAX_SQL_PARAMS):
+                placeholders = ','.join('?' * len(chunk))
+                self.cursor.execute(
+                    f'SELECT id, content FROM {table} WHERE id IN ({placeholders})', chunk
+                )
+                updates = [
+                    (self.store_blob(row['content']), row['id'])
+                    for row in self.cursor.fetchall()
+                ]
+                self.cursor.executemany(
+                    f'UPDATE {table} SET blob_hash = ?, content = NULL WHERE id = ?',
+                    updates
+                )
+                
+    def migrate_v4_inode_tree(self):
+        """Link every filesystem entry to its parent directory by id"""
+        self.cursor.execute('ALTER TABLE filesystem ADD COLUMN parent_id INTEGER')
+        self.cursor.execute('ALTER TABLE trash ADD COLUMN original_parent_id INTEGER')
+        self.cursor.execute(FILESYSTEM_PARENT_INDEX)
+        
+        # Every distinct parent path needs a directory row; older databases
+        # hold entries under directories that were never created
+        self.cursor.execute("SELECT DISTINCT path FROM filesystem WHERE path != '/'")
+        paths = sorted(row[0] for row in self.cursor.fetchall())
+        links = [(self.ensure_directory(path), path) for path in paths]
+        
+        # One indexed set-based update per parent directory
+        self.cursor.executemany('''
+            UPDATE filesystem SET parent_id = ?
+            WHERE path = ? AND parent_id IS NULL
+        ''', links)
+        
+        # Safety net for writers that still insert by path only: link the
+        # new row to the directory named by its path column
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS filesystem_link_parent
+            AFTER INSERT ON filesystem
+            WHEN NEW.parent_id IS NULL AND NEW.path != '/'
+            BEGIN
+                UPDATE filesystem SET parent_id = (
+                    SELECT parent.id FROM filesystem AS parent
+                    WHERE parent.type = 'directory'
+                    AND parent.name = substr(NEW.path, length(rtrim(NEW.path, replace(NEW.path, '/', ''))) + 1)
+                    AND parent.path = CASE
+                        WHEN rtrim(NEW.path, replace(NEW.path, '/', '')) = '/' THEN '/'
+                        ELSE substr(NEW.path, 1, length(rtrim(NEW.path, replace(NEW.path, '/', ''))) - 1)
+                    END
+                    ORDER BY parent.id LIMIT 1
+                )
+                WHERE id = NEW.id;
+            END
+        ''')
+        
+    def migrate_v5_search_index(self):
+        """Full-text index over filesystem names and file contents"""
+        # rowid is filesystem.id; prefix indexes keep "term*" lookups fast.
+        # Paths are left out so moving a directory leaves its subtree's
+        # index entries alone
+        self.cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS filesystem_fts
+            USING fts5(name, body, prefix='2 3')
+        ''')
+        
+        body = '''vfs_text(
+            (SELECT data FROM blobs WHERE hash = NEW.blob_hash),
+            (SELECT compressed FROM blobs WHERE hash = NEW.blob_hash),
+            NEW.content
+        )'''
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS filesystem_fts_insert
+            AFTER INSERT ON filesystem
+            BEGIN
+                INSERT INTO filesystem_fts (rowid, name, body)
+                VALUES (NEW.id, NEW.name, {body});
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS filesystem_fts_delete
+            AFTER DELETE ON filesystem
+            BEGIN
+                DELETE FROM filesystem_fts WHERE rowid = OLD.id;
+            END
+        ''')
+        # Renames keep the indexed body; only a content change decodes
+        # the file again
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS filesystem_fts_rename
+            AFTER UPDATE OF name ON filesystem
+            BEGIN
+                UPDATE filesystem_fts SET name = NEW.name
+                WHERE rowid = NEW.id;
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS filesystem_fts_body
+            AFTER UPDATE OF content, blob_hash ON filesystem
+            BEGIN
+                UPDATE filesystem_fts SET body = {body}
+                WHERE rowid = NEW.id;
+            END
+        ''')
+        
+        self.cursor.execute(FILESYSTEM_FTS_FILL)
+        
+    def migrate_v6_aggregates(self):
+        """Trigger-maintained counters for trash, filesystem and row counts"""
+        # Per deleting user and type. entry_count counts what the user
+        # sees (top-level entries); item_count and total_size include the
+        # contents of trashed directories
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trash_stats (
+                deleted_by TEXT NOT NULL,
+                type TEXT NOT NULL,
+                entry_count INTEGER DEFAULT 0,
+                item_count INTEGER DEFAULT 0,
+                total_size INTEGER DEFAULT 0,
+                oldest TIMESTAMP,
+                newest TIMESTAMP,
+                PRIMARY KEY (deleted_by, type)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS filesystem_stats (
+                type TEXT PRIMARY KEY,
+                item_count INTEGER DEFAULT 0,
+                total_size INTEGER DEFAULT 0
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS row_counts (
+                table_name TEXT PRIMARY KEY,
+                row_count INTEGER DEFAULT 0
+            )
+        ''')
+        
+        self.cursor.execute(TRASH_STATS_INSERT_TRIGGER)
+        # Deleting the oldest/newest row looks the next one up through
+        # idx_trash_user_type, one seek instead of a walk over the user's rows
+        self.cursor.execute(TRASH_TYPE_INDEX)
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trash_stats_delete
+            AFTER DELETE ON trash
+            BEGIN
+                UPDATE trash_stats SET
+                    entry_count = entry_count - (OLD.group_id IS NULL OR OLD.group_id = OLD.id),
+                    item_count = item_count - 1,
+                    total_size = total_size - IFNULL(OLD.size, 0)
+                WHERE deleted_by = IFNULL(OLD.deleted_by, '') AND type = OLD.type;
+                
+                DELETE FROM trash_stats
+                WHERE deleted_by = IFNULL(OLD.deleted_by, '') AND type = OLD.type
+                AND item_count <= 0;
+                
+                UPDATE trash_stats SET oldest = (
+                    SELECT MIN(deleted_at) FROM trash
+                    WHERE deleted_by IS OLD.deleted_by AND type = OLD.type
+                )
+                WHERE deleted_by = IFNULL(OLD.deleted_by, '') AND type = OLD.type
+                AND oldest = OLD.deleted_at;
+                
+                UPDATE trash_stats SET newest = (
+                    SELECT MAX(deleted_at) FROM trash
+                    WHERE deleted_by IS OLD.deleted_by AND type = OLD.type
+                )
+                WHERE deleted_by = IFNULL(OLD.deleted_by, '') AND type = OLD.type
+                AND newest = OLD.deleted_at;
+            END
+        ''')
+        
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS filesystem_stats_insert
+            AFTER INSERT ON filesystem
+            BEGIN
+                INSERT INTO filesystem_stats (type, item_count, total_size)
+                VALUES (NEW.type, 1, IFNULL(NEW.size, 0))
+                ON CONFLICT (type) DO UPDATE SET
+                    item_count = item_count + 1,
+                    total_size = total_size + excluded.total_size;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS filesystem_stats_delete
+            AFTER DELETE ON filesystem
+            BEGIN
+                UPDATE filesystem_stats SET
+                    item_count = item_count - 1,
+                    total_size = total_size - IFNULL(OLD.size, 0)
+                WHERE type = OLD.type;
+                
+                DELETE FROM filesystem_stats WHERE type = OLD.type AND item_count <= 0;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS filesystem_stats_update
+            AFTER UPDATE OF type, size ON filesystem
+            BEGIN
+                UPDATE filesystem_stats SET
+                    item_count = item_count - 1,
+                    total_size = total_size - IFNULL(OLD.size, 0)
+                WHERE type = OLD.type;
+                
+                DELETE FROM filesystem_stats WHERE type = OLD.type AND item_count <= 0;
+                
+                INSERT INTO filesystem_stats (type, item_count, total_size)
+                VALUES (NEW.type, 1, IFNULL(NEW.size, 0))
+                ON CONFLICT (type) DO UPDATE SET
+                    item_count = item_count + 1,
+                    total_size = total_size + excluded.total_size;
+            END
+        ''')
+        
+        for table in COUNTED_TABLES:
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_count_insert
+                AFTER INSERT ON {table}
+                BEGIN
+                    UPDATE row_counts SET row_count = row_count + 1
+                    WHERE table_name = '{table}';
+                END
+            ''')
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_count_delete
+                AFTER DELETE ON {table}
+                BEGIN
+                    UPDATE row_counts SET row_count = row_count - 1
+                    WHERE table_name = '{table}';
+                END
+            ''')
+            
+        self.rebuild_aggregates()
+        
+    def migrate_v7_trash_expiry(self):
+        """Store trash expiry times in the datetime('now') format
+        
+        Older rows hold local-time isoformat() strings ('T' separator and
+        microseconds), which do not compare correctly against it.
+        """
+        self.cursor.execute('''
+            UPDATE trash SET expires_at = strftime('%Y-%m-%d %H:%M:%S', expires_at, 'utc')
+            WHERE expires_at LIKE '%T%'
+        ''')
+        
+    def migrate_v8_boot_metrics(self):
+        """One row per boot: how long it took to reach login and the desktop"""
+        # kind is 'cold' (process start) or 'restart'; times are seconds
+        # from the start of the boot, desktop_load only covers building it
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS boot_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                kind TEXT NOT NULL,
+                fast_boot BOOLEAN DEFAULT 0,
+                mobile BOOLEAN DEFAULT 0,
+                login_seconds REAL,
+                desktop_seconds REAL,
+                desktop_load_seconds REAL
+            )
+        ''')
+        
+    def migrate_v9_upsert_keys(self):
+        """Give installed_apps a unique name so packages can be upserted
+        
+        INSERT OR REPLACE deletes the old row without firing the count
+        triggers (recursive_triggers is off), so re-saves inflated
+        row_counts; recount after dropping the duplicates it left behind.
+        """
+        self.cursor.execute('''
+            DELETE FROM installed_apps WHERE id NOT IN (
+                SELECT MAX(id) FROM installed_apps GROUP BY name
+            )
+        ''')
+        self.cursor.execute(INSTALLED_APPS_NAME_INDEX)
+        self.rebuild_aggregates()
+        
+    def migrate_v10_trash_import_stats(self):
+        """Count imported trash roots (group_id = id) as top-level entries"""
+        self.cursor.execute('DROP TRIGGER IF EXISTS trash_stats_insert')
+        self.cursor.execute(TRASH_STATS_INSERT_TRIGGER)
+        self.rebuild_trash_stats()
+        
+    def rebuild_aggregates(self):
+        """Recompute every aggregate table from scratch (without committing)"""
+        self.rebuild_trash_stats()
+        
+        self.cursor.execute('DELETE FROM filesystem_stats')
+        self.cursor.execute('''
+            INSERT INTO filesystem_stats (type, item_count, total_size)
+            SELECT type, COUNT(*), IFNULL(SUM(size), 0)
+            FROM filesystem GROUP BY type
+        ''')
+        
+        self.cursor.execute('DELETE FROM row_counts')
+        for table in COUNTED_TABLES:
+            self.cursor.execute(f'''
+                INSERT INTO row_counts (table_name, row_count)
+                SELECT '{table}', COUNT(*) FROM {table}
+            ''')
+            
+    def rebuild_trash_stats(self):
+        """Recompute trash_stats from the trash table (without committing)"""
+        self.cursor.execute('DELETE FROM trash_stats')
+        self.cursor.execute('''
+            INSERT INTO trash_stats
+            (deleted_by, type, entry_count, item_count, total_size, oldest, newest)
+            SELECT IFNULL(deleted_by, ''), type,
+                   SUM(group_id IS NULL OR group_id = id), COUNT(*),
+                   IFNULL(SUM(size), 0), MIN(deleted_at), MAX(deleted_at)
+            FROM trash GROUP BY IFNULL(deleted_by, ''), type
+        ''')
+        
+    def create_indexes(self):
+        """(Re)create every index of the current schema"""
+        self.migrate_v1_indexes()
+        self.cursor.execute(TRASH_GROUP_INDEX)
+        self.cursor.execute(FILESYSTEM_PARENT_INDEX)
+        self.cursor.execute(TRASH_TYPE_INDEX)
+        self.cursor.execute(INSTALLED_APPS_NAME_INDEX)
+        
+    def check_query_plans(self):
+        """Report hot queries that would fall back to a full table scan"""
+        return find_query_plan_scans(self.cursor)
+        
+    def resolve_path(self, full_path, item_type=None):
+        """Get the id of the entry at full_path, or None ('/' has no row)"""
+        path, name = split_path(full_path)
+        if not name:
+            return None
+        
+        query = 'SELECT id FROM filesystem WHERE path = ? AND name = ?'
+        params = [path, name]
+        if item_type:
+            query += ' AND type = ?'
+            params.append(item_type)
+        self.cursor.execute(query + ' ORDER BY id LIMIT 1', params)
+        result = self.cursor.fetchone()
+        return result['id'] if result else None
+        
+    def ensure_directory(self, full_path, owner='admin'):
+        """Create full_path and any missing ancestors without committing
+        
+        Returns the directory's id, or None for the root.
+        """
+        parent_id, path = None, '/'
+        for name in filter(None, join_path(*split_path(full_path)).split('/')):
+            self.cursor.execute('''
+                SELECT id FROM filesystem
+                WHERE path = ? AND name = ? AND type = 'directory'
+                ORDER BY id LIMIT 1
+            ''', (path, name))
+            result = self.cursor.fetchone()
+            if result:
+                parent_id = result['id']
+            else:
+                self.cursor.execute('''
+                    INSERT INTO filesystem (name, type, path, owner, parent_id)
+                    VALUES (?, 'directory', ?, ?, ?)
+                ''', (name, path, owner, parent_id))
+                parent_id = self.cursor.lastrowid
+                self.dentry_cache.invalidate(path)
+            path = join_path(path, name)
+        return parent_id
+        
+    def list_children(self, full_path):
+        """Entries directly inside a directory, directories first
+        
+        Returns None when full_path is not a directory.
+        """
+        if split_path(full_path)[1]:
+            parent_id = self.resolve_path(full_path, 'directory')
+            if parent_id is None:
+                return None
+            self.cursor.execute(HOT_QUERIES['filesystem.children'], (parent_id,))
+        else:
+            self.cursor.execute('''
+                SELECT id, name, type, size, modified_at, owner, permissions
+                FROM filesystem WHERE parent_id IS NULL AND path = '/'
+                ORDER BY type DESC, name
+            ''')
+        return self.cursor.fetchall()
+        
+    def list_directory(self, full_path):
+        """List a directory as (name, type, size, modified) tuples
+        
+        Directories come first, then files, each by name. Listings are
+        served from the dentry cache after the first call. Returns None
+        when full_path is not a directory.
+        """
+        self.refresh_dentries()
+        listing = self.dentry_cache.get(full_path)
+        if listing is not None:
+            return list(listing)
+            
+        if split_path(full_path)[1] and self.resolve_path(full_path, 'directory') is None:
+            return None
+            
+        listing = tuple(
+            (row['name'], row['type'], row['size'] or 0, row['modified_at'])
+            for item_type in ('directory', 'file')
+            for row in self.iter_directory(full_path, item_type)
+        )
+        self.dentry_cache.put(full_path, listing)
+        return list(listing)
+        
+    def refresh_dentries(self):
+        """Clear the dentry cache if another connection changed the database"""
+        if self.dentry_watch.changed(self.connection):
+            self.dentry_cache.clear()
+            
+    def move_entry(self, file_id, new_parent_path, new_name=None):
+        """Move and/or rename an entry (and its subtree)
+        
+        The hierarchy change is a single-row parent_id update. Moving a
+        directory also rewrites the path column of every descendant, one
+        set-based statement over the parent_id index, so it costs O(subtree)
+        writes: path stays stored because lookups, listings, search and the
+        portable export format all key on it. Returns (success, error message).
+        """
+        try:
+            self.cursor.execute(
+                'SELECT name, type, path FROM filesystem WHERE id = ?', (file_id,)
+            )
+            entry = self.cursor.fetchone()
+            if not entry:
+                return False, "entry not found"
+                
+            new_name = new_name or entry['name']
+            new_parent_id = None
+            if split_path(new_parent_path)[1]:
+                new_parent_id = self.resolve_path(new_parent_path, 'directory')
+                if new_parent_id is None:
+                    return False, f"no such directory: {new_parent_path}"
+                    
+                # A directory cannot move below itself
+                self.cursor.execute(
+                    f'SELECT 1 FROM ({ANCESTOR_IDS}) WHERE id = ?',
+                    (new_parent_id, file_id)
+                )
+                if self.cursor.fetchone():
+                    return False, "cannot move a directory into itself"
+                    
+            new_path = split_path(join_path(new_parent_path, new_name))[0]
+            self.cursor.execute('''
+                SELECT 1 FROM filesystem WHERE path = ? AND name = ? AND id != ?
+            ''', (new_path, new_name, file_id))
+            if self.cursor.fetchone():
+                return False, f"'{join_path(new_path, new_name)}' already exists"
+                
+            self.cursor.execute('''
+                UPDATE filesystem
+                SET parent_id = ?, path = ?, name = ?, modified_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (new_parent_id, new_path, new_name, file_id))
+            self.dentry_cache.invalidate(entry['path'], new_path)
+            
+            if entry['type'] == 'directory':
+                old_root = join_path(entry['path'], entry['name'])
+                self.dentry_cache.invalidate_tree(old_root)
+                self.cursor.execute(f'''
+                    UPDATE filesystem SET path = ? || substr(path, ?)
+                    WHERE id IN ({SUBTREE_IDS})
+                ''', (join_path(new_path, new_name), len(old_root) + 1, file_id))
+                
+            self.connection.commit()
+            return True, None
+            
+        except Exception as e:
+            print(f"Error moving entry: {e}")
+            self.connection.rollback()
+            return False, str(e)
+            
+    def delete_entry(self, file_id):
+        """Permanently delete an entry and everything below it
+        
+        Returns the number of rows deleted.
+        """
+        try:
+            self.cursor.execute(
+                'SELECT name, path FROM filesystem WHERE id = ?', (file_id,)
+            )
+            entry = self.cursor.fetchone()
+            if not entry:
+                return 0
+            self.dentry_cache.invalidate(entry['path'])
+            self.dentry_cache.invalidate_tree(join_path(entry['path'], entry['name']))
+            
+            self.cursor.execute(
+                f'DELETE FROM filesystem WHERE id IN ({SUBTREE_IDS})', (file_id,)
+            )
+            count = self.cursor.rowcount
+            self.cursor.execute('DELETE FROM filesystem WHERE id = ?', (file_id,))
+            count += self.cursor.rowcount
+            self.connection.commit()
+            return count
+            
+        except Exception as e:
+            print(f"Error deleting entry: {e}")
+            self.connection.rollback()
+            return 0
+            
+    def search(self, query, path_prefix=None, limit=50, names_only=False):
+        """Full-text search over file names and contents, best match first
+        
+        Every word of query must match, as a word prefix ("rep" finds
+        "report"). path_prefix limits results to entries below that
+        directory. Rows carry id, name, type, path, size and a snippet of
+        the matching content.
+        """
+        terms = fts_terms(query)
+        if not terms:
+            return []
+        
+        words = ' '.join(f'"{term}"*' for term in terms)
+        match = f'name : ({words})' if names_only else words
+        sql = '''
+            SELECT f.id, f.name, f.type, f.path, f.size,
+                   snippet(filesystem_fts, 1, '[', ']', '...', 10) AS snippet
+            FROM filesystem_fts
+            JOIN filesystem AS f ON f.id = filesystem_fts.rowid
+            WHERE filesystem_fts MATCH ?
+        '''
+        params = [match]
+        
+        prefix = normalize_path(path_prefix or '/')
+        if prefix != '/':
+            # Checked on the word matches through the path cache
+            sql += ' AND (f.path = ? OR (f.path >= ? AND f.path < ?))'
+            params.extend([prefix, prefix + '/', prefix + '0'])
+        
+        # Name hits outrank content hits
+        sql += ' ORDER BY bm25(filesystem_fts, 10.0, 1.0) LIMIT ?'
+        params.append(limit)
+        
+        try:
+            self.cursor.execute(sql, params)
+            return self.cursor.fetchall()
+        
+        except Exception as e:
+            print(f"Error searching files: {e}")
+            return []
+            
+    def move_to_trash(self, file_id, deleted_by='system'):
+        """Move a file/directory (and everything under it) to trash"""
+        try:
+            moved = self.trash_entry(file_id, deleted_by, self.trash_expiry())
+            self.connection.commit()
+            return moved
+            
+        except Exception as e:
+            print(f"Error moving to trash: {e}")
+            self.connection.rollback()
+            return False
+            
+    def move_many_to_trash(self, file_ids, deleted_by='system'):
+        """Move several files/directories to trash in one transaction
+
+        Returns a list of (file_id, moved) in input order.
+        """
+        try:
+            expires_at = self.trash_expiry()
+            results = [
+                (file_id, self.trash_entry(file_id, deleted_by, expires_at))
+                for file_id in file_ids
+            ]
+            self.connection.commit()
+            return results
+            
+        except Exception as e:
+            print(f"Error moving to trash: {e}")
+            self.connection.rollback()
+            return [(file_id, False) for file_id in file_ids]
+            
+    def trash_expiry(self):
+        """Expiration timestamp for items trashed now
+        
+        UTC in the same format as datetime('now'), so expiry is a plain
+        indexed string comparison.
+        """
+        days = self.retention_setting('trash_retention_days')
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() + days * 86400))
+        
+    def trash_entry(self, file_id, deleted_by, expires_at):
+        """Move one entry and its subtree to trash without committing"""
+        # Get file info
         self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS trash (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                original_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL,
-                original_path TEXT NOT NULL,
-                content TEXT,
-                size INTEGER DEFAULT 0,
-                deleted_by TEXT,
-                deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP,
-                FOREIGN KEY (original_id) REFERENCES filesystem (id)
-            )
-        ''')
+            SELECT name, type, path
+            FROM filesystem WHERE id = ?
+        ''', (file_id,))
         
-        # Create trash directory
+        file_info = self.cursor.fetchone()
+        if not file_info:
+            return False
+            
+        # Move the item itself; its trash id names the group
         self.cursor.execute('''
-            INSERT OR IGNORE INTO filesystem (name, type, path)
-            VALUES (?, ?, ?)
-        ''', ('.trash', 'directory', '/home'))
+            INSERT INTO trash 
+            (original_id, name, type, original_path, content, blob_hash, size,
+             deleted_by, expires_at)
+            SELECT id, name, type, path, content, blob_hash, size, ?, ?
+            FROM filesystem WHERE id = ?
+        ''', (deleted_by, expires_at, file_id))
         
-        # Create user trash directories
-        self.cursor.execute('SELECT username FROM users')
-        users = self.cursor.fetchall()
-        for user in users:
+        group_id = self.cursor.lastrowid
+        self.cursor.execute(
+            'UPDATE trash SET group_id = ? WHERE id = ?',
+            (group_id, group_id)
+        )
+        
+        self.cursor.execute('DELETE FROM filesystem WHERE id = ?', (file_id,))
+        self.dentry_cache.invalidate(file_info['path'])
+        
+        # If it's a directory, move the whole subtree in two statements
+        if file_info['type'] == 'directory':
+            self.dentry_cache.invalidate_tree(join_path(file_info['path'], file_info['name']))
+            self.cursor.execute(f'''
+                INSERT INTO trash
+                (original_id, original_parent_id, name, type, original_path,
+                 content, blob_hash, size, deleted_by, expires_at, group_id)
+                SELECT id, parent_id, name, type, path, content, blob_hash, size, ?, ?, ?
+                FROM filesystem
+                WHERE id IN ({SUBTREE_IDS})
+            ''', (deleted_by, expires_at, group_id, file_id))
+            
+            # The group now lists the subtree; no need to walk it again
             self.cursor.execute('''
-                INSERT OR IGNORE INTO filesystem (name, type, path)
-                VALUES (?, ?, ?)
-            ''', ('.trash', 'directory', f'/home/{user[0]}'))
+                DELETE FROM filesystem WHERE id IN (
+                    SELECT original_id FROM trash WHERE group_id = ? AND id != ?
+                )
+            ''', (group_id, group_id))
+            
+        return True
         
-        self.connection.commit()
+    def restore_from_trash(self, trash_id):
+        """Restore an item (and its trashed subtree) from trash"""
+        success, new_name = self.restore_many([trash_id])[0][1:]
+        return success, new_name
         
-    def move_to_trash(self, file_id, deleted_by='system'):
-        """Move a file/directory to trash"""
+    def restore_many(self, trash_ids):
+        """Restore several trash items in one transaction
+
+        Name conflicts are resolved for the whole selection up front.
+        Returns a list of (trash_id, restored, new_name) in input order;
+        new_name is only set when an item had to be renamed.
+        """
         try:
-            # Get file info
-            self.cursor.execute('''
-                SELECT name, type, path, content, size
-                FROM filesystem WHERE id = ?
-            ''', (file_id,))
+            items = self.fetch_trash_rows(trash_ids, '''
+                id, name, type, original_path, content, blob_hash, size, group_id
+            ''')
             
-            file_info = self.cursor.fetchone()
-            if not file_info:
-                return False
+            # Members of a selected group come back with their root
+            selected_groups = {
+                item['id'] for item in items.values()
+                if item['group_id'] == item['id']
+            }
+            
+            # One indexed probe per distinct location for existing entries
+            taken = set()
+            for path, name, item_type in {
+                (item['original_path'], item['name'], item['type'])
+                for item in items.values()
+            }:
+                self.cursor.execute('''
+                    SELECT 1 FROM filesystem 
+                    WHERE path = ? AND name = ? AND type = ?
+                ''', (path, name, item_type))
+                if self.cursor.fetchone():
+                    taken.add((path, name, item_type))
+                    
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            
+            results = []
+            for trash_id in trash_ids:
+                item = items.get(trash_id)
+                if not item:
+                    results.append((trash_id, False, None))
+                    continue
+                    
+                if item['group_id'] in selected_groups and item['group_id'] != item['id']:
+                    results.append((trash_id, True, None))
+                    continue
+                    
+                # Name conflict - add timestamp (and a counter within the batch)
+                new_name = item['name']
+                suffix = 0
+                while (item['original_path'], new_name, item['type']) in taken:
+                    suffix += 1
+                    new_name = f"{item['name']}_restored_{timestamp}"
+                    if suffix > 1:
+                        new_name += f"_{suffix}"
+                taken.add((item['original_path'], new_name, item['type']))
                 
-            # Calculate expiration date (30 days from now)
-            from datetime import datetime, timedelta
-            expires_at = (datetime.now() + timedelta(days=30)).isoformat()
+                self.restore_entry(item, new_name)
+                results.append((trash_id, True,
+                                new_name if new_name != item['name'] else None))
+                
+            self.connection.commit()
+            return results
+            
+        except Exception as e:
+            print(f"Error restoring from trash: {e}")
+            self.connection.rollback()
+            return [(trash_id, False, None) for trash_id in trash_ids]
             
-            # Move to trash
+    def restore_entry(self, trash_item, new_name):
+        """Put one trash row (and its group) back without committing"""
+        trash_id = trash_item['id']
+        is_root = trash_item['group_id'] == trash_id
+        
+        # Ids are never reused (AUTOINCREMENT), so normally a whole tree
+        # keeps its ids and its parent links come back verbatim. If any id
+        # in the group, the root's included, was taken meanwhile (e.g. by an
+        # import), the tree is relinked by path instead
+        verbatim = False
+        if is_root:
             self.cursor.execute('''
-                INSERT INTO trash 
-                (original_id, name, type, original_path, content, size, deleted_by, expires_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                file_id,
-                file_info['name'],
-                file_info['type'],
-                file_info['path'],
-                file_info['content'],
-                file_info['size'],
-                deleted_by,
-                expires_at
-            ))
-            
-            # Delete from filesystem
-            self.cursor.execute('DELETE FROM filesystem WHERE id = ?', (file_id,))
+                SELECT 1 FROM trash
+                WHERE group_id = ? AND (
+                    original_id IS NULL
+                    OR (id != ? AND original_parent_id IS NULL)
+                    OR EXISTS (SELECT 1 FROM filesystem WHERE id = trash.original_id)
+                )
+                LIMIT 1
+            ''', (trash_id, trash_id))
+            verbatim = not self.cursor.fetchone()
+            
+        # Restore to filesystem, recreating the parent directory if it was
+        # deleted meanwhile; entries keep their id unless it was reused
+        self.cursor.execute('''
+            INSERT INTO filesystem (id, name, type, path, content, blob_hash, size, parent_id)
+            SELECT CASE WHEN EXISTS (SELECT 1 FROM filesystem WHERE id = trash.original_id)
+                        THEN NULL ELSE original_id END,
+                   ?, type, original_path, content, blob_hash, size, ?
+            FROM trash WHERE id = ?
+        ''', (new_name, self.ensure_directory(trash_item['original_path']), trash_id))
+        self.dentry_cache.invalidate(trash_item['original_path'])
+        
+        # A group root brings the rest of its tree back with it,
+        # re-rooted under the new name if it had to be renamed
+        if is_root:
+            old_root = join_path(trash_item['original_path'], trash_item['name'])
+            new_root = join_path(trash_item['original_path'], new_name)
+            self.dentry_cache.invalidate_tree(new_root)
             
-            # If it's a directory, move all contents to trash
-            if file_info['type'] == 'directory':
-                original_full_path = f"{file_info['path']}/{file_info['name']}"
+            if verbatim:
                 self.cursor.execute('''
-                    SELECT id FROM filesystem 
-                    WHERE path = ? OR path LIKE ? || '/%'
-                ''', (original_full_path, original_full_path))
-                
-                sub_items = self.cursor.fetchall()
-                for item in sub_items:
-                    self.move_to_trash(item['id'], deleted_by)
+                    INSERT INTO filesystem
+                    (id, name, type, path, content, blob_hash, size, parent_id)
+                    SELECT original_id, name, type, ? || substr(original_path, ?),
+                           content, blob_hash, size, original_parent_id
+                    FROM trash
+                    WHERE group_id = ? AND id != ?
+                ''', (new_root, len(old_root) + 1, trash_id, trash_id))
+            else:
+                # Fresh ids: insert parents first and let
+                # filesystem_link_parent find each row's parent by path
+                self.cursor.execute('''
+                    INSERT INTO filesystem (id, name, type, path, content, blob_hash, size)
+                    SELECT CASE WHEN EXISTS (SELECT 1 FROM filesystem WHERE id = trash.original_id)
+                                THEN NULL ELSE original_id END,
+                           name, type, ? || substr(original_path, ?), content, blob_hash, size
+                    FROM trash
+                    WHERE group_id = ? AND id != ?
+                    ORDER BY length(original_path)
+                ''', (new_root, len(old_root) + 1, trash_id, trash_id))
             
+            self.cursor.execute('DELETE FROM trash WHERE group_id = ?', (trash_id,))
+        else:
+            self.cursor.execute('DELETE FROM trash WHERE id = ?', (trash_id,))
+            
+    def purge_many(self, trash_ids):
+        """Permanently delete several trash items in one transaction
+
+        Returns a list of (trash_id, deleted) in input order.
+        """
+        try:
+            items = self.fetch_trash_rows(trash_ids, 'id, group_id')
+            roots = [item_id for item_id, item in items.items()
+                     if item['group_id'] == item_id]
+            
+            for chunk in chunked(list(items), self.MAX_SQL_PARAMS):
+                placeholders = ','.join('?' * len(chunk))
+                self.cursor.execute(
+                    f'DELETE FROM trash WHERE id IN ({placeholders})', chunk
+                )
+            for chunk in chunked(roots, self.MAX_SQL_PARAMS):
+                placeholders = ','.join('?' * len(chunk))
+                self.cursor.execute(
+                    f'DELETE FROM trash WHERE group_id IN ({placeholders})', chunk
+                )
+                
             self.connection.commit()
-            return True
+            return [(trash_id, trash_id in items) for trash_id in trash_ids]
             
         except Exception as e:
-            print(f"Error moving to trash: {e}")
+            print(f"Error deleting from trash: {e}")
             self.connection.rollback()
-            return False
+            return [(trash_id, False) for trash_id in trash_ids]
             
-    def restore_from_trash(self, trash_id):
-        """Restore an item from trash"""
+    def fetch_trash_rows(self, trash_ids, columns):
+        """Map trash id -> row for the given ids, in chunked IN queries"""
+        rows = {}
+        for chunk in chunked(list(dict.fromkeys(trash_ids)), self.MAX_SQL_PARAMS):
+            placeholders = ','.join('?' * len(chunk))
+            self.cursor.execute(
+                f'SELECT {columns} FROM trash WHERE id IN ({placeholders})', chunk
+            )
+            for row in self.cursor.fetchall():
+                rows[row['id']] = row
+        return rows
+            
+    def store_blob(self, content):
+        """Store content in the blob store (without committing); returns its hash
+
+        The blob starts unreferenced; pointing a filesystem or trash row's
+        blob_hash at it takes the reference.
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+            
+        blob_hash = hashlib.sha256(content).hexdigest()
+        
+        self.cursor.execute('SELECT 1 FROM blobs WHERE hash = ?', (blob_hash,))
+        if self.cursor.fetchone():
+            return blob_hash
+            
+        self.cursor.execute('''
+            INSERT OR IGNORE INTO blobs (hash, data, compressed, size, refcount)
+            VALUES (?, ?, ?, ?, 0)
+        ''', pack_blob(content, self.BLOB_COMPRESS_THRESHOLD, blob_hash))
+        return blob_hash
+        
+    def read_blob(self, blob_hash):
+        """Get the bytes stored under blob_hash, or None"""
+        self.cursor.execute(
+            'SELECT data, compressed FROM blobs WHERE hash = ?', (blob_hash,)
+        )
+        result = self.cursor.fetchone()
+        if not result:
+            return None
+        data = bytes(result['data'])
+        return zlib.decompress(data) if result['compressed'] else data
+        
+    def read_file(self, file_id):
+        """Get the content of a virtual file as bytes, or None"""
+        self.cursor.execute(
+            'SELECT content, blob_hash FROM filesystem WHERE id = ?', (file_id,)
+        )
+        result = self.cursor.fetchone()
+        if not result:
+            return None
+        if result['blob_hash']:
+            return self.read_blob(result['blob_hash'])
+        # Rows written before the blob store keep their content inline
+        if result['content'] is not None:
+            return result['content'].encode('utf-8')
+        return b''
+        
+    def create_file(self, path, name, content=None, owner='admin', replace=False):
+        """Create a virtual file whose body lives in the blob store"""
         try:
-            # Get trash item info
-            self.cursor.execute('''
-                SELECT original_id, name, type, original_path, content, size
-                FROM trash WHERE id = ?
-            ''', (trash_id,))
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            blob_hash = self.store_blob(content) if content else None
             
-            trash_item = self.cursor.fetchone()
-            if not trash_item:
-                return False
+            if replace:
+                self.cursor.execute('''
+                    DELETE FROM filesystem
+                    WHERE path = ? AND name = ? AND type = 'file'
+                ''', (path, name))
                 
-            # Check if original location is available
+            parent_id = self.ensure_directory(path, owner)
+            self.dentry_cache.invalidate(path)
             self.cursor.execute('''
-                SELECT id FROM filesystem 
-                WHERE path = ? AND name = ? AND type = ?
-            ''', (
-                trash_item['original_path'],
-                trash_item['name'],
-                trash_item['type']
-            ))
+                INSERT INTO filesystem (name, type, path, blob_hash, size, owner, parent_id)
+                VALUES (?, 'file', ?, ?, ?, ?, ?)
+            ''', (name, path, blob_hash, len(content) if content else 0, owner, parent_id))
             
-            if self.cursor.fetchone():
-                # Name conflict - add timestamp
-                from datetime import datetime
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                new_name = f"{trash_item['name']}_restored_{timestamp}"
-            else:
-                new_name = trash_item['name']
+            file_id = self.cursor.lastrowid
+            self.connection.commit()
+            return file_id
             
-            # Restore to filesystem
-            self.cursor.execute('''
-                INSERT INTO filesystem (name, type, path, content, size)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                new_name,
-                trash_item['type'],
-                trash_item['original_path'],
-                trash_item['content'],
-                trash_item['size']
-            ))
-            
-            # Delete from trash
-            self.cursor.execute('DELETE FROM trash WHERE id = ?', (trash_id,))
+        except Exception as e:
+            print(f"Error creating file: {e}")
+            self.connection.rollback()
+            return None
             
+    def gc_blobs(self):
+        """Delete blobs no row references any more"""
+        try:
+            self.cursor.execute('DELETE FROM blobs WHERE refcount <= 0')
+            count = self.cursor.rowcount
             self.connection.commit()
-            return True, new_name
+            return count
             
         except Exception as e:
-            print(f"Error restoring from trash: {e}")
+            print(f"Error collecting blobs: {e}")
             self.connection.rollback()
-            return False, None
+            return 0
             
     def empty_trash(self, user=None):
         """Empty trash for a specific user or all users"""
@@ -286,14 +2658,16 @@ class DatabaseManager:
     def get_trash_items(self, user=None, limit=100):
         """Get items in trash"""
         try:
+            # Only top-level entries; trashed subtrees travel with their root
             query = '''
                 SELECT id, name, type, original_path, size, deleted_by, deleted_at, expires_at
                 FROM trash
+                WHERE (group_id IS NULL OR group_id = id)
             '''
             params = []
             
             if user:
-                query += ' WHERE deleted_by = ?'
+                query += ' AND deleted_by = ?'
                 params.append(user)
                 
             query += ' ORDER BY deleted_at DESC LIMIT ?'
@@ -306,10 +2680,181 @@ class DatabaseManager:
             print(f"Error getting trash items: {e}")
             return []
             
+    def iter_keyset(self, query, params, sort_key, descending=False, page_size=None):
+        """Yield the rows of query lazily, a page at a time
+        
+        query is a "SELECT ... FROM ... WHERE ..." selecting id and the
+        NOT NULL column sort_key. Pages continue after the last
+        (sort_key, id) seen instead of using OFFSET, so every page is one
+        index seek no matter how deep the caller has read.
+        """
+        page_size = page_size or self.PAGE_SIZE
+        order = 'DESC' if descending else 'ASC'
+        after = '<' if descending else '>'
+        last = None
+        
+        while True:
+            page_query, page_params = query, list(params)
+            if last is not None:
+                page_query += f' AND ({sort_key}, id) {after} (?, ?)'
+                page_params.extend(last)
+            page_query += f' ORDER BY {sort_key} {order}, id {order} LIMIT ?'
+            page_params.append(page_size)
+            
+            # A private cursor, so callers can use self.cursor between rows
+            rows = self.connection.execute(page_query, page_params).fetchall()
+            yield from rows
+            
+            if len(rows) < page_size:
+                return
+            last = (rows[-1][sort_key], rows[-1]['id'])
+            
+    def iter_trash_items(self, user=None, page_size=None):
+        """Yield top-level trash entries, newest first"""
+        query = '''
+            SELECT id, name, type, original_path, size, deleted_by, deleted_at, expires_at
+            FROM trash
+            WHERE (group_id IS NULL OR group_id = id)
+        '''
+        params = []
+        
+        if user:
+            query += ' AND deleted_by = ?'
+            params.append(user)
+            
+        return self.iter_keyset(query, params, 'deleted_at', True, page_size)
+        
+    def iter_logs(self, condition=None, params=(), descending=False, page_size=None,
+                  as_json=False):
+        """Yield system_log entries in time order
+        
+        condition is an optional SQL filter on system_log columns (see
+        log_condition()). With as_json each row also has a 'line' column
+        holding the entry as one line of JSON.
+        """
+        columns = 'id, event_type, event_data, severity, timestamp'
+        if as_json:
+            columns += ', ' + LOG_JSON_LINE
+        query = f'SELECT {columns} FROM system_log WHERE 1'
+        if condition:
+            query += f' AND ({condition})'
+            
+        return self.iter_keyset(query, params, 'timestamp', descending, page_size)
+        
+    def follow_logs(self, condition=None, params=(), after_id=None, poll_interval=0.5,
+                    as_json=False):
+        """Yield system_log entries as other connections commit them, forever
+        
+        Starts after after_id (default: the newest entry now). While idle it
+        only polls PRAGMA data_version; when that changes, it reads the new
+        id range once through the primary key, so no row is scanned twice
+        even when condition filters most of them out.
+        """
+        connection = self.connection
+        last_id = connection.execute('SELECT IFNULL(MAX(id), 0) FROM system_log').fetchone()[0]
+        if after_id is not None:
+            last_id = after_id
+            
+        columns = 'id, event_type, event_data, severity, timestamp'
+        if as_json:
+            columns += ', ' + LOG_JSON_LINE
+        query = f'SELECT {columns} FROM system_log WHERE id > ? AND id <= ?'
+        if condition:
+            query += f' AND ({condition})'
+        query += ' ORDER BY id LIMIT ?'
+        
+        data_version = None
+        while True:
+            version = connection.execute('PRAGMA data_version').fetchone()[0]
+            if version == data_version:
+                time.sleep(poll_interval)
+                continue
+            data_version = version
+            
+            newest = connection.execute('SELECT IFNULL(MAX(id), 0) FROM system_log').fetchone()[0]
+            while last_id < newest:
+                rows = connection.execute(query, (last_id, newest, *params, self.PAGE_SIZE)).fetchall()
+                yield from rows
+                if len(rows) < self.PAGE_SIZE:
+                    break
+                last_id = rows[-1]['id']
+            last_id = max(last_id, newest)
+            
+    def log_condition(self, since=None, until=None, severities=None, events=None):
+        """SQL filter and parameters for iter_logs() and follow_logs()
+        
+        since/until are timestamps in the stored format (UTC
+        'YYYY-MM-DD HH:MM:SS'); until is exclusive. An event ending in '*'
+        matches a prefix, which still uses idx_system_log_event.
+        Returns (condition or None, params).
+        """
+        clauses = []
+        params = []
+        
+        if since:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until:
+            clauses.append('timestamp < ?')
+            params.append(until)
+            
+        if severities:
+            clauses.append(f"severity IN ({', '.join('?' * len(severities))})")
+            params.extend(severities)
+            
+        if events:
+            matches = []
+            for event in events:
+                matches.append('event_type GLOB ?' if event.endswith('*') else 'event_type = ?')
+                params.append(event)
+            clauses.append('(' + ' OR '.join(matches) + ')')
+            
+        return (' AND '.join(clauses) or None), params
+        
+    def iter_directory(self, full_path, item_type=None, page_size=None):
+        """Yield the entries of a directory by name (nothing if missing)"""
+        query = '''
+            SELECT id, name, type, size, modified_at, owner, permissions
+            FROM filesystem
+        '''
+        if split_path(full_path)[1]:
+            parent_id = self.resolve_path(full_path, 'directory')
+            if parent_id is None:
+                return iter(())
+            query += ' WHERE parent_id = ?'
+            params = [parent_id]
+        else:
+            query += " WHERE parent_id IS NULL AND path = '/'"
+            params = []
+            
+        if item_type:
+            query += ' AND type = ?'
+            params.append(item_type)
+            
+        return self.iter_keyset(query, params, 'name', False, page_size)
+        
     def get_trash_size(self, user=None):
         """Get total size of items in trash"""
+        return self.get_trash_stats(user)['total_size']
+        
+    def get_trash_count(self, user=None):
+        """Get the number of top-level entries in trash"""
+        return self.get_trash_stats(user)['entries']
+        
+    def get_trash_stats(self, user=None):
+        """Trash totals from the trash_stats aggregate table
+        
+        Returns a dict with entries (top-level, as listed), items (every
+        trashed row), files and directories (top-level, by type),
+        total_size and the oldest/newest deletion times.
+        """
+        stats = {'entries': 0, 'items': 0, 'files': 0, 'directories': 0,
+                 'total_size': 0, 'oldest': None, 'newest': None}
         try:
-            query = 'SELECT SUM(size) as total_size FROM trash'
+            query = '''
+                SELECT type, entry_count, item_count, total_size, oldest, newest
+                FROM trash_stats
+            '''
             params = []
             
             if user:
@@ -317,29 +2862,475 @@ class DatabaseManager:
                 params.append(user)
                 
             self.cursor.execute(query, params)
-            result = self.cursor.fetchone()
-            return result['total_size'] or 0
+            for row in self.cursor.fetchall():
+                stats['entries'] += row['entry_count']
+                stats['items'] += row['item_count']
+                stats['total_size'] += row['total_size']
+                if row['type'] == 'file':
+                    stats['files'] += row['entry_count']
+                elif row['type'] == 'directory':
+                    stats['directories'] += row['entry_count']
+                if row['oldest'] and (not stats['oldest'] or row['oldest'] < stats['oldest']):
+                    stats['oldest'] = row['oldest']
+                if row['newest'] and (not stats['newest'] or row['newest'] > stats['newest']):
+                    stats['newest'] = row['newest']
+                    
+        except Exception as e:
+            print(f"Error getting trash statistics: {e}")
+        return stats
+        
+    def get_filesystem_stats(self):
+        """Map entry type -> (count, total size) from filesystem_stats"""
+        try:
+            self.cursor.execute('SELECT type, item_count, total_size FROM filesystem_stats')
+            return {row['type']: (row['item_count'], row['total_size'])
+                    for row in self.cursor.fetchall()}
+        except Exception as e:
+            print(f"Error getting filesystem statistics: {e}")
+            return {}
             
+    def get_row_counts(self):
+        """Map table name -> row count from the row_counts table"""
+        try:
+            self.cursor.execute('SELECT table_name, row_count FROM row_counts')
+            return {row['table_name']: row['row_count'] for row in self.cursor.fetchall()}
         except Exception as e:
-            print(f"Error getting trash size: {e}")
-            return 0
+            print(f"Error getting row counts: {e}")
+            return {}
             
-    def cleanup_expired_trash(self):
-        """Clean up expired trash items (older than 30 days)"""
+    def table_names(self):
+        """Map table name -> whether it is a virtual table, in schema order"""
+        self.cursor.execute('''
+            SELECT name, sql LIKE 'CREATE VIRTUAL TABLE%' AS virtual
+            FROM sqlite_master WHERE type = 'table'
+        ''')
+        return {row['name']: bool(row['virtual']) for row in self.cursor.fetchall()}
+        
+    def get_planner_estimates(self):
+        """Map table name -> row estimate from sqlite_stat1 (empty before ANALYZE)"""
         try:
+            # The first number of each stat is the table's row count
             self.cursor.execute('''
-                DELETE FROM trash 
-                WHERE expires_at < datetime('now')
+                SELECT tbl, MAX(CAST(stat AS INTEGER)) AS row_estimate
+                FROM sqlite_stat1 GROUP BY tbl
             ''')
+        except sqlite3.OperationalError:
+            return {}
+        return {row['tbl']: row['row_estimate'] for row in self.cursor.fetchall()}
+        
+    def planner_stats_stale(self, tables, counters, estimates):
+        """Whether sqlite_stat1 no longer describes the tables
+        
+        Stale when there are no statistics, when a table missing from them
+        (ANALYZE leaves out empty tables) has rows now, or when a table with
+        a maintained counter has drifted by more than STATS_DRIFT.
+        """
+        if not estimates:
+            return True
+        for table, virtual in tables.items():
+            if virtual or table.startswith('sqlite_'):
+                continue
+            estimate = estimates.get(table)
+            if table in counters:
+                low, high = sorted((estimate or 0, counters[table]))
+                if high > low * self.STATS_DRIFT:
+                    return True
+            elif estimate is None:
+                self.cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{table}")')
+                if self.cursor.fetchone()[0]:
+                    return True
+        return False
+        
+    def analyze(self, limit=ANALYZE_LIMIT):
+        """Refresh the planner statistics from a bounded sample"""
+        self.cursor.execute(f'PRAGMA analysis_limit = {int(limit)}')
+        self.cursor.execute('ANALYZE')
+        self.connection.commit()
+        
+    def estimate_row_counts(self):
+        """Map table name -> (rows, source) without counting any large table
+        
+        source is 'counter' for tables kept in row_counts, 'estimate' for
+        sqlite_stat1 planner statistics (refreshed by a sampled ANALYZE
+        when stale), 'exact' for the small sqlite_* bookkeeping tables and
+        None, with rows None, for virtual tables.
+        """
+        tables = self.table_names()
+        counters = self.get_row_counts()
+        estimates = self.get_planner_estimates()
+        if self.planner_stats_stale(tables, counters, estimates):
+            try:
+                self.analyze()
+                estimates = self.get_planner_estimates()
+            except sqlite3.Error as e:
+                # Read-only or busy; the old statistics are still a guide
+                print(f"Could not refresh planner statistics: {e}")
+                
+        counts = {}
+        for table, virtual in tables.items():
+            if table in counters:
+                counts[table] = (counters[table], 'counter')
+            elif virtual:
+                counts[table] = (None, None)
+            elif table.startswith('sqlite_'):
+                self.cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+                counts[table] = (self.cursor.fetchone()[0], 'exact')
+            else:
+                counts[table] = (estimates.get(table, 0), 'estimate')
+        return counts
+        
+    def exact_row_counts(self, tables=None, threads=None):
+        """Map table name -> COUNT(*) for tables (default all), counted concurrently
+        
+        Every worker thread counts on its own read-only connection, and
+        sqlite3 releases the GIL while a count runs, so large tables are
+        counted side by side on a multi-core machine.
+        """
+        tables = list(self.table_names() if tables is None else tables)
+        threads = min(threads or DEFAULT_THREADS, len(tables) or 1)
+        local = threading.local()
+        readers = []
+        
+        def count(table):
+            connection = getattr(local, 'connection', None)
+            if connection is None:
+                connection = local.connection = self.pool.open(read_only=True)
+                readers.append(connection)
+            return connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
             
-            count = self.cursor.rowcount
-            self.connection.commit()
-            return count
+        try:
+            counts = {}
+            for table, rows in prefetch(count, tables, threads):
+                if isinstance(rows, Exception):
+                    raise rows
+                counts[table] = rows
+            return counts
+        finally:
+            for connection in readers:
+                connection.close()
+                
+    @contextmanager
+    def time_box(self, budget=None, stop=None, steps=None):
+        """Interrupt the statements run inside after budget seconds or on stop
+        
+        Yields a dict whose 'interrupted' turns true if that happened. The
+        interrupted statement's error is swallowed and its transaction
+        rolled back, so callers only need to check the flag.
+        """
+        connection = self.connection
+        deadline = time.monotonic() + budget if budget else None
+        box = {'interrupted': False}
+        
+        def check():
+            if (stop is not None and stop.is_set()) or (deadline and time.monotonic() > deadline):
+                box['interrupted'] = True
+                return 1
+            return 0
+            
+        connection.set_progress_handler(check, steps or self.PROGRESS_STEPS)
+        try:
+            yield box
+        except sqlite3.OperationalError:
+            if not box['interrupted']:
+                raise
+            if connection.in_transaction:
+                connection.rollback()
+        finally:
+            connection.set_progress_handler(None, 0)
+            
+    def maintenance_state(self):
+        """What plan_maintenance() decides on: page counts, WAL size, statistics"""
+        state = {}
+        for pragma in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum'):
+            self.cursor.execute(f'PRAGMA {pragma}')
+            state[pragma] = self.cursor.fetchone()[0]
+            
+        wal_path = self.db_path + '-wal'
+        state['wal_bytes'] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        state['stale_stats'] = self.planner_stats_stale(
+            self.table_names(), self.get_row_counts(), self.get_planner_estimates())
+        state['last_quick_check'] = self.get_system_info('last_quick_check')
+        return state
+        
+    def plan_maintenance(self, state=None):
+        """List the (task, reason) pairs worth running now, in MAINTENANCE_TASKS order"""
+        state = state or self.maintenance_state()
+        plan = []
+        
+        last_check = timestamp_seconds(state['last_quick_check'])
+        if time.time() - last_check > self.QUICK_CHECK_DAYS * 86400:
+            plan.append(('quick_check', 'never checked' if not last_check
+                         else f"last checked {state['last_quick_check']}"))
+            
+        if state['stale_stats']:
+            plan.append(('analyze', 'tables grew or shrank since the last ANALYZE'))
+            
+        free, pages = state['freelist_count'], state['page_count']
+        if free >= self.FREELIST_MIN_PAGES and free >= pages * self.FREELIST_RATIO:
+            reason = f"{free} of {pages} pages are free"
+            if state['auto_vacuum'] == 2:
+                plan.append(('incremental_vacuum', reason))
+            else:
+                plan.append(('vacuum', reason + ' and incremental vacuum is off'))
+                
+        if state['wal_bytes'] >= self.WAL_CHECKPOINT_BYTES:
+            plan.append(('checkpoint', f"the WAL holds {state['wal_bytes'] // 1024 // 1024} MB"))
+            
+        order = {task: index for index, task in enumerate(self.MAINTENANCE_TASKS)}
+        return sorted(plan, key=lambda item: order[item[0]])
+        
+    def run_maintenance(self, task, budget=None, pause=0.0, stop=None):
+        """Run one task of MAINTENANCE_TASKS; returns whether it finished
+        
+        With a budget, no statement holds the database for longer than
+        budget seconds: work is split into slices with pause seconds
+        between them, and a slice that overruns is rolled back and tried
+        smaller next. Setting stop interrupts the task at once. Without a
+        budget each task runs straight through.
+        """
+        if task not in self.MAINTENANCE_TASKS:
+            raise ValueError(f"Unknown maintenance task '{task}'")
+        if self.connection.savepoints or self.connection.in_transaction:
+            raise ValueError("Maintenance cannot run inside a transaction")
+            
+        if task == 'quick_check':
+            return self.maintain_quick_check(stop)
+        if task == 'analyze':
+            return self.maintain_analyze(budget, pause, stop)
+        if task == 'optimize':
+            return self.maintain_optimize(budget, stop)
+        if task == 'incremental_vacuum':
+            return self.maintain_incremental_vacuum(budget, pause, stop)
+        if task == 'checkpoint':
+            return self.maintain_checkpoint(budget)
+        return self.maintain_vacuum()
+        
+    def maintain_quick_check(self, stop=None):
+        """PRAGMA quick_check one table at a time, resuming where stop left off
+        
+        Only reads, which never hold up writers in WAL mode, so there is no
+        time budget. Raises sqlite3.DatabaseError on the first problem.
+        """
+        if not self.quick_check_pending:
+            self.quick_check_pending = [
+                table for table, virtual in self.table_names().items() if not virtual]
+                
+        while self.quick_check_pending:
+            table = self.quick_check_pending[0]
+            with self.time_box(stop=stop) as box:
+                self.cursor.execute(f'PRAGMA quick_check("{table}")')
+                result = [row[0] for row in self.cursor.fetchall()]
+            if box['interrupted']:
+                return False
+            if result != ['ok']:
+                self.quick_check_pending = []
+                raise sqlite3.DatabaseError(f"quick_check failed on {table}: {result[0]}")
+            self.quick_check_pending.pop(0)
+            
+        self.set_system_info('last_quick_check', timestamp_text(time.time()))
+        return True
+        
+    def maintain_analyze(self, budget=None, pause=0.0, stop=None):
+        """Sampled ANALYZE of each table, sampling less when a table overruns"""
+        tables = [table for table, virtual in self.table_names().items()
+                  if not virtual and not table.startswith('sqlite_')]
+        finished = True
+        for table in tables:
+            limit = self.ANALYZE_LIMIT
+            while True:
+                self.cursor.execute(f'PRAGMA analysis_limit = {limit}')
+                with self.time_box(budget, stop) as box:
+                    self.cursor.execute(f'ANALYZE "{table}"')
+                if not box['interrupted']:
+                    break
+                if (stop is not None and stop.is_set()) or limit <= 100:
+                    finished = False
+                    break
+                limit //= 4
+            if stop is not None and stop.is_set():
+                return False
+            time.sleep(pause)
+        return finished
+        
+    def maintain_optimize(self, budget=None, stop=None):
+        """PRAGMA optimize with a bounded ANALYZE sample
+        
+        Before SQLite 3.46 it only looks at tables this connection has
+        queried, so it is most useful right before closing.
+        """
+        self.cursor.execute(f'PRAGMA analysis_limit = {self.ANALYZE_LIMIT}')
+        with self.time_box(budget, stop) as box:
+            self.cursor.execute('PRAGMA optimize')
+        return not box['interrupted']
+        
+    def maintain_incremental_vacuum(self, budget=None, pause=0.0, stop=None):
+        """Hand free pages back to the file system, a slice at a time"""
+        self.cursor.execute('PRAGMA auto_vacuum')
+        if self.cursor.fetchone()[0] != 2:
+            raise ValueError("Incremental vacuum is off; run the vacuum task once to enable it")
+            
+        # Slices aim at half the budget: halve the pages after an overrun,
+        # double them after a quick slice
+        pages = self.VACUUM_PAGES if budget else 0
+        while True:
+            self.cursor.execute('PRAGMA freelist_count')
+            if not self.cursor.fetchone()[0]:
+                return True
+                
+            # executescript() steps the pragma to completion; execute()
+            # would free a single page (0 pages means all of them)
+            started = time.monotonic()
+            with self.time_box(budget, stop, self.VACUUM_PROGRESS_STEPS) as box:
+                self.connection.executescript(f'PRAGMA incremental_vacuum({pages})')
+            if box['interrupted']:
+                if (stop is not None and stop.is_set()) or pages == 1:
+                    return False
+                pages //= 2
+                continue
+            if budget and time.monotonic() - started < budget / 2:
+                pages = min(pages * 2, self.VACUUM_MAX_PAGES)
+            time.sleep(pause)
+            
+    def maintain_checkpoint(self, budget=None):
+        """Copy the WAL into the database and shrink it; returns whether it did
+        
+        Time-boxed callers copy with a PASSIVE checkpoint, which never waits
+        for or blocks other connections, and then only truncate the WAL if
+        nobody is using it right now. Otherwise TRUNCATE waits its turn.
+        """
+        if budget:
+            self.cursor.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            busy, log_pages, checkpointed = self.cursor.fetchone()
+            if busy or log_pages != checkpointed:
+                return False
+            self.cursor.execute('PRAGMA busy_timeout = 0')
+            try:
+                self.cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                busy, log_pages, checkpointed = self.cursor.fetchone()
+            finally:
+                self.cursor.execute(f'PRAGMA busy_timeout = {int(self.pool.timeout * 1000)}')
+        else:
+            self.cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            busy, log_pages, checkpointed = self.cursor.fetchone()
+        return not busy and log_pages == checkpointed
+        
+    def maintain_vacuum(self):
+        """Rewrite the whole file with VACUUM, switching on incremental vacuum
+        
+        Holds the database for the whole rewrite and needs free disk space
+        for a copy, so this only runs when asked for.
+        """
+        self.cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self.cursor.execute('VACUUM')
+        return True
+        
+    def cleanup_expired_trash(self):
+        """Clean up expired trash items now"""
+        try:
+            return self.sweep_expired_trash()
             
         except Exception as e:
             print(f"Error cleaning up expired trash: {e}")
             self.connection.rollback()
             return 0
+            
+    def retention_setting(self, key, user_id=None):
+        """Numeric retention policy value (see RETENTION_DEFAULTS)"""
+        default = self.RETENTION_DEFAULTS[key]
+        value = None
+        if user_id is not None:
+            value = self.get_setting(key, None, user_id)
+        if value is None:
+            value = self.get_setting(key, default)
+        try:
+            return max(0, float(value))
+        except (TypeError, ValueError):
+            return default
+            
+    def count_expired_trash(self):
+        """Number of trash rows past their expiry time"""
+        self.cursor.execute("SELECT COUNT(*) FROM trash WHERE expires_at < datetime('now')")
+        return self.cursor.fetchone()[0]
+        
+    def sweep_expired_trash(self, batch_size=None, pause=0.0, stop=None):
+        """Delete expired trash rows, one short transaction per batch
+        
+        Rows go oldest expiry first and, within a trashed tree, root first,
+        so a tree leaves the listing in the first batch and the rest of it
+        drains behind. Returns the number of rows deleted.
+        """
+        batch_size = int(batch_size or self.retention_setting('trash_sweep_batch'))
+        deleted = 0
+        while not (stop and stop.is_set()):
+            self.cursor.execute('''
+                DELETE FROM trash WHERE id IN (
+                    SELECT id FROM trash
+                    WHERE expires_at < datetime('now')
+                    ORDER BY expires_at, id
+                    LIMIT ?
+                )
+            ''', (batch_size,))
+            count = self.cursor.rowcount
+            self.connection.commit()
+            deleted += count
+            
+            if count < batch_size:
+                break
+            # Let other writers (the GUI) take the lock between batches
+            time.sleep(pause)
+        return deleted
+        
+    def enforce_trash_quotas(self, batch_size=None, pause=0.0, stop=None):
+        """Evict each user's oldest trash entries until under their quota
+        
+        Whole entries (a trashed tree with everything in it) are evicted,
+        in batches like sweep_expired_trash(). Returns rows deleted.
+        """
+        batch_size = int(batch_size or self.retention_setting('trash_sweep_batch'))
+        
+        self.cursor.execute('''
+            SELECT trash_stats.deleted_by, SUM(trash_stats.total_size) AS total_size,
+                   users.id AS user_id
+            FROM trash_stats LEFT JOIN users ON users.username = trash_stats.deleted_by
+            GROUP BY trash_stats.deleted_by
+        ''')
+        over_quota = []
+        for row in self.cursor.fetchall():
+            quota = self.retention_setting('trash_quota_mb', row['user_id']) * 1024 * 1024
+            # Quotas are per user; trash with no owner is left to expiry
+            if row['deleted_by'] and quota and row['total_size'] > quota:
+                over_quota.append((row['deleted_by'], quota))
+                
+        deleted = 0
+        for user, quota in over_quota:
+            while (not (stop and stop.is_set()) and
+                   self.get_trash_size(user) > quota):
+                # Oldest top-level entry of this user
+                self.cursor.execute('''
+                    SELECT id FROM trash
+                    WHERE deleted_by = ? AND (group_id IS NULL OR group_id = id)
+                    ORDER BY deleted_at, id LIMIT 1
+                ''', (user,))
+                oldest = self.cursor.fetchone()
+                if not oldest:
+                    break
+                    
+                while not (stop and stop.is_set()):
+                    self.cursor.execute('''
+                        DELETE FROM trash WHERE id IN (
+                            SELECT id FROM trash WHERE id = ?
+                            UNION ALL
+                            SELECT id FROM trash WHERE group_id = ? AND id != ?
+                            LIMIT ?
+                        )
+                    ''', (oldest['id'],) * 3 + (batch_size,))
+                    count = self.cursor.rowcount
+                    self.connection.commit()
+                    deleted += count
+                    if count < batch_size:
+                        break
+                    time.sleep(pause)
+        return deleted
         
         # Create default users
         self.create_default_users()
@@ -392,23 +3383,114 @@ class DatabaseManager:
         ''', (username,))
         self.connection.commit()
         
-    def get_setting(self, key, default=None):
-        """Get system setting"""
-        self.cursor.execute('''
-            SELECT setting_value FROM settings 
-            WHERE user_id IS NULL AND setting_key = ?
-        ''', (key,))
-        result = self.cursor.fetchone()
-        return result[0] if result else default
+    def load_settings(self):
+        """Load every system and per-user setting into the cache"""
+        self.settings_watch.mark(self.connection)
+        self.cursor.execute('SELECT user_id, setting_key, setting_value FROM settings')
+        cache = {(row[0], row[1]): row[2] for row in self.cursor.fetchall()}
+        
+        with self.settings_lock:
+            # Writes not flushed yet still win over what is on disk
+            cache.update(self.pending_settings)
+            self.settings_cache = cache
+            
+    def refresh_settings(self):
+        """Reload the cache if another connection changed the database"""
+        if self.settings_cache is None or self.settings_watch.changed(self.connection):
+            self.load_settings()
+            
+    def get_setting(self, key, default=None, user_id=None):
+        """Get system setting (or a user's setting when user_id is given)"""
+        self.refresh_settings()
+        with self.settings_lock:
+            return self.settings_cache.get((user_id, key), default)
+        
+    def set_setting(self, key, value, user_id=None):
+        """Set system setting (or a user's setting when user_id is given)"""
+        if self.settings_cache is None:
+            self.load_settings()
+            
+        with self.settings_lock:
+            self.settings_cache[(user_id, key)] = value
+            first_pending = not self.pending_settings
+            self.pending_settings[(user_id, key)] = value
+            
+        if self.settings_flush_scheduler is None:
+            # No event loop to defer to (e.g. the CLI): write through
+            self.flush_settings()
+        elif first_pending:
+            self.settings_flush_scheduler(self.flush_settings)
+            
+    def flush_settings(self):
+        """Write all pending setting changes in a single transaction"""
+        with self.settings_lock:
+            pending, self.pending_settings = self.pending_settings, {}
+            
+        if not pending:
+            return 0
+            
+        try:
+            self.cursor.executemany('''
+                INSERT INTO settings (user_id, setting_key, setting_value)
+                VALUES (?, ?, ?)
+                ON CONFLICT (user_id, setting_key)
+                DO UPDATE SET setting_value = excluded.setting_value
+                ON CONFLICT (setting_key) WHERE user_id IS NULL
+                DO UPDATE SET setting_value = excluded.setting_value
+            ''', [(user_id, key, value) for (user_id, key), value in pending.items()])
+            self.connection.commit()
+            return len(pending)
+            
+        except Exception as e:
+            print(f"Error saving settings: {e}")
+            self.connection.rollback()
+            with self.settings_lock:
+                # Keep the changes queued for the next flush
+                for item, value in pending.items():
+                    self.pending_settings.setdefault(item, value)
+            return 0
+
+    def log_event(self, event_type, event_data=None, severity='info'):
+        """Queue a system event for the background log writer"""
+        return self.event_logger.log(event_type, event_data, severity)
         
-    def set_setting(self, key, value):
-        """Set system setting"""
+    def flush_events(self, timeout=5.0):
+        """Wait until all queued system events are on disk
+        
+        Inside transaction() the queued events are written as part of the
+        unit of work instead.
+        """
+        if self.connection.savepoints:
+            return self.event_logger.drain()
+        return self.event_logger.flush(timeout)
+
+    def start_boot(self, kind, fast_boot=False, mobile=False):
+        """Add the boot_metrics row of a boot that is starting; returns its id"""
         self.cursor.execute('''
-            INSERT OR REPLACE INTO settings (user_id, setting_key, setting_value)
-            VALUES (NULL, ?, ?)
-        ''', (key, value))
+            INSERT INTO boot_metrics (kind, fast_boot, mobile)
+            VALUES (?, ?, ?)
+        ''', (kind, int(fast_boot), int(mobile)))
         self.connection.commit()
-
+        return self.cursor.lastrowid
+        
+    def record_boot_milestone(self, boot_id, milestone, seconds):
+        """Store the time a boot took to reach one of BOOT_MILESTONES (first time only)"""
+        if milestone not in self.BOOT_MILESTONES:
+            raise ValueError(f"Unknown boot milestone '{milestone}'")
+        self.cursor.execute(f'''
+            UPDATE boot_metrics SET {milestone} = ?
+            WHERE id = ? AND {milestone} IS NULL
+        ''', (round(seconds, 3), boot_id))
+        self.connection.commit()
+        
+    def get_boot_metrics(self, limit=20):
+        """The most recent boots, newest first"""
+        self.cursor.execute('''
+            SELECT * FROM boot_metrics
+            ORDER BY id DESC LIMIT ?
+        ''', (limit,))
+        return self.cursor.fetchall()
+        
     def get_system_info(self, key, default=None):
         """Get system information"""
         self.cursor.execute('SELECT value FROM system_info WHERE key = ?', (key,))
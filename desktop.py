@@ -214,8 +214,7 @@ class Desktop:
     def get_trash_count(self):
         """Get number of items in trash for current user"""
         try:
-            items = self.os_app.db.get_trash_items(self.os_app.current_user)
-            return len(items)
+            return self.os_app.db.get_trash_count(self.os_app.current_user)
         except:
             return 0
             
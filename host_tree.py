@@ -0,0 +1,200 @@
+# host_tree.py - Walk and write host directory trees and tar streams
+import os
+import io
+import gzip
+import stat
+import tarfile
+import posixpath
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from parallel_gzip import ParallelGzipWriter
+
+# Worker threads when none are given
+DEFAULT_THREADS = min(8, os.cpu_count() or 1)
+
+# One entry of a tree: path is relative and '/'-separated, mtime is in
+# seconds since the epoch, and read() returns a file's body (None for
+# directories). read() may be called on any thread.
+TreeEntry = namedtuple('TreeEntry', 'path type size mtime read')
+
+def read_host_file(full_path):
+    with open(full_path, 'rb') as f:
+        return f.read()
+
+def constant(data):
+    return data
+
+def prefetch(function, items, threads=None, depth=None):
+    """Yield (item, function(item)) in order, computed on a thread pool
+
+    At most depth calls are in flight, so a huge tree is never read into
+    memory ahead of its consumer. An exception raised by function is
+    returned in place of its result. With one thread the calls are made
+    inline: handing small files to a single worker only adds GIL handoffs.
+    """
+    threads = threads or DEFAULT_THREADS
+    depth = depth or threads * 4
+
+    def call(item):
+        try:
+            return function(item)
+        except Exception as e:
+            return e
+
+    if threads == 1:
+        for item in items:
+            yield item, call(item)
+        return
+
+    pending = deque()
+    with ThreadPoolExecutor(threads) as pool:
+        for item in items:
+            pending.append((item, pool.submit(call, item)))
+            if len(pending) >= depth:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+def scan_host(root):
+    """Entries below a host directory, each directory before its contents
+
+    Uses os.scandir, so sizes and types come from one listing per
+    directory. Symbolic links and special files are left out.
+    """
+    stack = [('', root)]
+    while stack:
+        relative, directory = stack.pop()
+        with os.scandir(directory) as listing:
+            entries = sorted(listing, key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            path = posixpath.join(relative, entry.name) if relative else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                info = entry.stat(follow_symlinks=False)
+                yield TreeEntry(path, 'directory', 0, info.st_mtime, None)
+                subdirectories.append((path, entry.path))
+            elif entry.is_file(follow_symlinks=False):
+                info = entry.stat(follow_symlinks=False)
+                yield TreeEntry(path, 'file', info.st_size, info.st_mtime,
+                                partial(read_host_file, entry.path))
+        stack.extend(reversed(subdirectories))
+
+def member_path(name):
+    """Relative path of a tar member, or None if it would escape the tree"""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        return None
+    return '/'.join(parts)
+
+def scan_tar(fileobj):
+    """Entries of a tar stream (optionally compressed), in archive order
+
+    The archive is read front to back, so a pipe works; file bodies are
+    read as their member goes by.
+    """
+    # tarfile's own stream reader stops after the first gzip member, and
+    # write_tar() output has one per block
+    if hasattr(fileobj, 'peek') and fileobj.peek(2)[:2] == b'\x1f\x8b':
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            path = member_path(member.name)
+            if path is None:
+                continue
+            if member.isdir():
+                yield TreeEntry(path, 'directory', 0, member.mtime, None)
+            elif member.isfile():
+                data = archive.extractfile(member).read()
+                yield TreeEntry(path, 'file', member.size, member.mtime,
+                                partial(constant, data))
+
+def same_file(full_path, entry):
+    """Whether a host file already matches an entry's size and mtime"""
+    try:
+        info = os.stat(full_path)
+    except OSError:
+        return False
+    return (stat.S_ISREG(info.st_mode) and info.st_size == entry.size
+            and int(info.st_mtime) == int(entry.mtime))
+
+def write_host(entries, root, threads=None, progress=None):
+    """Write entries below a host directory; returns a dict of counts
+
+    Files whose size and mtime already match are skipped. Bodies are
+    produced and written on a thread pool; directory mtimes are set last,
+    since writing into a directory changes its mtime.
+    """
+    counts = {'directories': 0, 'files': 0, 'skipped': 0, 'bytes': 0}
+    directories = []
+    os.makedirs(root, exist_ok=True)
+
+    def wanted(entries):
+        for entry in entries:
+            full_path = os.path.join(root, *entry.path.split('/'))
+            if entry.type == 'directory':
+                os.makedirs(full_path, exist_ok=True)
+                directories.append((full_path, entry.mtime))
+                counts['directories'] += 1
+            elif same_file(full_path, entry):
+                counts['skipped'] += 1
+            else:
+                yield full_path, entry
+
+    def write(item):
+        full_path, entry = item
+        data = entry.read()
+        with open(full_path, 'wb') as f:
+            f.write(data)
+        os.utime(full_path, (entry.mtime, entry.mtime))
+        return len(data)
+
+    for (full_path, entry), written in prefetch(write, wanted(entries), threads):
+        if isinstance(written, Exception):
+            raise written
+        counts['files'] += 1
+        counts['bytes'] += written
+        if progress:
+            progress(counts['files'] + counts['skipped'])
+
+    for full_path, mtime in reversed(directories):
+        os.utime(full_path, (mtime, mtime))
+    return counts
+
+def write_tar(entries, fileobj, compress=False, threads=None, progress=None):
+    """Write entries as a tar stream (gzipped if compress); returns counts
+
+    Bodies are produced on a thread pool ahead of the writer, which has to
+    emit them in order; gzip is done block-parallel by ParallelGzipWriter.
+    """
+    counts = {'directories': 0, 'files': 0, 'skipped': 0, 'bytes': 0}
+
+    def body(entry):
+        return entry.read() if entry.type == 'file' else None
+
+    if compress:
+        with ParallelGzipWriter(fileobj, threads) as gzipped:
+            return write_tar(entries, gzipped, False, threads, progress)
+
+    with tarfile.open(fileobj=fileobj, mode='w|') as archive:
+        for entry, data in prefetch(body, entries, threads):
+            if isinstance(data, Exception):
+                raise data
+            info = tarfile.TarInfo(entry.path)
+            info.mtime = int(entry.mtime)
+            if entry.type == 'directory':
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                archive.addfile(info)
+                counts['directories'] += 1
+            else:
+                info.size = len(data)
+                info.mode = 0o644
+                archive.addfile(info, io.BytesIO(data))
+                counts['files'] += 1
+                counts['bytes'] += len(data)
+            if progress:
+                progress(counts['files'] + counts['directories'])
+    return counts
@@ -1,4 +1,9 @@
 # main.py - Add mobile mode
+import time
+
+# Boot times are measured from here, before the heavy imports below
+PROCESS_STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
@@ -9,7 +14,6 @@ import logging
 from datetime import datetime
 import pygame
 from PIL import Image, ImageTk
-import time
 import threading
 import importlib.util
 import subprocess
@@ -41,6 +45,9 @@ class OSSimulator:
         self.db = DatabaseManager()
         self.first_boot = self.check_first_boot()
         
+        # Fast boot collapses the boot and restart animations
+        self.fast_boot = self.detect_fast_boot()
+        
         # Initialize theme manager
         self.theme_manager = ThemeManager()
         
@@ -70,6 +77,14 @@ class OSSimulator:
             
         self.root.configure(bg='black')
         
+        # Coalesce setting writes and flush them once the UI goes idle
+        self.db.settings_flush_scheduler = self.root.after_idle
+        
+        # Database maintenance waits for the user to go idle and stops
+        # at the first key press, click or mouse move
+        for sequence in ('<Any-KeyPress>', '<Any-ButtonPress>', '<Motion>'):
+            self.root.bind_all(sequence, self.db.maintainer.touch, add='+')
+        
         # Register with window manager
         self.window_manager.register_window('main', self.root)
         
@@ -90,6 +105,9 @@ class OSSimulator:
         if self.mobile_mode:
             self.setup_mobile_environment()
         
+        # Time this boot from process start to login and desktop
+        self.start_boot_timer('cold', PROCESS_STARTED)
+        
         # Boot screen
         self.show_boot_screen()
         
@@ -124,6 +142,47 @@ class OSSimulator:
             
         return False
         
+    def detect_fast_boot(self):
+        """Detect if the simulated boot and restart delays should be skipped"""
+        # Check command line argument
+        if '--fast-boot' in sys.argv:
+            return True
+            
+        # Check environment variable
+        if os.environ.get('PYOS_FASTBOOT', '0') == '1':
+            return True
+            
+        return self.db.get_setting('fast_boot', 'false') == 'true'
+        
+    def animation_delay(self, ms):
+        """Milliseconds to wait for a purely cosmetic step (none in fast boot)"""
+        return 0 if self.fast_boot else ms
+        
+    def start_boot_timer(self, kind, started=None):
+        """Start timing a boot; started is a time.perf_counter() value"""
+        self.boot_started = time.perf_counter() if started is None else started
+        try:
+            self.boot_id = self.db.start_boot(kind, self.fast_boot, self.mobile_mode)
+        except sqlite3.Error as e:
+            self.logger.error(f"Error recording boot: {e}")
+            self.boot_id = None
+            
+    def record_boot_milestone(self, milestone, started=None):
+        """Record the time to a milestone once Tk has drawn it and gone idle"""
+        started = self.boot_started if started is None else started
+        boot_id = self.boot_id
+        
+        def record():
+            seconds = time.perf_counter() - started
+            self.logger.info(f"Boot {boot_id}: {milestone} = {seconds:.3f}")
+            try:
+                self.db.record_boot_milestone(boot_id, milestone, seconds)
+            except sqlite3.Error as e:
+                self.logger.error(f"Error recording boot time: {e}")
+                
+        if boot_id is not None:
+            self.root.after_idle(record)
+            
     def setup_mobile_environment(self):
         """Setup mobile-specific environment"""
         # Set mobile-specific defaults
@@ -202,7 +261,7 @@ class OSSimulator:
             self.boot_text.insert(tk.END, "[   0.000000] Initializing kernel...\n")
         
         # Simulate boot process
-        self.root.after(1000, self.simulate_boot)
+        self.root.after(self.animation_delay(1000), self.simulate_boot)
         
     def simulate_boot(self):
         """Simulate boot process with mobile-specific messages"""
@@ -240,13 +299,13 @@ class OSSimulator:
                     self.boot_progress['value'] = (index + 1) * (100 / len(boot_messages))
                     update_boot(index + 1, time_offset)
                 
-                self.root.after(delay, show_message)
+                self.root.after(self.animation_delay(delay), show_message)
             else:
                 # Check if first boot
                 if self.first_boot:
-                    self.root.after(1000, self.show_setup_wizard)
+                    self.root.after(self.animation_delay(1000), self.show_setup_wizard)
                 else:
-                    self.root.after(1000, self.show_login_screen)
+                    self.root.after(self.animation_delay(1000), self.show_login_screen)
         
         update_boot()
         
@@ -271,6 +330,8 @@ class OSSimulator:
         else:
             self.show_desktop_login(theme)
             
+        self.record_boot_milestone('login_seconds')
+        
     def show_mobile_login(self, theme):
         """Show mobile-optimized login screen"""
         # Fullscreen mobile login
@@ -597,21 +658,38 @@ class OSSimulator:
         """Show desktop interface based on mode"""
         self.logger.info(f"Showing {'mobile' if self.mobile_mode else 'desktop'}")
         self.system_state = 'desktop'
+        loading = time.perf_counter()
         
         # Clear login screen
         self.login_frame.destroy()
         
+        # Serve settings from memory for the rest of the session
+        self.db.load_settings()
+        
+        # Expire and evict trash in the background while the desktop runs
+        self.db.trash_sweeper.start()
+        
+        # Check, analyze and compact the database while the user is idle
+        self.db.maintainer.start()
+        
         # Create appropriate interface
         if self.mobile_mode:
             self.desktop = MobileDesktop(self.root, self)
         else:
             self.desktop = Desktop(self.root, self)
             
+        self.record_boot_milestone('desktop_seconds')
+        self.record_boot_milestone('desktop_load_seconds', loading)
+            
     def restart_system(self):
         """Restart the system"""
         self.logger.info("System restart requested")
         self.system_state = 'restarting'
         
+        # Pick up a fast boot setting changed during the session
+        self.fast_boot = self.detect_fast_boot()
+        self.start_boot_timer('restart')
+        
         # Show restart screen
         self.show_restart_screen()
         
@@ -639,19 +717,22 @@ class OSSimulator:
         def animate_restart(index=0):
             if index < 6:  # Animate for 3 seconds
                 message_label.config(text=f"Restarting system{dots[index % 3]}")
-                self.root.after(500, lambda: animate_restart(index + 1))
+                self.root.after(self.animation_delay(500), lambda: animate_restart(index + 1))
             else:
-                # Log restart
+                # Log restart; persist it with pending settings in one commit
                 self.db.log_event('restart', {
                     'user': self.current_user,
                     'timestamp': datetime.now().isoformat()
                 })
+                with self.db.transaction():
+                    self.db.flush_settings()
+                    self.db.flush_events()
                 
                 # Play restart sound
                 self.play_system_sound('restart')
                 
                 # Simulate restart
-                self.root.after(1000, self.simulate_restart)
+                self.root.after(self.animation_delay(1000), self.simulate_restart)
         
         animate_restart()
         
@@ -696,7 +777,7 @@ class OSSimulator:
             bios_text.insert(tk.END, msg + "\n")
         
         # Simulate boot delay
-        self.root.after(3000, lambda: self.show_boot_screen())
+        self.root.after(self.animation_delay(3000), lambda: self.show_boot_screen())
         
     def show_shutdown_screen(self):
         """Display shutdown screen"""
@@ -740,6 +821,12 @@ class OSSimulator:
         # Play shutdown sound
         self.play_system_sound('shutdown')
         
+        # Persist setting changes and events still waiting to be written,
+        # together in one commit
+        with self.db.transaction():
+            self.db.flush_settings()
+            self.db.flush_events()
+        
         animate_shutdown()
         
     def show_safe_to_turn_off(self):
@@ -797,7 +884,7 @@ class OSSimulator:
             elif sound_type == 'login_success':
                 for _ in range(2):
                     self.root.bell()
-                    self.root.after(100)
+                    self.root.after(self.animation_delay(100))
             elif sound_type == 'error':
                 for _ in range(3):
                     self.root.bell()
@@ -809,7 +896,7 @@ class OSSimulator:
             elif sound_type == 'restart':
                 for _ in range(2):
                     self.root.bell()
-                    self.root.after(200)
+                    self.root.after(self.animation_delay(200))
                     
         except Exception as e:
             self.logger.error(f"Error playing sound: {e}")
@@ -862,6 +949,9 @@ class OSSimulator:
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.root.mainloop()
         
+        # Release every per-thread database connection
+        self.db.close()
+        
     def on_closing(self):
         """Handle window close event"""
         if messagebox.askyesno("Shutdown", "Are you sure you want to shut down?"):
@@ -2,19 +2,49 @@
 import argparse
 import sys
 import os
+import io
+import glob
 import sqlite3
 import json
+import csv
+import time
+import shlex
 from datetime import datetime
 import getpass
 import hashlib
+import shutil
+import itertools
+import operator
+import statistics
+from collections import defaultdict
+from contextlib import nullcontext, redirect_stderr, redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import host_tree
+from backup_chain import BackupChain
+from parallel_gzip import DEFAULT_THREADS, ParallelGzipReader
+from database import HOT_QUERIES, DatabaseManager, find_query_plan_scans, join_path, parse_id_list, split_path
 
 class OSCLI:
-    def __init__(self):
-        self.db_path = 'system.db'
+    # Options that pick the action of commands without subcommands; they
+    # name the command in shell/batch timings
+    ACTION_OPTIONS = {
+        'user': ('list', 'add', 'delete', 'modify', 'reset_password'),
+        'trash': ('list', 'empty', 'restore', 'delete', 'cleanup', 'size', 'stats'),
+        'mode': ('mobile', 'desktop', 'status'),
+        'restore': ('list',),
+        'backup': ('incremental',),
+    }
+    
+    # Commands that cannot be fanned out over a fleet
+    FLEET_EXCLUDED = ('shell', 'reset-system', 'restore')
+    
+    def __init__(self, db_path='system.db', connect=True):
+        self.db_path = db_path
         self.setup_wizard_enabled = False
-        self.init_database_connection()
-        
-    def init_database_connection(self):
+        if connect:
+            self.init_database_connection()
+            
+    def init_database_connection(self, announce=True):
         """Initialize database connection"""
         try:
             # Check if database exists
@@ -23,10 +53,18 @@ class OSCLI:
                 print("Make sure the OS Simulator has been run at least once.")
                 sys.exit(1)
                 
-            self.conn = sqlite3.connect(self.db_path)
-            self.conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-            self.cursor = self.conn.cursor()
-            print(f"Connected to database: {self.db_path}")
+            # Share the simulator's WAL/busy-timeout setup so the CLI can
+            # run next to a live GUI without "database is locked"
+            self.db = DatabaseManager(self.db_path)
+            self.conn = self.db.connect()
+            self.cursor = self.db.cursor
+            
+            # Bring databases written by older versions up to date
+            self.db.migrate_schema()
+            self.conn.commit()
+            # On stderr, so machine-readable output (--format jsonl) stays clean
+            if announce:
+                print(f"Connected to database: {self.db_path}", file=sys.stderr)
         except Exception as e:
             print(f"Error connecting to database: {e}")
             sys.exit(1)
@@ -35,8 +73,8 @@ class OSCLI:
         """Hash password for storage"""
         return hashlib.sha256(password.encode()).hexdigest()
         
-    def run(self):
-        """Main CLI entry point"""
+    def build_parser(self):
+        """Argument parser for every command"""
         parser = argparse.ArgumentParser(
             description='Python OS Simulator CLI Management Tool',
             formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -49,17 +87,38 @@ Examples:
   %(prog)s reset-settings             # Reset all settings to default
   %(prog)s status                     # Show system status
   %(prog)s backup --output backup.db  # Backup system database
+  %(prog)s backup --incremental       # Add changed pages to ./backups
+  %(prog)s restore --input backups --sequence 3  # Restore a point in the chain
+  %(prog)s export --table system_log --output log.jsonl  # Export a table
+  %(prog)s import --table users --input users.csv --on-conflict ignore
+  %(prog)s filesystem import ~/docs /home/admin/docs  # Copy a host tree in
+  %(prog)s filesystem export /home/admin out.tar.gz --tar  # Archive a subtree
   %(prog)s trash --list              # List items in trash
   %(prog)s trash --empty             # Empty trash
   %(prog)s trash --restore 5         # Restore item with ID 5
+  %(prog)s trash --restore 1,4,10-20 # Restore several items at once
+  %(prog)s trash --delete 3-9        # Permanently delete items 3 to 9
   %(prog)s trash --cleanup           # Clean up expired items
   %(prog)s trash --size              # Show trash size
   %(prog)s mode --mobile          # Switch to mobile mode
   %(prog)s mode --desktop         # Switch to desktop mode
   %(prog)s mode --status          # Check current mode
+  %(prog)s batch provision.pos --transaction  # Run a script of commands
+  %(prog)s shell                  # Interactive prompt on one connection
+  %(prog)s --db /srv/os2/system.db status     # Manage another instance
+  %(prog)s --fleet '/srv/*/system.db' backup  # Back up every instance
             '''
         )
         
+        # Which instance(s) to manage
+        parser.add_argument('--db', default='system.db',
+                          help='Database of the instance to manage (default: system.db)')
+        parser.add_argument('--fleet', metavar='GLOB|MANIFEST',
+                          help='Run the command on every database matching a glob, or '
+                               'listed in a manifest file (one path per line)')
+        parser.add_argument('--jobs', type=int, default=min(8, os.cpu_count() or 1),
+                          help='Instances handled at once with --fleet')
+        
         # Create subparsers for different commands
         subparsers = parser.add_subparsers(dest='command', help='Command to execute')
         
@@ -82,6 +141,9 @@ Examples:
                                help='Make user administrator (for --add/--modify)')
         user_parser.add_argument('--name', help='Full name for user')
         user_parser.add_argument('--email', help='Email for user')
+        user_parser.add_argument('--password',
+                               help='Password (for --add/--reset-password) instead of '
+                                    'prompting; other prompts are skipped too')
         
         # Settings reset command
         settings_parser = subparsers.add_parser('reset-settings', 
@@ -91,21 +153,69 @@ Examples:
         
         # Status command
         status_parser = subparsers.add_parser('status', help='Show system status')
+        status_group = status_parser.add_mutually_exclusive_group()
+        status_group.add_argument('--fast', dest='counts', action='store_const', const='fast',
+                                help='Read row counts from maintained counters (default)')
+        status_group.add_argument('--exact', dest='counts', action='store_const', const='exact',
+                                help='Count rows, concurrently on read-only connections')
+        status_parser.add_argument('--threads', type=int, default=host_tree.DEFAULT_THREADS,
+                                 help='Connections counting rows with --exact')
         
         # Backup command
         backup_parser = subparsers.add_parser('backup', help='Backup system')
-        backup_parser.add_argument('--output', default='backup.db',
-                                 help='Output backup file name')
+        backup_parser.add_argument('--output',
+                                 help='Output backup file name (backup chain directory '
+                                      'with --incremental; default: backup.db / backups)')
         backup_parser.add_argument('--compress', action='store_true',
                                  help='Compress backup file')
+        backup_parser.add_argument('--incremental', action='store_true',
+                                 help='Store only pages changed since the last backup in the chain')
+        backup_parser.add_argument('--full', action='store_true',
+                                 help='With --incremental, start the chain over with a new base')
+        backup_parser.add_argument('--pages', type=int, default=DatabaseManager.BACKUP_PAGES,
+                                 help='Pages copied per step (-1 copies all at once)')
+        backup_parser.add_argument('--sleep', type=float, default=DatabaseManager.BACKUP_PAUSE,
+                                 help='Seconds to pause between steps')
+        backup_parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                                 help='Compression threads')
         
         # Restore command
         restore_parser = subparsers.add_parser('restore', help='Restore system from backup')
         restore_parser.add_argument('--input', required=True,
-                                  help='Input backup file name')
+                                  help='Input backup file name or backup chain directory')
+        restore_parser.add_argument('--sequence', type=int,
+                                  help='Backup in the chain to restore (default: newest)')
+        restore_parser.add_argument('--list', action='store_true',
+                                  help='List the backups in a chain instead of restoring')
+        restore_parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                                  help='Decompression threads')
         restore_parser.add_argument('--force', action='store_true',
                                   help='Force restore without confirmation')
         
+        # Export/import commands
+        export_parser = subparsers.add_parser('export', help='Export a table to JSONL or CSV')
+        export_parser.add_argument('--table', required=True, choices=DatabaseManager.EXPORT_TABLES,
+                                 help='Table to export')
+        export_parser.add_argument('--format', choices=['jsonl', 'csv'],
+                                 help='Output format (default: from the file extension, else jsonl)')
+        export_parser.add_argument('--output', default='-',
+                                 help='Output file (default: standard output)')
+        
+        import_parser = subparsers.add_parser('import', help='Import a table from JSONL or CSV')
+        import_parser.add_argument('--table', required=True, choices=DatabaseManager.EXPORT_TABLES,
+                                 help='Table to import into')
+        import_parser.add_argument('--format', choices=['jsonl', 'csv'],
+                                 help='Input format (default: from the file extension, else jsonl)')
+        import_parser.add_argument('--input', default='-',
+                                 help='Input file (default: standard input)')
+        import_parser.add_argument('--on-conflict', choices=['abort', 'ignore', 'update'],
+                                 help='When a row collides with an existing one: stop, skip it, '
+                                      'or overwrite the existing row (default: ignore for '
+                                      'filesystem, which every system starts with rows in; '
+                                      'else abort)')
+        import_parser.add_argument('--batch', type=int, default=DatabaseManager.IMPORT_BATCH,
+                                 help='Rows per transaction')
+        
         # Log command
         log_parser = subparsers.add_parser('logs', help='View system logs')
         log_parser.add_argument('--type', choices=['system', 'login', 'error', 'all'],
@@ -114,6 +224,22 @@ Examples:
                               help='Number of log entries to show')
         log_parser.add_argument('--tail', action='store_true',
                               help='Show only recent logs')
+        log_parser.add_argument('--follow', '-f', action='store_true',
+                              help='Keep printing new log entries as they are written')
+        log_parser.add_argument('--since', type=self.log_time,
+                              help='Only entries at or after this time (UTC "YYYY-MM-DD[ HH:MM[:SS]]", '
+                                   'or an age such as 30m, 2h, 7d)')
+        log_parser.add_argument('--until', type=self.log_time,
+                              help='Only entries before this time (same formats as --since)')
+        log_parser.add_argument('--severity', action='append', metavar='LEVEL',
+                              help='Only entries with this severity (repeatable, or comma-separated)')
+        log_parser.add_argument('--event', action='append', metavar='TYPE',
+                              help='Only this event type; "prefix*" matches a prefix '
+                                   '(repeatable, or comma-separated)')
+        log_parser.add_argument('--format', choices=['text', 'jsonl'], default='text',
+                              help='Output format (jsonl: one JSON object per line)')
+        log_parser.add_argument('--interval', type=float, default=0.5,
+                              help='Seconds between checks for new entries with --follow')
         
         # Filesystem command
         fs_parser = subparsers.add_parser('filesystem', help='Manage virtual filesystem')
@@ -137,8 +263,59 @@ Examples:
         fs_delete_parser.add_argument('--force', action='store_true',
                                     help='Force deletion')
         
+        # Search names and contents
+        fs_search_parser = fs_subparsers.add_parser('search', help='Search file names and contents')
+        fs_search_parser.add_argument('query', help='Words to search for')
+        fs_search_parser.add_argument('--path', default='/',
+                                    help='Only search below this directory')
+        fs_search_parser.add_argument('--limit', type=int, default=50,
+                                    help='Maximum number of results')
+        fs_search_parser.add_argument('--names', action='store_true',
+                                    help='Match file names only')
+        
+        # Move/rename file or directory
+        fs_move_parser = fs_subparsers.add_parser('move', help='Move or rename file or directory')
+        fs_move_parser.add_argument('source', help='Path to move')
+        fs_move_parser.add_argument('destination',
+                                  help='New path, or an existing directory to move into')
+        
+        # Copy whole host trees in and out
+        fs_import_parser = fs_subparsers.add_parser(
+            'import', help='Copy a host directory (or tar archive) into the virtual filesystem')
+        fs_import_parser.add_argument('source',
+                                    help='Host directory, or a tar archive with --tar '
+                                         '(- reads the archive from standard input)')
+        fs_import_parser.add_argument('path', help='Virtual directory to copy into')
+        fs_import_parser.add_argument('--tar', action='store_true',
+                                    help='Read a tar archive (plain, gzip, bzip2 or xz)')
+        fs_import_parser.add_argument('--owner', default='admin',
+                                    help='Owner of the new entries')
+        fs_import_parser.add_argument('--threads', type=int, default=host_tree.DEFAULT_THREADS,
+                                    help='Threads reading and compressing files')
+        fs_import_parser.add_argument('--batch', type=int, default=DatabaseManager.TREE_BATCH,
+                                    help='Files per transaction')
+        
+        fs_export_parser = fs_subparsers.add_parser(
+            'export', help='Copy a virtual directory to a host directory (or tar archive)')
+        fs_export_parser.add_argument('path', help='Virtual directory to copy')
+        fs_export_parser.add_argument('destination',
+                                    help='Host directory, or a tar archive with --tar '
+                                         '(- writes the archive to standard output; '
+                                         '.gz/.tgz names are gzipped)')
+        fs_export_parser.add_argument('--tar', action='store_true',
+                                    help='Write a tar archive')
+        fs_export_parser.add_argument('--threads', type=int, default=host_tree.DEFAULT_THREADS,
+                                    help='Threads decompressing and writing files')
+        
         # System info command
         info_parser = subparsers.add_parser('info', help='Show detailed system information')
+        info_group = info_parser.add_mutually_exclusive_group()
+        info_group.add_argument('--fast', dest='counts', action='store_const', const='fast',
+                              help='Estimate row counts from counters and planner statistics')
+        info_group.add_argument('--exact', dest='counts', action='store_const', const='exact',
+                              help='Count rows, concurrently on read-only connections (default)')
+        info_parser.add_argument('--threads', type=int, default=host_tree.DEFAULT_THREADS,
+                               help='Connections counting rows')
         
         # Update command
         update_parser = subparsers.add_parser('update', help='Check for system updates')
@@ -149,14 +326,26 @@ Examples:
         repair_parser = subparsers.add_parser('repair', help='Repair system database')
         repair_parser.add_argument('--check', action='store_true',
                                  help='Check for issues without repairing')
+        
+        # Maintain command
+        maintain_parser = subparsers.add_parser('maintain', help='Run planned database maintenance')
+        maintain_parser.add_argument('--plan', action='store_true',
+                                   help='Show the state and plan without running anything')
+        maintain_parser.add_argument('--task', action='append', choices=DatabaseManager.MAINTENANCE_TASKS,
+                                   help='Run this task instead of the plan (repeatable; '
+                                        'vacuum rewrites the whole file)')
+        maintain_parser.add_argument('--budget', type=float, metavar='MS',
+                                   help='Hold the database at most MS milliseconds at a time')
 
         # Trash command
         trash_parser = subparsers.add_parser('trash', help='Trash management')
         trash_group = trash_parser.add_mutually_exclusive_group(required=True)
         trash_group.add_argument('--list', action='store_true', help='List trash items')
         trash_group.add_argument('--empty', action='store_true', help='Empty trash')
-        trash_group.add_argument('--restore', metavar='ID', type=int, help='Restore item by ID')
-        trash_group.add_argument('--delete', metavar='ID', type=int, help='Delete item permanently')
+        trash_group.add_argument('--restore', metavar='IDS', type=self.id_list,
+                               help='Restore items by ID (e.g. 5, 1,2,7 or 3-9)')
+        trash_group.add_argument('--delete', metavar='IDS', type=self.id_list,
+                               help='Delete items permanently (e.g. 5, 1,2,7 or 3-9)')
         trash_group.add_argument('--cleanup', action='store_true', help='Clean up expired items')
         trash_group.add_argument('--size', action='store_true', help='Show trash size')
         trash_group.add_argument('--stats', action='store_true', help='Show trash statistics')
@@ -171,6 +360,30 @@ Examples:
         mode_group.add_argument('--desktop', action='store_true', help='Switch to desktop mode')
         mode_group.add_argument('--status', action='store_true', help='Check current mode')
         
+        # Boot command
+        boot_parser = subparsers.add_parser('boot', help='Fast boot setting and boot times')
+        boot_parser.add_argument('--fast-boot', choices=['on', 'off'],
+                               help='Skip the simulated boot and restart delays (PYOS_FASTBOOT=1 '
+                                    'or main.py --fast-boot do so for one run)')
+        boot_parser.add_argument('--limit', type=int, default=20,
+                               help='Number of recent boots to show')
+        
+        # Many commands on one connection
+        shell_parser = subparsers.add_parser('shell', help='Interactive command prompt')
+        shell_parser.add_argument('--transaction', action='store_true',
+                                help='Run the session as one transaction, committed on exit')
+        
+        batch_parser = subparsers.add_parser('batch', help='Run pos commands from a file')
+        batch_parser.add_argument('script', help="One command per line, '#' comments "
+                                               "(- reads standard input)")
+        batch_parser.add_argument('--transaction', action='store_true',
+                                help='Run the whole script as one transaction')
+        
+        return parser
+        
+    def run(self):
+        """Main CLI entry point"""
+        parser = self.build_parser()
         
         # Parse arguments
         if len(sys.argv) == 1:
@@ -179,7 +392,25 @@ Examples:
             
         args = parser.parse_args()
         
-        # Execute command
+        if args.fleet:
+            self.run_fleet(args)
+            return
+            
+        self.db_path = args.db
+        self.init_database_connection()
+        self.execute(args, parser)
+        
+    def execute(self, args, parser):
+        """Execute a parsed command, including shell and batch"""
+        if args.command == 'shell':
+            self.run_shell(parser, args.transaction)
+        elif args.command == 'batch':
+            self.run_batch(parser, args.script, args.transaction)
+        else:
+            self.dispatch(args, parser)
+            
+    def dispatch(self, args, parser):
+        """Execute a parsed command"""
         if args.command == 'reset-system':
             self.reset_system(args.force)
         elif args.command == 'user':
@@ -187,23 +418,292 @@ Examples:
         elif args.command == 'reset-settings':
             self.reset_settings(args.force)
         elif args.command == 'status':
-            self.show_status()
+            self.show_status(args.counts == 'exact', args.threads)
         elif args.command == 'backup':
-            self.backup_system(args.output, args.compress)
+            if args.incremental:
+                self.backup_incremental(args.output or 'backups', args.full, args.pages, args.sleep,
+                                        args.threads)
+            else:
+                self.backup_system(args.output or 'backup.db', args.compress, args.pages, args.sleep,
+                                   args.threads)
         elif args.command == 'restore':
-            self.restore_system(args.input, args.force)
+            if args.list:
+                self.list_backups(args.input)
+            else:
+                self.restore_system(args.input, args.force, args.sequence, args.threads)
         elif args.command == 'logs':
-            self.view_logs(args.type, args.limit, args.tail)
+            self.view_logs(args)
+        elif args.command == 'export':
+            self.export_table(args.table, args.format, args.output)
+        elif args.command == 'import':
+            self.import_table(args.table, args.format, args.input, args.on_conflict, args.batch)
         elif args.command == 'filesystem':
             self.manage_filesystem(args)
         elif args.command == 'info':
-            self.show_system_info()
+            self.show_system_info(args.counts != 'fast', args.threads)
         elif args.command == 'update':
             self.check_updates(args.install)
         elif args.command == 'repair':
             self.repair_database(args.check)
+        elif args.command == 'boot':
+            self.manage_boot(args.fast_boot, args.limit)
+        elif args.command == 'maintain':
+            self.maintain_database(args.task, args.plan, args.budget)
+        elif args.command == 'trash':
+            self.manage_trash(args)
+        elif args.command == 'mode':
+            self.manage_mode(args)
         else:
             parser.print_help()
+            
+    def fleet_members(self, spec):
+        """Absolute database paths named by a --fleet glob or manifest file"""
+        paths = []
+        if os.path.isfile(spec) and not self.is_database(spec):
+            # Manifest: one path per line, relative to the manifest
+            base = os.path.dirname(os.path.abspath(spec))
+            with open(spec, encoding='utf-8') as f:
+                for line in f:
+                    line = line.split('#', 1)[0].strip()
+                    if line:
+                        paths.append(os.path.join(base, os.path.expanduser(line)))
+        else:
+            paths = sorted(glob.glob(os.path.expanduser(spec), recursive=True))
+            
+        members = []
+        for path in map(os.path.abspath, paths):
+            if path not in members:
+                members.append(path)
+        return members
+        
+    def is_database(self, path):
+        """Whether a file starts with the SQLite header"""
+        with open(path, 'rb') as f:
+            return f.read(16) == b'SQLite format 3\x00'
+            
+    def run_fleet(self, args):
+        """Run one command on every instance of a fleet, jobs at a time
+        
+        Output is streamed as each instance finishes, every line tagged
+        with its instance, followed by a summary table.
+        """
+        if args.command is None or args.command in self.FLEET_EXCLUDED:
+            print(f"Error: '{args.command}' cannot be run on a fleet.")
+            sys.exit(1)
+        if getattr(args, 'follow', False) or getattr(args, 'script', None) == '-' or \
+                getattr(args, 'output', None) == '-' or getattr(args, 'input', None) == '-':
+            print("Error: --follow and standard input/output cannot be used with --fleet.")
+            sys.exit(1)
+            
+        members = self.fleet_members(args.fleet)
+        if not members:
+            print(f"Error: No databases match '{args.fleet}'.")
+            sys.exit(1)
+            
+        # Members run in their own directories; files read by the command
+        # are still named relative to here
+        for name in ('script', 'input', 'source'):
+            if getattr(args, name, None):
+                setattr(args, name, os.path.abspath(getattr(args, name)))
+            
+        # Tags are paths relative to here, which keeps them short and unique
+        tags = {path: os.path.relpath(path) for path in members}
+        width = max(len(tag) for tag in tags.values())
+        jobs = max(1, min(args.jobs, len(members)))
+        print(f"Running '{self.command_name(args)}' on {len(members)} instance(s), "
+              f"{jobs} at a time", file=sys.stderr)
+        
+        results = {}
+        started = time.perf_counter()
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = [pool.submit(run_fleet_member, path, args) for path in members]
+            for future in as_completed(futures):
+                try:
+                    path, status, output, elapsed = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    path = members[futures.index(future)]
+                    status, output, elapsed = 1, f"✗ Worker failed: {e}\n", 0.0
+                results[path] = (status, output, elapsed)
+                for line in output.splitlines():
+                    print(f"[{tags[path]:<{width}}] {line}")
+                sys.stdout.flush()
+                
+        counts = self.print_fleet_summary(members, tags, results, time.perf_counter() - started, jobs)
+        if counts['errors'] or counts['failed']:
+            sys.exit(1)
+            
+    def print_fleet_summary(self, members, tags, results, wall, jobs):
+        """Table of every instance's outcome, in fleet order, plus totals
+        
+        Returns the number of instances per result ('ok', 'errors', 'failed').
+        """
+        width = max(12, max(len(tag) for tag in tags.values()))
+        print(f"\n{'Instance':<{width}} {'Result':<8} {'Seconds':>8} {'Size':>9}  Last message")
+        print("-" * (width + 60))
+        
+        counts = {'ok': 0, 'errors': 0, 'failed': 0}
+        total_size = 0
+        for path in members:
+            status, output, elapsed = results[path]
+            lines = [line.strip() for line in output.splitlines() if line.strip()]
+            # Commands report most failures by printing them, not by exiting
+            errors = [line for line in lines if '✗' in line or line.startswith('Error')]
+            result = 'failed' if status else 'errors' if errors else 'ok'
+            counts[result] += 1
+            
+            size = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal')
+                       if os.path.exists(path + suffix))
+            total_size += size
+            last = errors[-1] if errors else lines[-1] if lines else ''
+            last = last[last.find('✗'):] if '✗' in last else last
+            print(f"{tags[path]:<{width}} {result:<8} {elapsed:>8.2f} {self.format_size(size):>9}  "
+                  f"{last[:48]}")
+            
+        work = sum(elapsed for _, _, elapsed in results.values())
+        print("-" * (width + 60))
+        print(f"{len(members)} instance(s): {counts['ok']} ok, {counts['errors']} with errors, "
+              f"{counts['failed']} failed; {self.format_size(total_size)} in total")
+        print(f"{work:.2f}s of work in {wall:.2f}s with {jobs} job(s)")
+        return counts
+        
+    def command_name(self, args):
+        """Short name of a parsed command, such as 'user --add'"""
+        if getattr(args, 'fs_command', None):
+            return f"{args.command} {args.fs_command}"
+        for option in self.ACTION_OPTIONS.get(args.command, ()):
+            if getattr(args, option, None):
+                return f"{args.command} --{option.replace('_', '-')}"
+        return args.command
+        
+    def run_line(self, line, parser, timings):
+        """Run one shell/batch command line; returns False if it failed
+        
+        Commands run on this process's connection, so its prepared
+        statements are reused from one command to the next. Inside a
+        transaction each command is a savepoint: a command that rolls back
+        only undoes itself.
+        """
+        try:
+            tokens = shlex.split(line, comments=True)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+        if tokens[:1] == ['pos']:
+            tokens = tokens[1:]
+        if not tokens:
+            return True
+            
+        try:
+            # argparse exits on --help and on bad arguments
+            args = parser.parse_args(tokens)
+        except SystemExit as e:
+            return not e.code
+        if args.command in ('shell', 'batch'):
+            print(f"Error: '{args.command}' cannot be run from a shell or batch.")
+            return False
+        if args.fleet or args.db != parser.get_default('db'):
+            print("Error: --db and --fleet apply to the whole shell or batch.")
+            return False
+            
+        started = time.perf_counter()
+        try:
+            if self.conn.savepoints:
+                with self.db.transaction():
+                    self.dispatch(args, parser)
+            else:
+                self.dispatch(args, parser)
+            return True
+        except SystemExit as e:
+            return not e.code
+        except Exception as e:
+            print(f"✗ Error: {e}")
+            return False
+        finally:
+            timings[self.command_name(args)].append(time.perf_counter() - started)
+            
+    def run_batch(self, parser, script, transaction=False):
+        """Run the commands of a script file (or standard input) in order"""
+        source = sys.stdin if script == '-' else None
+        try:
+            if source is None:
+                source = open(script, encoding='utf-8')
+        except OSError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+            
+        timings = defaultdict(list)
+        failed = []
+        started = time.perf_counter()
+        try:
+            with self.db.transaction() if transaction else nullcontext():
+                for number, line in enumerate(source, 1):
+                    if not self.run_line(line, parser, timings):
+                        failed.append(number)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+                
+        self.print_timings(timings, time.perf_counter() - started)
+        if failed:
+            shown = ', '.join(map(str, failed[:10])) + (', ...' if len(failed) > 10 else '')
+            print(f"⚠️  {len(failed)} line(s) failed: {shown}", file=sys.stderr)
+            sys.exit(1)
+            
+    def run_shell(self, parser, transaction=False):
+        """Interactive prompt running pos commands on one connection"""
+        try:
+            import readline  # noqa: F401  (line editing and history)
+        except ImportError:
+            pass
+            
+        print("Python OS Simulator shell. Type a command without 'pos', "
+              "'help' for the list, 'timings' or 'exit'.")
+        if transaction:
+            print("Changes are committed when the shell exits.")
+            
+        timings = defaultdict(list)
+        started = time.perf_counter()
+        with self.db.transaction() if transaction else nullcontext():
+            while True:
+                try:
+                    line = input('pos> ').strip()
+                except EOFError:
+                    print()
+                    break
+                except KeyboardInterrupt:
+                    print()
+                    continue
+                    
+                if line in ('exit', 'quit'):
+                    break
+                elif line == 'help':
+                    parser.print_help()
+                elif line == 'timings':
+                    self.print_timings(timings, time.perf_counter() - started)
+                elif line:
+                    try:
+                        self.run_line(line, parser, timings)
+                    except KeyboardInterrupt:
+                        print("\nInterrupted.")
+                        
+        self.print_timings(timings, time.perf_counter() - started)
+        
+    def print_timings(self, timings, elapsed):
+        """Report how long each kind of command took, slowest in total first"""
+        count = sum(len(runs) for runs in timings.values())
+        if not count:
+            return
+            
+        print(f"\n{'Command':<24} {'Runs':>7} {'Total ms':>10} {'Mean ms':>9} {'Max ms':>9}",
+              file=sys.stderr)
+        print("-" * 63, file=sys.stderr)
+        for name, runs in sorted(timings.items(), key=lambda item: -sum(item[1])):
+            total = sum(runs) * 1000
+            print(f"{name:<24} {len(runs):>7} {total:>10.1f} {total / len(runs):>9.2f} "
+                  f"{max(runs) * 1000:>9.2f}", file=sys.stderr)
+        print(f"\n{count} command(s) in {elapsed:.2f}s ({count / max(elapsed, 1e-6):,.0f}/s)",
+              file=sys.stderr)
 
     def manage_mode(self, args):
         """Handle mode commands"""
@@ -277,7 +777,7 @@ Examples:
         print("=" * 60)
         
         try:
-            self.cursor.execute("SELECT setting_value FROM settings WHERE setting_key = 'mobile_mode'")
+            self.cursor.execute("SELECT setting_value FROM settings WHERE user_id IS NULL AND setting_key = 'mobile_mode'")
             result = self.cursor.fetchone()
             
             if result:
@@ -372,14 +872,33 @@ Examples:
         if args.list:
             self.list_users()
         elif args.add:
-            self.add_user(args.add, args.admin, args.name, args.email)
+            self.add_user(args.add, args.admin, args.name, args.email, args.password)
         elif args.delete:
             self.delete_user(args.delete)
         elif args.modify:
             self.modify_user(args.modify, args.admin, args.name, args.email)
         elif args.reset_password:
-            self.reset_password(args.reset_password)
+            self.reset_password(args.reset_password, args.password)
 
+    def log_time(self, text):
+        """argparse type for --since/--until: a UTC time or an age (30m, 2h, 7d)"""
+        units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+        text = text.strip()
+        try:
+            if text[-1:].lower() in units and text[:-1].replace('.', '', 1).isdigit():
+                age = float(text[:-1]) * units[text[-1].lower()]
+                return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - age))
+            return datetime.fromisoformat(text).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid time '{text}'")
+            
+    def id_list(self, text):
+        """argparse type for "5", "1,2,7" or "3-9" id lists"""
+        try:
+            return parse_id_list(text)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+            
     def manage_trash(self, args):
         """Handle trash commands"""
         if args.list:
@@ -391,7 +910,7 @@ Examples:
         elif args.delete:
             self.delete_trash_item(args.delete, args.user, args.force)
         elif args.cleanup:
-            self.cleanup_trash(args.user)
+            self.cleanup_trash(args.user, args.force)
         elif args.size:
             self.show_trash_size(args.user)
         elif args.stats:
@@ -403,7 +922,7 @@ Examples:
         print("TRASH ITEMS")
         print("=" * 60)
         
-        items = self.os_app.db.get_trash_items(user, 100)
+        items = self.db.get_trash_items(user, 100)
         
         if not items:
             print("\nTrash is empty.")
@@ -427,8 +946,8 @@ Examples:
         print("EMPTY TRASH")
         print("=" * 60)
         
-        trash_size = self.os_app.db.get_trash_size(user)
-        items = self.os_app.db.get_trash_items(user, 1)
+        trash_size = self.db.get_trash_size(user)
+        items = self.db.get_trash_items(user, 1)
         
         if not items:
             print("\nTrash is already empty.")
@@ -450,106 +969,116 @@ Examples:
         print("\nEmptying trash...")
         
         try:
-            deleted_count = self.os_app.db.empty_trash(user)
+            deleted_count = self.db.empty_trash(user)
             print(f"✓ Emptied {deleted_count} item(s) from trash.")
             
         except Exception as e:
             print(f"✗ Error emptying trash: {e}")
             
-    def restore_trash_item(self, item_id, user=None):
-        """Restore item from trash"""
-        print(f"\nRestoring item ID: {item_id}")
+    def select_trash_items(self, item_ids, user=None):
+        """Look up trash items by ID, reporting missing or foreign ones"""
+        items = self.db.fetch_trash_rows(item_ids, 'id, name, deleted_by')
+        selected = []
+        
+        for item_id in item_ids:
+            item = items.get(item_id)
+            if not item:
+                print(f"Error: Item ID {item_id} not found in trash.")
+            elif user and item['deleted_by'] != user:
+                print(f"Error: Item {item_id} belongs to user '{item['deleted_by']}', not '{user}'.")
+            else:
+                selected.append(item)
+                
+        return selected
         
-        # Check if item exists
-        self.cursor.execute('SELECT * FROM trash WHERE id = ?', (item_id,))
-        item = self.cursor.fetchone()
+    def restore_trash_item(self, item_ids, user=None):
+        """Restore items from trash"""
+        print(f"\nRestoring {len(item_ids)} item(s)")
         
-        if not item:
-            print(f"Error: Item ID {item_id} not found in trash.")
-            return
-            
-        if user and item['deleted_by'] != user:
-            print(f"Error: Item belongs to user '{item['deleted_by']}', not '{user}'.")
+        items = self.select_trash_items(item_ids, user)
+        if not items:
             return
             
         try:
-            success, new_name = self.os_app.db.restore_from_trash(item_id)
-            
-            if success:
-                print(f"✓ Restored '{item['name']}' from trash.")
-                if new_name:
-                    print(f"  Note: Renamed to '{new_name}' due to name conflict.")
-            else:
-                print("✗ Failed to restore item.")
+            names = {item['id']: item['name'] for item in items}
+            results = self.db.restore_many(list(names))
+            
+            restored = 0
+            for item_id, success, new_name in results:
+                if success:
+                    restored += 1
+                    print(f"✓ Restored '{names[item_id]}' from trash.")
+                    if new_name:
+                        print(f"  Note: Renamed to '{new_name}' due to name conflict.")
+                else:
+                    print(f"✗ Failed to restore '{names[item_id]}'.")
+                    
+            if len(results) > 1:
+                print(f"\nRestored {restored} of {len(results)} item(s).")
                 
         except Exception as e:
-            print(f"✗ Error restoring item: {e}")
+            print(f"✗ Error restoring items: {e}")
             
-    def delete_trash_item(self, item_id, user=None, force=False):
-        """Permanently delete item from trash"""
-        print(f"\nPermanently deleting item ID: {item_id}")
+    def delete_trash_item(self, item_ids, user=None, force=False):
+        """Permanently delete items from trash"""
+        print(f"\nPermanently deleting {len(item_ids)} item(s)")
         
-        # Check if item exists
-        self.cursor.execute('SELECT * FROM trash WHERE id = ?', (item_id,))
-        item = self.cursor.fetchone()
-        
-        if not item:
-            print(f"Error: Item ID {item_id} not found in trash.")
-            return
-            
-        if user and item['deleted_by'] != user:
-            print(f"Error: Item belongs to user '{item['deleted_by']}', not '{user}'.")
+        items = self.select_trash_items(item_ids, user)
+        if not items:
             return
             
         if not force:
-            confirm = input(f"Permanently delete '{item['name']}'? (yes/NO): ").strip().lower()
+            if len(items) == 1:
+                prompt = f"Permanently delete '{items[0]['name']}'? (yes/NO): "
+            else:
+                prompt = f"Permanently delete {len(items)} items? (yes/NO): "
+            confirm = input(prompt).strip().lower()
             if confirm not in ['yes', 'y']:
                 print("Operation cancelled.")
                 return
                 
         try:
-            self.cursor.execute('DELETE FROM trash WHERE id = ?', (item_id,))
-            deleted = self.cursor.rowcount
-            
-            self.conn.commit()
+            names = {item['id']: item['name'] for item in items}
+            results = self.db.purge_many(list(names))
+            deleted = sum(1 for _, success in results if success)
             
-            if deleted:
-                print(f"✓ Permanently deleted '{item['name']}'.")
+            if len(items) == 1:
+                if deleted:
+                    print(f"✓ Permanently deleted '{items[0]['name']}'.")
+                else:
+                    print("✗ Item not found.")
             else:
-                print("✗ Item not found.")
+                print(f"✓ Permanently deleted {deleted} of {len(items)} item(s).")
                 
         except Exception as e:
-            print(f"✗ Error deleting item: {e}")
-            self.conn.rollback()
+            print(f"✗ Error deleting items: {e}")
             
-    def cleanup_trash(self, user=None):
+    def cleanup_trash(self, user=None, force=False):
         """Clean up expired trash items"""
         print("=" * 60)
         print("CLEANUP EXPIRED TRASH")
         print("=" * 60)
         
-        print("\nCleaning up expired items (older than 30 days)...")
+        days = self.db.retention_setting('trash_retention_days')
+        print(f"\nCleaning up expired items (older than {days:g} days)...")
         
-        try:
-            # Count items that will be deleted
-            self.cursor.execute('''
-                SELECT COUNT(*) FROM trash 
-                WHERE expires_at < datetime('now')
-            ''')
-            expired_count = self.cursor.fetchone()[0]
-            
-            if expired_count == 0:
-                print("✓ No expired items found.")
-                return
-                
-            print(f"Found {expired_count} expired item(s).")
+        # Count items that will be deleted
+        expired_count = self.db.count_expired_trash()
+        
+        if expired_count == 0:
+            print("✓ No expired items found.")
+            return
             
+        print(f"Found {expired_count} expired item(s).")
+        
+        if not force:
             confirm = input("Clean up now? (yes/NO): ").strip().lower()
             if confirm not in ['yes', 'y']:
                 print("Cleanup cancelled.")
                 return
                 
-            deleted_count = self.os_app.db.cleanup_expired_trash()
+        try:
+            deleted_count = self.db.cleanup_expired_trash()
             print(f"✓ Cleaned up {deleted_count} expired item(s).")
             
         except Exception as e:
@@ -562,13 +1091,11 @@ Examples:
         print("=" * 60)
         
         try:
-            total_size = self.os_app.db.get_trash_size(user)
-            items = self.os_app.db.get_trash_items(user, 1000)
-            item_count = len(items)
+            stats = self.db.get_trash_stats(user)
             
             print(f"\nTrash Statistics:")
-            print(f"  Items: {item_count}")
-            print(f"  Total size: {self.format_size(total_size)}")
+            print(f"  Items: {stats['entries']}")
+            print(f"  Total size: {self.format_size(stats['total_size'])}")
             
             if user:
                 print(f"  User: {user}")
@@ -576,12 +1103,9 @@ Examples:
                 print(f"  User: All users")
                 
             # Breakdown by type
-            file_count = sum(1 for item in items if item['type'] == 'file')
-            dir_count = sum(1 for item in items if item['type'] == 'directory')
-            
             print(f"\nBreakdown:")
-            print(f"  Files: {file_count}")
-            print(f"  Directories: {dir_count}")
+            print(f"  Files: {stats['files']}")
+            print(f"  Directories: {stats['directories']}")
             
         except Exception as e:
             print(f"Error getting trash size: {e}")
@@ -593,24 +1117,11 @@ Examples:
         print("=" * 60)
         
         try:
-            items = self.os_app.db.get_trash_items(user, 1000)
-            
-            if not items:
-                print("\nTrash is empty.")
-                return
-                
-            # Basic stats
-            total_size = sum(item['size'] or 0 for item in items)
-            file_count = sum(1 for item in items if item['type'] == 'file')
-            dir_count = sum(1 for item in items if item['type'] == 'directory')
+            # One streaming pass over the whole trash, at constant memory
+            item_count = total_size = file_count = dir_count = 0
+            user_stats = {}
+            oldest = newest = None
             
-            print(f"\nBasic Statistics:")
-            print(f"  Total items: {len(items)}")
-            print(f"  Files: {file_count}")
-            print(f"  Directories: {dir_count}")
-            print(f"  Total size: {self.format_size(total_size)}")
-            
-            # Size distribution
             size_categories = {
                 'Tiny (< 1KB)': 0,
                 'Small (1KB - 1MB)': 0,
@@ -619,8 +1130,21 @@ Examples:
                 'Huge (> 100MB)': 0
             }
             
-            for item in items:
+            for item in self.db.iter_trash_items(user):
                 size = item['size'] or 0
+                item_count += 1
+                total_size += size
+                if item['type'] == 'file':
+                    file_count += 1
+                elif item['type'] == 'directory':
+                    dir_count += 1
+                user_stats[item['deleted_by']] = user_stats.get(item['deleted_by'], 0) + 1
+                
+                # Newest first, so the first row is the newest
+                if item['deleted_at']:
+                    newest = newest or item['deleted_at']
+                    oldest = item['deleted_at']
+                    
                 if size < 1024:
                     size_categories['Tiny (< 1KB)'] += 1
                 elif size < 1024 * 1024:
@@ -632,31 +1156,34 @@ Examples:
                 else:
                     size_categories['Huge (> 100MB)'] += 1
                     
+            if not item_count:
+                print("\nTrash is empty.")
+                return
+                
+            print(f"\nBasic Statistics:")
+            print(f"  Total items: {item_count}")
+            print(f"  Files: {file_count}")
+            print(f"  Directories: {dir_count}")
+            print(f"  Total size: {self.format_size(total_size)}")
+            
             print(f"\nSize Distribution:")
             for category, count in size_categories.items():
                 if count > 0:
-                    percentage = (count / len(items)) * 100
+                    percentage = (count / item_count) * 100
                     print(f"  {category}: {count} items ({percentage:.1f}%)")
                     
             # User distribution (if not filtered by user)
             if not user:
-                user_stats = {}
-                for item in items:
-                    user_stats[item['deleted_by']] = user_stats.get(item['deleted_by'], 0) + 1
-                    
                 print(f"\nBy User:")
-                for user_name, count in sorted(user_stats.items()):
-                    percentage = (count / len(items)) * 100
+                for user_name, count in sorted(user_stats.items(), key=lambda stat: str(stat[0])):
+                    percentage = (count / item_count) * 100
                     print(f"  {user_name:<15}: {count} items ({percentage:.1f}%)")
                     
             # Oldest and newest items
-            if items:
-                dates = [item['deleted_at'] for item in items if item['deleted_at']]
-                if dates:
-                    dates.sort()
-                    print(f"\nTime Range:")
-                    print(f"  Oldest item: {dates[0][:19]}")
-                    print(f"  Newest item: {dates[-1][:19]}")
+            if oldest:
+                print(f"\nTime Range:")
+                print(f"  Oldest item: {oldest[:19]}")
+                print(f"  Newest item: {newest[:19]}")
                     
         except Exception as e:
             print(f"Error getting trash statistics: {e}")
@@ -708,8 +1235,8 @@ Examples:
         except Exception as e:
             print(f"Error listing users: {e}")
             
-    def add_user(self, username, is_admin=False, full_name=None, email=None):
-        """Add a new user"""
+    def add_user(self, username, is_admin=False, full_name=None, email=None, password=None):
+        """Add a new user (without any prompts when password is given)"""
         print(f"\nAdding user: {username}")
         
         # Check if user already exists
@@ -718,24 +1245,28 @@ Examples:
             print(f"Error: User '{username}' already exists.")
             return
             
-        # Get password
-        password = getpass.getpass("Password: ")
-        confirm = getpass.getpass("Confirm password: ")
+        # Scripts pass the password and skip the optional questions
+        interactive = password is None
         
-        if password != confirm:
-            print("Error: Passwords do not match.")
-            return
+        # Get password
+        if interactive:
+            password = getpass.getpass("Password: ")
+            confirm = getpass.getpass("Confirm password: ")
             
+            if password != confirm:
+                print("Error: Passwords do not match.")
+                return
+                
         if len(password) < 4:
             print("Error: Password must be at least 4 characters.")
             return
             
         # Get full name if not provided
-        if not full_name:
+        if not full_name and interactive:
             full_name = input("Full name (optional): ").strip() or None
             
         # Get email if not provided
-        if not email:
+        if not email and interactive:
             email = input("Email (optional): ").strip() or None
             
         try:
@@ -849,8 +1380,8 @@ Examples:
             print(f"✗ Error modifying user: {e}")
             self.rollback()
             
-    def reset_password(self, username):
-        """Reset user password"""
+    def reset_password(self, username, password=None):
+        """Reset user password (prompting unless password is given)"""
         # Check if user exists
         self.cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
         if not self.cursor.fetchone():
@@ -859,12 +1390,13 @@ Examples:
             
         print(f"\nResetting password for user: {username}")
         
-        password = getpass.getpass("New password: ")
-        confirm = getpass.getpass("Confirm new password: ")
-        
-        if password != confirm:
-            print("Error: Passwords do not match.")
-            return
+        if password is None:
+            password = getpass.getpass("New password: ")
+            confirm = getpass.getpass("Confirm new password: ")
+            
+            if password != confirm:
+                print("Error: Passwords do not match.")
+                return
             
         if len(password) < 4:
             print("Error: Password must be at least 4 characters.")
@@ -952,39 +1484,33 @@ Examples:
         result = self.cursor.fetchone()
         return result[0] if result else None
         
-    def show_status(self):
-        """Show system status"""
+    def show_status(self, exact=False, threads=None):
+        """Show system status, with exact row counts if asked"""
         print("=" * 60)
         print("SYSTEM STATUS")
         print("=" * 60)
         
         try:
-            # Get basic statistics
-            stats = {}
-            
-            # User count
-            self.cursor.execute("SELECT COUNT(*) FROM users")
-            stats['users'] = self.cursor.fetchone()[0]
+            # Get basic statistics from the trigger-maintained counters
+            if exact:
+                counts = self.db.exact_row_counts(
+                    ('users', 'system_log', 'filesystem', 'settings', 'installed_apps'), threads)
+            else:
+                counts = self.db.get_row_counts()
+            stats = {
+                'users': counts.get('users', 0),
+                'logs': counts.get('system_log', 0),
+                'files': counts.get('filesystem', 0),
+                'settings': counts.get('settings', 0),
+                'apps': counts.get('installed_apps', 0),
+            }
             
-            # Admin count
+            # Admin count (users is a handful of rows)
             self.cursor.execute("SELECT COUNT(*) FROM users WHERE is_admin = 1")
             stats['admins'] = self.cursor.fetchone()[0]
             
-            # Log entries
-            self.cursor.execute("SELECT COUNT(*) FROM system_log")
-            stats['logs'] = self.cursor.fetchone()[0]
-            
-            # Filesystem items
-            self.cursor.execute("SELECT COUNT(*) FROM filesystem")
-            stats['files'] = self.cursor.fetchone()[0]
-            
-            # Settings count
-            self.cursor.execute("SELECT COUNT(*) FROM settings")
-            stats['settings'] = self.cursor.fetchone()[0]
-            
-            # Installed apps
-            self.cursor.execute("SELECT COUNT(*) FROM installed_apps")
-            stats['apps'] = self.cursor.fetchone()[0]
+            # Trash
+            trash = self.db.get_trash_stats()
             
             # System info
             self.cursor.execute("SELECT key, value FROM system_info")
@@ -996,6 +1522,7 @@ Examples:
             print(f"  Files: {stats['files']}")
             print(f"  Settings: {stats['settings']}")
             print(f"  Installed apps: {stats['apps']}")
+            print(f"  Trash: {trash['entries']} item(s), {self.format_size(trash['total_size'])}")
             
             print("\n⚙️  System Information:")
             print(f"  Setup completed: {'Yes' if system_info.get('setup_completed') == 'true' else 'No'}")
@@ -1009,12 +1536,7 @@ Examples:
             print(f"  Database size: {db_size / 1024:.1f} KB")
             
             # Last log entry
-            self.cursor.execute('''
-                SELECT event_type, timestamp 
-                FROM system_log 
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            ''')
+            self.cursor.execute(HOT_QUERIES['system_log.last'])
             last_log = self.cursor.fetchone()
             if last_log:
                 print(f"\n📝 Last system event:")
@@ -1026,13 +1548,24 @@ Examples:
         except Exception as e:
             print(f"Error getting status: {e}")
             
-    def backup_system(self, output_file, compress=False):
-        """Backup system database"""
+    def show_progress(self, label, done, total, width=40):
+        """Draw a one-line progress bar, finishing the line when done"""
+        fraction = done / total if total else 1.0
+        filled = int(width * fraction)
+        bar = '█' * filled + '░' * (width - filled)
+        end = '\n' if done >= total else ''
+        print(f"\r{label} [{bar}] {fraction:6.1%} ({done}/{total})", end=end, flush=True)
+        
+    def backup_system(self, output_file, compress=False, pages=None, sleep=None, threads=None):
+        """Backup system database while it stays online"""
         print("=" * 60)
         print("SYSTEM BACKUP")
         print("=" * 60)
         
         try:
+            if compress:
+                output_file = f"{output_file}.gz"
+                
             # Check if output file already exists
             if os.path.exists(output_file):
                 confirm = input(f"File '{output_file}' already exists. Overwrite? (yes/NO): ")
@@ -1040,29 +1573,80 @@ Examples:
                     print("Backup cancelled.")
                     return
                     
-            # Create backup
-            import shutil
-            shutil.copy2(self.db_path, output_file)
+            # Copy page by page from a consistent snapshot; the copy is
+            # integrity-checked before it replaces output_file
+            started = time.time()
+            copied = self.db.backup(
+                output_file, compress=compress, pages=pages, pause=sleep,
+                progress=lambda done, total: self.show_progress("Copying pages", done, total),
+                threads=threads
+            )
             
-            # Compress if requested
-            if compress:
-                import gzip
-                with open(output_file, 'rb') as f_in:
-                    with gzip.open(f"{output_file}.gz", 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                os.remove(output_file)
-                output_file = f"{output_file}.gz"
-                
             size = os.path.getsize(output_file)
             print(f"\n✓ Backup created successfully!")
             print(f"  File: {output_file}")
-            print(f"  Size: {size / 1024:.1f} KB")
+            print(f"  Size: {size / 1024:.1f} KB ({copied} pages)")
+            print(f"  Integrity: ok")
+            print(f"  Duration: {time.time() - started:.2f}s")
             print(f"  Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             
         except Exception as e:
             print(f"✗ Error creating backup: {e}")
             
-    def restore_system(self, input_file, force=False):
+    def backup_incremental(self, directory, full=False, pages=None, sleep=None, threads=None):
+        """Add the pages changed since the last backup to a backup chain"""
+        print("=" * 60)
+        print("INCREMENTAL BACKUP")
+        print("=" * 60)
+        
+        try:
+            started = time.time()
+            
+            # The snapshot goes to a scratch file in the chain's directory,
+            # which append() reads through once without loading it whole
+            os.makedirs(directory, exist_ok=True)
+            image_path = os.path.join(directory, 'snapshot.tmp')
+            try:
+                copy = self.db.snapshot(
+                    image_path, pages=pages, pause=sleep,
+                    progress=lambda done, total: self.show_progress("Copying pages", done, total)
+                )
+                try:
+                    page_size = copy.execute('PRAGMA page_size').fetchone()[0]
+                finally:
+                    copy.close()
+                    
+                manifest = BackupChain(directory, threads).append(image_path, page_size, full=full)
+            finally:
+                for suffix in ('', '-journal'):
+                    if os.path.exists(image_path + suffix):
+                        os.remove(image_path + suffix)
+            
+            kind = "Base" if manifest['base'] else "Delta"
+            print(f"\n✓ {kind} backup {manifest['sequence']} added to '{directory}'")
+            print(f"  Changed pages: {manifest['changed_pages']} of {manifest['page_count']}")
+            print(f"  Stored: {manifest['stored_bytes'] / 1024:.1f} KB")
+            print(f"  Duration: {time.time() - started:.2f}s")
+            
+        except Exception as e:
+            print(f"✗ Error creating backup: {e}")
+            
+    def list_backups(self, directory):
+        """List the entries of a backup chain"""
+        entries = BackupChain(directory).entries()
+        if not entries:
+            print(f"No backups in '{directory}'.")
+            return
+            
+        print(f"{'Seq':<6} {'Type':<6} {'Created':<20} {'Changed':>10} {'Pages':>10} {'Stored':>12}")
+        print("-" * 70)
+        for entry in entries:
+            kind = 'base' if entry['base'] else 'delta'
+            print(f"{entry['sequence']:<6} {kind:<6} {entry['created']:<20} "
+                  f"{entry['changed_pages']:>10} {entry['page_count']:>10} "
+                  f"{entry['stored_bytes'] / 1024:>9.1f} KB")
+        
+    def restore_system(self, input_file, force=False, sequence=None, threads=None):
         """Restore system from backup"""
         print("=" * 60)
         print("SYSTEM RESTORE")
@@ -1084,24 +1668,38 @@ Examples:
         try:
             # Check if database is in use
             try:
-                self.conn.close()
+                self.db.close()
             except:
                 pass
                 
-            # Handle compressed backup
-            if input_file.endswith('.gz'):
-                import gzip
-                import tempfile
+            # A leftover WAL would be replayed on top of the restored file
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(self.db_path + suffix):
+                    os.remove(self.db_path + suffix)
                 
-                with gzip.open(input_file, 'rb') as f_in:
-                    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                        shutil.copyfileobj(f_in, tmp)
-                        temp_path = tmp.name
-                        
-                shutil.copy2(temp_path, self.db_path)
-                os.remove(temp_path)
+            # Rebuild a backup chain entry from its base and deltas
+            if os.path.isdir(input_file):
+                manifest = BackupChain(input_file, threads).restore(
+                    self.db_path, sequence,
+                    progress=lambda done, total: self.show_progress("Applying backups", done, total)
+                )
+                input_file = f"{input_file} (backup {manifest['sequence']}, {manifest['created']})"
+                
+            # Stream into a file next to the database and swap it in, so an
+            # interrupted restore never leaves a half-written database
             else:
-                shutil.copy2(input_file, self.db_path)
+                temp_path = self.db_path + '.tmp'
+                try:
+                    if input_file.endswith('.gz'):
+                        with ParallelGzipReader(input_file, threads) as f_in:
+                            with open(temp_path, 'wb') as f_out:
+                                shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+                    else:
+                        shutil.copyfile(input_file, temp_path)
+                    os.replace(temp_path, self.db_path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
                 
             print(f"\n✓ System restored successfully from '{input_file}'!")
             print("Restart the OS Simulator to use the restored system.")
@@ -1112,62 +1710,201 @@ Examples:
         except Exception as e:
             print(f"✗ Error restoring system: {e}")
             
-    def view_logs(self, log_type, limit, tail):
+    def view_logs(self, args):
         """View system logs"""
-        print("=" * 60)
-        print("SYSTEM LOGS")
-        print("=" * 60)
-        
+        jsonl = args.format == 'jsonl'
+        if not jsonl:
+            print("=" * 60)
+            print("SYSTEM LOGS")
+            print("=" * 60)
+            
+        def split_values(values):
+            return [item.strip() for value in values or [] for item in value.split(',') if item.strip()]
+            
         try:
-            query = "SELECT id, event_type, event_data, timestamp FROM system_log"
-            params = []
-            
-            if log_type != 'all':
-                if log_type == 'login':
-                    query += " WHERE event_type LIKE '%login%'"
-                elif log_type == 'error':
-                    query += " WHERE severity = 'error' OR event_type LIKE '%error%'"
-                    
-            if tail:
-                query += " ORDER BY timestamp DESC LIMIT ?"
-                params.append(limit)
-            else:
-                query += " ORDER BY timestamp LIMIT ?"
-                params.append(limit)
+            events = split_values(args.event)
+            if args.type == 'login':
+                events.append('login*')
+            condition, params = self.db.log_condition(
+                args.since, args.until, split_values(args.severity), events
+            )
+            if args.type == 'error':
+                error = "severity = 'error' OR event_type LIKE '%error%'"
+                condition = f"({condition}) AND ({error})" if condition else error
                 
-            self.cursor.execute(query, params)
-            logs = self.cursor.fetchall()
-            
-            if not logs:
+            # Stream entries as they are read rather than loading them all;
+            # when following, show the newest window in time order first
+            logs = itertools.islice(
+                self.db.iter_logs(condition, params, descending=args.tail or args.follow,
+                                  page_size=min(args.limit, self.db.PAGE_SIZE), as_json=jsonl),
+                args.limit
+            )
+            if args.follow:
+                logs = reversed(list(logs))
+                
+            shown = 0
+            last_id = None
+            for log in logs:
+                if not shown and not jsonl:
+                    print(f"\nShowing up to {args.limit} log entries:")
+                    print("-" * 100)
+                shown += 1
+                last_id = log['id'] if last_id is None else max(last_id, log['id'])
+                self.print_log(log, jsonl)
+                
+            if args.follow:
+                if not jsonl:
+                    print("\nFollowing new entries (Ctrl+C to stop)...")
+                sys.stdout.flush()
+                try:
+                    for log in self.db.follow_logs(condition, params, last_id,
+                                                   args.interval, as_json=jsonl):
+                        self.print_log(log, jsonl)
+                        sys.stdout.flush()
+                except KeyboardInterrupt:
+                    pass
+                return
+                
+            if jsonl:
+                return
+                
+            if not shown:
                 print("\nNo logs found.")
                 return
                 
-            print(f"\nShowing {len(logs)} log entries:")
-            print("-" * 100)
+            print("\n" + "-" * 100)
+            print(f"Total logs shown: {shown}")
             
-            for log in logs:
-                event_data = log['event_data']
-                try:
-                    if event_data:
-                        data = json.loads(event_data)
-                        data_str = json.dumps(data, indent=2)
-                    else:
-                        data_str = ""
-                except:
-                    data_str = event_data or ""
+        except Exception as e:
+            print(f"Error viewing logs: {e}", file=sys.stderr if jsonl else sys.stdout)
+            
+    def data_format(self, fmt, path):
+        """Explicit --format, else guessed from the file extension"""
+        if fmt:
+            return fmt
+        return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        
+    def export_table(self, table, fmt, output):
+        """Stream a table to a JSONL or CSV file (or standard output)"""
+        fmt = self.data_format(fmt, output)
+        out = None
+        try:
+            started = time.time()
+            columns, rows = self.db.export_rows(table, as_json=fmt == 'jsonl')
+            out = sys.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8')
+            
+            count = 0
+            if fmt == 'jsonl':
+                for line in rows:
+                    out.write(line + '\n')
+                    count += 1
+            else:
+                writer = csv.writer(out)
+                writer.writerow(columns)
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
                     
-                print(f"\n[{log['timestamp']}] {log['event_type']}")
-                if data_str:
-                    for line in data_str.split('\n'):
-                        if line:
-                            print(f"  {line}")
-                            
-            print("\n" + "-" * 100)
-            print(f"Total logs shown: {len(logs)}")
+            elapsed = max(time.time() - started, 1e-6)
+            print(f"✓ Exported {count} row(s) from {table} in {elapsed:.2f}s "
+                  f"({count / elapsed:,.0f} rows/s)", file=sys.stderr)
             
         except Exception as e:
-            print(f"Error viewing logs: {e}")
+            print(f"✗ Error exporting {table}: {e}", file=sys.stderr)
             
+        finally:
+            if out is not None and out is not sys.stdout:
+                out.close()
+                
+    def import_table(self, table, fmt, input_file, on_conflict=None, batch=None):
+        """Load a table from a JSONL or CSV file (or standard input)"""
+        fmt = self.data_format(fmt, input_file)
+        source = None
+        try:
+            source = sys.stdin if input_file == '-' else open(input_file, newline='', encoding='utf-8')
+            
+            if fmt == 'jsonl':
+                lines = (line for line in source if line.strip())
+                first = next(lines, None)
+                if first is None:
+                    print("No rows to import.", file=sys.stderr)
+                    return
+                first = json.loads(first)
+                columns = list(first)
+                known = set(columns)
+                values = operator.itemgetter(*columns)
+                
+                def parse():
+                    yield [first.get(name) for name in columns]
+                    for number, line in enumerate(lines, 2):
+                        row = json.loads(line)
+                        if len(row) == len(columns):
+                            try:
+                                # pos export writes every column on every line
+                                yield values(row) if len(columns) > 1 else (values(row),)
+                                continue
+                            except KeyError:
+                                pass
+                        if not row.keys() <= known:
+                            raise ValueError(f"Row {number} has columns the first row does not")
+                        yield [row.get(name) for name in columns]
+                rows = parse()
+            else:
+                reader = csv.reader(source)
+                columns = next(reader, None)
+                if not columns:
+                    print("No rows to import.", file=sys.stderr)
+                    return
+                # Empty fields are NULL, as written by pos export
+                rows = ([value if value != '' else None for value in row] for row in reader)
+                
+            started = time.time()
+            read, written = self.db.import_rows(
+                table, columns, rows, on_conflict, batch_size=batch,
+                progress=lambda done: print(f"\rImported {done} row(s)...", end='',
+                                            file=sys.stderr, flush=True)
+            )
+            
+            elapsed = max(time.time() - started, 1e-6)
+            print(f"\n✓ Imported {table}: {read} row(s) read, {written} written "
+                  f"in {elapsed:.2f}s ({read / elapsed:,.0f} rows/s)", file=sys.stderr)
+            
+        except sqlite3.IntegrityError as e:
+            print(f"\n✗ Error importing {table}: {e}", file=sys.stderr)
+            if on_conflict in (None, 'abort'):
+                print("Rows that already exist can be skipped with --on-conflict ignore "
+                      "or overwritten with --on-conflict update.", file=sys.stderr)
+                
+        except Exception as e:
+            print(f"\n✗ Error importing {table}: {e}", file=sys.stderr)
+            
+        finally:
+            if source is not None and source is not sys.stdin:
+                source.close()
+                
+    def print_log(self, log, jsonl=False):
+        """Print one system_log entry"""
+        if jsonl:
+            # Built by SQLite; printed as is
+            print(log['line'])
+            return
+            
+        event_data = log['event_data']
+        try:
+            if event_data:
+                data = json.loads(event_data)
+                data_str = json.dumps(data, indent=2)
+            else:
+                data_str = ""
+        except:
+            data_str = event_data or ""
+            
+        print(f"\n[{log['timestamp']}] {log['event_type']}")
+        if data_str:
+            for line in data_str.split('\n'):
+                if line:
+                    print(f"  {line}")
+        
     def manage_filesystem(self, args):
         """Manage virtual filesystem"""
         if args.fs_command == 'list':
@@ -1176,6 +1913,15 @@ Examples:
             self.create_fs_item(args.path, args.type, args.content)
         elif args.fs_command == 'delete':
             self.delete_fs_item(args.path, args.force)
+        elif args.fs_command == 'move':
+            self.move_fs_item(args.source, args.destination)
+        elif args.fs_command == 'search':
+            self.search_files(args.query, args.path, args.limit, args.names)
+        elif args.fs_command == 'import':
+            self.import_tree(args.source, args.path, args.tar, args.owner,
+                             args.threads, args.batch)
+        elif args.fs_command == 'export':
+            self.export_tree(args.path, args.destination, args.tar, args.threads)
             
     def list_files(self, path):
         """List files in virtual filesystem"""
@@ -1183,23 +1929,22 @@ Examples:
         print("-" * 60)
         
         try:
-            self.cursor.execute('''
-                SELECT name, type, size, modified_at, owner, permissions
-                FROM filesystem 
-                WHERE path = ?
-                ORDER BY type DESC, name
-            ''', (path,))
-            
-            items = self.cursor.fetchall()
-            
-            if not items:
-                print("Directory is empty.")
+            if split_path(path)[1] and self.db.resolve_path(path, 'directory') is None:
+                print(f"Error: '{path}' is not a directory.")
                 return
                 
-            print(f"{'Type':<4} {'Permissions':<10} {'Size':<8} {'Modified':<19} {'Name'}")
-            print("-" * 60)
+            # Directories first, each kind streamed in name order
+            items = itertools.chain(
+                self.db.iter_directory(path, 'directory'),
+                self.db.iter_directory(path, 'file')
+            )
             
+            count = 0
             for item in items:
+                if not count:
+                    print(f"{'Type':<4} {'Permissions':<10} {'Size':<8} {'Modified':<19} {'Name'}")
+                    print("-" * 60)
+                count += 1
                 item_type = 'd' if item['type'] == 'directory' else '-'
                 size = f"{item['size']}" if item['size'] else "0"
                 modified = item['modified_at'][:19] if item['modified_at'] else ""
@@ -1207,7 +1952,11 @@ Examples:
                 print(f"{item_type:<4} {item['permissions']:<10} {size:<8} "
                       f"{modified:<19} {item['name']}")
                       
-            print(f"\nTotal items: {len(items)}")
+            if not count:
+                print("Directory is empty.")
+                return
+                
+            print(f"\nTotal items: {count}")
             
         except Exception as e:
             print(f"Error listing files: {e}")
@@ -1224,54 +1973,114 @@ Examples:
             print("Error: Invalid path.")
             return
             
-        # Check if parent directory exists
-        self.cursor.execute('''
-            SELECT id FROM filesystem 
-            WHERE path = ? AND name = ? AND type = 'directory'
-        ''', (op.dirname(dir_path), op.basename(dir_path)))
-        
-        # For simplicity, we'll just create it
+        if self.db.resolve_path(path, item_type) is not None:
+            print(f"Error: '{path}' already exists.")
+            return
+            
+        # Missing parent directories are created along the way
         print(f"Creating {item_type}: {path}")
         
         try:
-            size = len(content) if content else 0
-            
-            self.cursor.execute('''
-                INSERT INTO filesystem (name, type, path, content, size)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (name, item_type, dir_path, content, size))
-            
-            self.conn.commit()
+            if item_type == 'file':
+                # File bodies go to the content-addressed blob store
+                if self.db.create_file(dir_path, name, content) is None:
+                    print(f"✗ Error creating {item_type}.")
+                    return
+            else:
+                self.db.ensure_directory(path)
+                self.conn.commit()
             print(f"✓ Created {item_type} '{path}' successfully!")
             
         except Exception as e:
             print(f"✗ Error creating {item_type}: {e}")
             self.conn.rollback()
             
+    def import_tree(self, source, path, tar=False, owner='admin', threads=None, batch=None):
+        """Copy a host directory or tar archive into the virtual filesystem"""
+        # Status goes to stderr, like the other bulk commands
+        archive = None
+        try:
+            if tar:
+                archive = sys.stdin.buffer if source == '-' else open(source, 'rb')
+                entries = host_tree.scan_tar(archive)
+            elif not os.path.isdir(source):
+                print(f"Error: '{source}' is not a directory.", file=sys.stderr)
+                return
+            else:
+                entries = host_tree.scan_host(source)
+                
+            started = time.time()
+            counts = self.db.import_tree(
+                entries, path, owner, threads, batch,
+                progress=lambda done: print(f"\rImported {done} file(s)...", end='',
+                                            file=sys.stderr, flush=True)
+            )
+            
+            elapsed = max(time.time() - started, 1e-6)
+            files = counts['files'] + counts['updated'] + counts['skipped']
+            print(f"\n✓ Imported into {path}: {counts['files']} new, {counts['updated']} updated, "
+                  f"{counts['skipped']} unchanged file(s), {counts['directories']} new "
+                  f"director{'y' if counts['directories'] == 1 else 'ies'}, "
+                  f"{counts['bytes'] / (1024 * 1024):.1f} MB in {elapsed:.2f}s "
+                  f"({files / elapsed:,.0f} files/s)", file=sys.stderr)
+            if counts['failed']:
+                print(f"⚠️  {counts['failed']} file(s) could not be read", file=sys.stderr)
+                
+        except Exception as e:
+            print(f"\n✗ Error importing '{source}': {e}", file=sys.stderr)
+            
+        finally:
+            if archive is not None and archive is not sys.stdin.buffer:
+                archive.close()
+                
+    def export_tree(self, path, destination, tar=False, threads=None):
+        """Copy a virtual directory to a host directory or tar archive"""
+        archive = None
+        try:
+            entries = self.db.iter_tree(path)
+            progress = lambda done: print(f"\rExported {done} entries...", end='',
+                                          file=sys.stderr, flush=True)
+            
+            started = time.time()
+            if tar:
+                archive = sys.stdout.buffer if destination == '-' else open(destination, 'wb')
+                compress = destination.endswith(('.gz', '.tgz'))
+                counts = host_tree.write_tar(entries, archive, compress, threads, progress)
+            else:
+                counts = host_tree.write_host(entries, destination, threads, progress)
+                
+            elapsed = max(time.time() - started, 1e-6)
+            files = counts['files'] + counts['skipped']
+            print(f"\n✓ Exported {path}: {counts['files']} file(s) written, "
+                  f"{counts['skipped']} unchanged, {counts['directories']} "
+                  f"director{'y' if counts['directories'] == 1 else 'ies'}, "
+                  f"{counts['bytes'] / (1024 * 1024):.1f} MB in {elapsed:.2f}s "
+                  f"({files / elapsed:,.0f} files/s)", file=sys.stderr)
+                  
+        except Exception as e:
+            print(f"\n✗ Error exporting '{path}': {e}", file=sys.stderr)
+            
+        finally:
+            if archive is not None and archive is not sys.stdout.buffer:
+                archive.close()
+                
     def delete_fs_item(self, path, force=False):
         """Delete file or directory"""
-        import os.path as op
-        
-        dir_path = op.dirname(path)
-        name = op.basename(path)
-        
         # Check if item exists
-        self.cursor.execute('''
-            SELECT type FROM filesystem 
-            WHERE path = ? AND name = ?
-        ''', (dir_path, name))
-        
-        item = self.cursor.fetchone()
-        if not item:
+        item_id = self.db.resolve_path(path)
+        if item_id is None:
             print(f"Error: '{path}' not found.")
             return
             
+        self.cursor.execute('SELECT type FROM filesystem WHERE id = ?', (item_id,))
+        item = self.cursor.fetchone()
+            
         # Check if directory is not empty
         if item['type'] == 'directory' and not force:
             self.cursor.execute('''
                 SELECT COUNT(*) FROM filesystem 
-                WHERE path = ?
-            ''', (path,))
+                WHERE parent_id = ?
+            ''', (item_id,))
             
             count = self.cursor.fetchone()[0]
             if count > 0:
@@ -1285,29 +2094,56 @@ Examples:
             print("Deletion cancelled.")
             return
             
-        try:
-            # Delete item
-            self.cursor.execute('''
-                DELETE FROM filesystem 
-                WHERE path = ? AND name = ?
-            ''', (dir_path, name))
+        # Item and contents go in one transaction, following parent_id
+        # links, so /home/admin never takes /home/admin2 with it
+        count = self.db.delete_entry(item_id)
+        if count:
+            print(f"✓ Deleted '{path}' successfully! ({count} item(s))")
+        else:
+            print(f"✗ Error deleting '{path}'.")
             
-            # If directory, delete contents too
-            if item['type'] == 'directory':
-                self.cursor.execute('''
-                    DELETE FROM filesystem 
-                    WHERE path LIKE ? || '%'
-                ''', (path,))
+    def search_files(self, query, path='/', limit=50, names_only=False):
+        """Search the virtual filesystem's full-text index"""
+        print(f"\nSearching for '{query}' in {path}")
+        print("-" * 60)
+        
+        results = self.db.search(query, path, limit, names_only)
+        if not results:
+            print("No matches found.")
+            return
+            
+        for result in results:
+            item_type = 'd' if result['type'] == 'directory' else '-'
+            print(f"{item_type} {join_path(result['path'], result['name'])}")
+            if result['snippet'] and not names_only:
+                print(f"    {result['snippet']}")
                 
-            self.conn.commit()
-            print(f"✓ Deleted '{path}' successfully!")
+        print(f"\nMatches shown: {len(results)}")
+        
+    def move_fs_item(self, source, destination):
+        """Move or rename file or directory"""
+        item_id = self.db.resolve_path(source)
+        if item_id is None:
+            print(f"Error: '{source}' not found.")
+            return
             
-        except Exception as e:
-            print(f"✗ Error deleting: {e}")
-            self.conn.rollback()
+        # Moving onto an existing directory puts the item inside it
+        dest_parent, dest_name = split_path(destination)
+        if self.db.resolve_path(destination, 'directory') is not None:
+            dest_parent, dest_name = destination, None
             
-    def show_system_info(self):
-        """Show detailed system information"""
+        success, error = self.db.move_entry(item_id, dest_parent, dest_name)
+        if success:
+            print(f"✓ Moved '{source}' to '{destination}'.")
+        else:
+            print(f"✗ Error moving '{source}': {error}")
+            
+    def show_system_info(self, exact=True, threads=None):
+        """Show detailed system information
+        
+        Row counts are exact, counted concurrently, unless exact is false;
+        then they come from counters and planner statistics (marked ~).
+        """
         print("=" * 60)
         print("SYSTEM INFORMATION")
         print("=" * 60)
@@ -1322,15 +2158,21 @@ Examples:
                 print(f"  {info['key']:<20}: {info['value']}")
                 
             # Get database info
-            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = self.cursor.fetchall()
+            if exact:
+                counts = {table: (rows, 'exact')
+                          for table, rows in self.db.exact_row_counts(threads=threads).items()}
+            else:
+                counts = self.db.estimate_row_counts()
             
             print(f"\n🗃️  Database Information:")
-            print(f"  Tables: {len(tables)}")
-            for table in tables:
-                self.cursor.execute(f"SELECT COUNT(*) FROM {table['name']}")
-                count = self.cursor.fetchone()[0]
-                print(f"    {table['name']:<20}: {count} rows")
+            print(f"  Tables: {len(counts)}")
+            for table, (count, source) in counts.items():
+                if source is None:
+                    print(f"    {table:<20}: (virtual, not estimated)")
+                elif source == 'estimate':
+                    print(f"    {table:<20}: ~{count} rows")
+                else:
+                    print(f"    {table:<20}: {count} rows")
                 
             # Get Python and OS info
             import platform
@@ -1350,6 +2192,115 @@ Examples:
         except Exception as e:
             print(f"Error getting system info: {e}")
             
+    def manage_boot(self, fast_boot=None, limit=20):
+        """Set fast boot and show recent boot times with their medians"""
+        print("=" * 60)
+        print("BOOT")
+        print("=" * 60)
+        
+        try:
+            if fast_boot:
+                self.db.set_setting('fast_boot', 'true' if fast_boot == 'on' else 'false')
+                self.db.flush_settings()
+                print(f"✓ Fast boot turned {fast_boot}.")
+                
+            enabled = self.db.get_setting('fast_boot', 'false') == 'true'
+            print(f"\n  Fast boot: {'on' if enabled else 'off'}")
+            
+            boots = self.db.get_boot_metrics(limit)
+            if not boots:
+                print("\nNo boots recorded yet.")
+                return
+                
+            def seconds(value):
+                return f"{value:.2f}" if value is not None else '-'
+                
+            print(f"\n{'Started':<20} {'Kind':<8} {'Fast':<5} {'Mobile':<7} "
+                  f"{'Login s':>8} {'Desktop s':>10} {'Load s':>7}")
+            print("-" * 70)
+            for boot in boots:
+                print(f"{boot['started_at']:<20} {boot['kind']:<8} "
+                      f"{'yes' if boot['fast_boot'] else 'no':<5} {'yes' if boot['mobile'] else 'no':<7} "
+                      f"{seconds(boot['login_seconds']):>8} {seconds(boot['desktop_seconds']):>10} "
+                      f"{seconds(boot['desktop_load_seconds']):>7}")
+                      
+            # Medians per kind of boot; desktop_seconds includes time spent
+            # typing at the login screen, so it is left out
+            groups = defaultdict(lambda: defaultdict(list))
+            for boot in boots:
+                group = groups[(boot['kind'], 'fast' if boot['fast_boot'] else 'full')]
+                for milestone in ('login_seconds', 'desktop_load_seconds'):
+                    if boot[milestone] is not None:
+                        group[milestone].append(boot[milestone])
+                        
+            def median(values):
+                return f"{statistics.median(values):.2f}s" if values else '-'
+                
+            print("\n⏱️  Medians:")
+            for (kind, speed), group in sorted(groups.items()):
+                print(f"  {kind} boot, {speed}: login {median(group['login_seconds'])}, "
+                      f"desktop load {median(group['desktop_load_seconds'])} "
+                      f"({len(group['login_seconds'])} boot(s))")
+                      
+        except Exception as e:
+            print(f"Error showing boots: {e}")
+            
+    def maintain_database(self, tasks=None, plan_only=False, budget=None):
+        """Show the database state and run the maintenance plan (or tasks)"""
+        print("=" * 60)
+        print("DATABASE MAINTENANCE")
+        print("=" * 60)
+        
+        try:
+            state = self.db.maintenance_state()
+            pages, free = state['page_count'], state['freelist_count']
+            print(f"\n  Size: {self.format_size(pages * state['page_size'])} ({pages} pages)")
+            print(f"  Free pages: {free} ({free / pages if pages else 0:.1%})")
+            print(f"  Incremental vacuum: {'on' if state['auto_vacuum'] == 2 else 'off'}")
+            print(f"  WAL: {self.format_size(state['wal_bytes'])}")
+            print(f"  Planner statistics: {'stale' if state['stale_stats'] else 'current'}")
+            print(f"  Last quick check: {state['last_quick_check'] or 'never'}")
+            
+            plan = self.db.plan_maintenance(state)
+            if tasks is None:
+                print("\n📋 Plan:")
+                if not plan:
+                    print("  Nothing to do.")
+                for task, reason in plan:
+                    note = ' (offline; run with --task vacuum)' if task in self.db.OFFLINE_TASKS else ''
+                    print(f"  {task:<20}: {reason}{note}")
+                tasks = [task for task, reason in plan if task not in self.db.OFFLINE_TASKS]
+                
+            if plan_only or not tasks:
+                return
+                
+            print()
+            self.run_maintenance_tasks(tasks, budget / 1000 if budget else None)
+            
+        except Exception as e:
+            print(f"Error during maintenance: {e}")
+            
+    def run_maintenance_tasks(self, tasks, budget=None):
+        """Run maintenance tasks in order, one line each; True if all finished"""
+        finished = True
+        for task in tasks:
+            started = time.perf_counter()
+            try:
+                done = self.db.run_maintenance(task, budget)
+            except (sqlite3.Error, ValueError) as e:
+                print(f"✗ {task}: {e}")
+                finished = False
+                continue
+            seconds = time.perf_counter() - started
+            if done:
+                print(f"✓ {task} ({seconds:.2f}s)")
+            else:
+                print(f"… {task} did not finish within its budget ({seconds:.2f}s); run it again")
+                finished = False
+                
+        self.db.log_event('maintenance', {'tasks': tasks, 'finished': finished})
+        return finished
+        
     def check_updates(self, install=False):
         """Check for system updates"""
         print("=" * 60)
@@ -1399,12 +2350,30 @@ Examples:
             if result == "ok":
                 print("✓ Database integrity check passed.")
                 
+                # Check that hot queries are still served by indexes
+                scans = find_query_plan_scans(self.cursor)
+                if scans:
+                    print(f"✗ {len(scans)} hot query(s) fall back to a table scan:")
+                    for name, detail in scans:
+                        print(f"  {name:<24}: {detail}")
+                        
+                    if not check_only:
+                        print("\nCreating missing indexes...")
+                        self.db.create_indexes()
+                        self.conn.commit()
+                        print("✓ Indexes created.")
+                else:
+                    print("✓ All hot queries use indexes.")
+                    
                 if not check_only:
-                    # Optimize database
+                    # Compact and re-analyze as planned, without rewriting
+                    # the whole file unless free pages cannot be reclaimed
+                    # any other way
                     print("\nOptimizing database...")
-                    self.cursor.execute("VACUUM")
-                    self.conn.commit()
-                    print("✓ Database optimized successfully!")
+                    plan = self.db.plan_maintenance()
+                    tasks = [task for task, reason in plan if task != 'quick_check']
+                    if self.run_maintenance_tasks(tasks):
+                        print("✓ Database optimized successfully!")
             else:
                 print(f"✗ Database issues found: {result}")
                 
@@ -1430,9 +2399,41 @@ Examples:
         except Exception as e:
             print(f"Error during repair: {e}")
 
+def run_fleet_member(db_path, args):
+    """Run a parsed command against one database in a fleet worker process
+    
+    Runs in the database's directory, so relative paths in the command
+    (backup --output, export --output, ...) land next to each instance.
+    Output is captured and standard input is empty, so a prompt fails
+    instead of waiting. Returns (db_path, exit status, output, seconds).
+    """
+    output = io.StringIO()
+    status = 0
+    started = time.perf_counter()
+    cli = OSCLI(db_path, connect=False)
+    with redirect_stdout(output), redirect_stderr(output):
+        stdin, sys.stdin = sys.stdin, io.StringIO()
+        try:
+            cli.init_database_connection(announce=False)
+            os.chdir(os.path.dirname(db_path))
+            cli.execute(args, cli.build_parser())
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except EOFError:
+            print("\n✗ Needs confirmation; pass --force to run it on a fleet")
+            status = 1
+        except Exception as e:
+            print(f"✗ Error: {e}")
+            status = 1
+        finally:
+            sys.stdin = stdin
+            if hasattr(cli, 'db'):
+                cli.db.close()
+    return db_path, status, output.getvalue(), time.perf_counter() - started
+
 def main():
     """Main entry point"""
-    cli = OSCLI()
+    cli = OSCLI(connect=False)
     cli.run()
 
 if __name__ == "__main__":
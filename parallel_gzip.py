@@ -0,0 +1,183 @@
+# parallel_gzip.py - Block-parallel gzip for backups
+import os
+import gzip
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Uncompressed bytes per gzip member
+BLOCK_SIZE = 1024 * 1024
+
+# Compression threads when none are given
+DEFAULT_THREADS = min(8, os.cpu_count() or 1)
+
+# Member header: gzip magic, deflate, FEXTRA flag, no mtime, unknown OS,
+# then one 'PZ' extra subfield holding the whole member's length so a
+# reader can split members without inflating them
+MEMBER_HEADER = struct.Struct('<BBBBIBBH2sHI')
+MEMBER_TRAILER = struct.Struct('<II')
+
+def deflate_member(block, level):
+    """Compress one block into a complete, self-contained gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = compressor.compress(block) + compressor.flush()
+    length = MEMBER_HEADER.size + len(body) + MEMBER_TRAILER.size
+    header = MEMBER_HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 255, 8, b'PZ', 4, length)
+    trailer = MEMBER_TRAILER.pack(zlib.crc32(block), len(block) & 0xffffffff)
+    return header + body + trailer
+
+def member_length(header):
+    """Length of a member from its header, or None if it is not ours"""
+    if len(header) < MEMBER_HEADER.size:
+        return None
+    magic1, magic2, method, flags, _, _, _, xlen, tag, size, length = MEMBER_HEADER.unpack(header)
+    if (magic1, magic2, method) != (0x1f, 0x8b, 8) or not flags & 4:
+        return None
+    if xlen != 8 or tag != b'PZ' or size != 4:
+        return None
+    return length
+
+def inflate_member(member):
+    """Decompress one member written by deflate_member"""
+    block = zlib.decompress(member[MEMBER_HEADER.size:-MEMBER_TRAILER.size], -zlib.MAX_WBITS)
+    crc, size = MEMBER_TRAILER.unpack(member[-MEMBER_TRAILER.size:])
+    if zlib.crc32(block) != crc or len(block) & 0xffffffff != size:
+        raise gzip.BadGzipFile("Corrupt gzip member (CRC or length mismatch)")
+    return block
+
+class ParallelGzipWriter:
+    """Write-only gzip file compressed block by block on a thread pool
+
+    Members are written in order, so the result is an ordinary multi-member
+    gzip file that the gzip module and command line tools read as one.
+    path may also be an open binary file (a pipe works); it is left open.
+    """
+
+    def __init__(self, path, threads=None, block_size=BLOCK_SIZE, level=6):
+        self.threads = threads or DEFAULT_THREADS
+        self.block_size = block_size
+        self.level = level
+        self.owns_file = isinstance(path, (str, bytes, os.PathLike))
+        self.file = open(path, 'wb') if self.owns_file else path
+        self.closed = False
+        self.pool = ThreadPoolExecutor(self.threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.members = 0
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self.submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def submit(self, block):
+        self.pending.append(self.pool.submit(deflate_member, block, self.level))
+        self.members += 1
+
+        # Bound memory: keep at most two blocks per thread in flight
+        while len(self.pending) > self.threads * 2:
+            self.file.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            # An empty file still needs one member to be valid gzip
+            if self.buffer or not self.members:
+                self.submit(bytes(self.buffer))
+                self.buffer.clear()
+            while self.pending:
+                self.file.write(self.pending.popleft().result())
+        finally:
+            self.pool.shutdown()
+            if self.owns_file:
+                self.file.close()
+            else:
+                self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ParallelGzipReader:
+    """Read-only gzip file decompressed member by member on a thread pool
+
+    Files from ParallelGzipWriter are inflated in parallel; any other gzip
+    file is read through the gzip module.
+    """
+
+    def __init__(self, path, threads=None):
+        self.threads = threads or DEFAULT_THREADS
+        self.file = open(path, 'rb')
+        self.pending = deque()
+        self.buffer = b''
+        self.offset = 0
+        self.pool = None
+        self.fallback = None
+
+        if member_length(self.file.read(MEMBER_HEADER.size)) is None:
+            self.fallback = gzip.GzipFile(fileobj=self.file)
+        else:
+            self.pool = ThreadPoolExecutor(self.threads)
+        self.file.seek(0)
+
+    def next_member(self):
+        header = self.file.read(MEMBER_HEADER.size)
+        if not header:
+            return None
+        length = member_length(header)
+        if length is None:
+            raise gzip.BadGzipFile("Not a block-parallel gzip member")
+        rest = self.file.read(length - MEMBER_HEADER.size)
+        if len(rest) != length - MEMBER_HEADER.size:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        return header + rest
+
+    def fill(self):
+        while len(self.pending) < self.threads * 2:
+            member = self.next_member()
+            if member is None:
+                break
+            self.pending.append(self.pool.submit(inflate_member, member))
+
+    def read(self, size=-1):
+        if self.fallback:
+            return self.fallback.read(size)
+
+        chunks = []
+        wanted = size
+        while wanted:
+            if self.offset >= len(self.buffer):
+                self.fill()
+                if not self.pending:
+                    break
+                self.buffer = self.pending.popleft().result()
+                self.offset = 0
+
+            end = len(self.buffer) if wanted < 0 else min(len(self.buffer), self.offset + wanted)
+            chunks.append(self.buffer[self.offset:end])
+            if wanted > 0:
+                wanted -= end - self.offset
+            self.offset = end
+        return b''.join(chunks)
+
+    def close(self):
+        if self.pool:
+            for future in self.pending:
+                future.cancel()
+            self.pool.shutdown()
+        if self.fallback:
+            self.fallback.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
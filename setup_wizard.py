@@ -995,6 +995,15 @@ By proceeding, you agree to these terms."""
             ("Completing installation...", 100, self.finish_installation)
         ]
         
+        # Run every step up front as one unit of work (a single commit);
+        # a failing step only rolls back its own changes
+        self.os_app.db.connect()
+        with self.os_app.db.transaction():
+            results = [func() for message, progress, func in steps]
+        
+        # Reload installed apps
+        self.os_app.installed_apps = self.os_app.load_installed_apps()
+        
         self.current_install_step = 0
         
         def execute_next_step():
@@ -1007,9 +1016,8 @@ By proceeding, you agree to these terms."""
                 spinners = ["⏳", "⌛", "⏳", "⌛"]
                 self.spinner_label.config(text=spinners[self.current_install_step % 4])
                 
-                # Execute step
-                result = func()
-                self.install_details.config(text=result)
+                # Show step result
+                self.install_details.config(text=results[self.current_install_step])
                 
                 self.current_install_step += 1
                 self.window.after(1000, execute_next_step)
@@ -1029,22 +1037,25 @@ By proceeding, you agree to these terms."""
             ).hexdigest()
             
             # Create user in database
-            self.os_app.db.connect()
-            self.os_app.db.cursor.execute('''
-                INSERT OR REPLACE INTO users 
-                (username, password, full_name, is_admin)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                self.setup_data['user_username'],
-                password_hash,
-                self.setup_data['user_name'],
-                1
-            ))
+            with self.os_app.db.transaction():
+                self.os_app.db.cursor.execute('''
+                    INSERT INTO users 
+                    (username, password, full_name, is_admin)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (username) DO UPDATE SET
+                    password = excluded.password,
+                    full_name = excluded.full_name,
+                    is_admin = excluded.is_admin
+                ''', (
+                    self.setup_data['user_username'],
+                    password_hash,
+                    self.setup_data['user_name'],
+                    1
+                ))
             
             # Set as current user
             self.os_app.current_user = self.setup_data['user_username']
             
-            self.os_app.db.connection.commit()
             return "✓ User account created successfully"
         except Exception as e:
             return f"✗ Error creating user: {str(e)}"
@@ -1052,14 +1063,6 @@ By proceeding, you agree to these terms."""
     def configure_system(self):
         """Configure system settings"""
         try:
-            # Create system_info table
-            self.os_app.db.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS system_info (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
-                )
-            ''')
-            
             # Store setup data
             settings = [
                 ('setup_completed', 'true'),
@@ -1070,20 +1073,27 @@ By proceeding, you agree to these terms."""
                 ('build', '2024.01')
             ]
             
-            for key, value in settings:
+            with self.os_app.db.transaction():
+                # Create system_info table
                 self.os_app.db.cursor.execute('''
-                    INSERT OR REPLACE INTO system_info (key, value)
-                    VALUES (?, ?)
-                ''', (key, value))
+                    CREATE TABLE IF NOT EXISTS system_info (
+                        key TEXT PRIMARY KEY,
+                        value TEXT
+                    )
+                ''')
                 
-            # Store privacy settings
-            for key, value in self.setup_data['privacy'].items():
-                self.os_app.db.cursor.execute('''
-                    INSERT OR REPLACE INTO settings (user_id, setting_key, setting_value)
-                    SELECT id, ?, ? FROM users WHERE username = ?
-                ''', (key, str(value), self.os_app.current_user))
-                
-            self.os_app.db.connection.commit()
+                for key, value in settings:
+                    self.os_app.db.set_system_info(key, value)
+                    
+                # Store privacy settings
+                for key, value in self.setup_data['privacy'].items():
+                    self.os_app.db.cursor.execute('''
+                        INSERT INTO settings (user_id, setting_key, setting_value)
+                        SELECT id, ?, ? FROM users WHERE username = ?
+                        ON CONFLICT (user_id, setting_key)
+                        DO UPDATE SET setting_value = excluded.setting_value
+                    ''', (key, str(value), self.os_app.current_user))
+                    
             return "✓ System configured successfully"
         except Exception as e:
             return f"✗ Error configuring system: {str(e)}"
@@ -1094,19 +1104,23 @@ By proceeding, you agree to these terms."""
             # Set theme
             self.os_app.theme_manager.set_theme(self.setup_data['theme'])
             
-            # Store theme preference
-            self.os_app.db.cursor.execute('''
-                INSERT OR REPLACE INTO settings (user_id, setting_key, setting_value)
-                SELECT id, 'theme', ? FROM users WHERE username = ?
-            ''', (self.setup_data['theme'], self.os_app.current_user))
-            
-            # Store wallpaper preference
-            self.os_app.db.cursor.execute('''
-                INSERT OR REPLACE INTO settings (user_id, setting_key, setting_value)
-                SELECT id, 'wallpaper', ? FROM users WHERE username = ?
-            ''', (self.setup_data['wallpaper'], self.os_app.current_user))
-            
-            self.os_app.db.connection.commit()
+            with self.os_app.db.transaction():
+                # Store theme preference
+                self.os_app.db.cursor.execute('''
+                    INSERT INTO settings (user_id, setting_key, setting_value)
+                    SELECT id, 'theme', ? FROM users WHERE username = ?
+                    ON CONFLICT (user_id, setting_key)
+                    DO UPDATE SET setting_value = excluded.setting_value
+                ''', (self.setup_data['theme'], self.os_app.current_user))
+                
+                # Store wallpaper preference
+                self.os_app.db.cursor.execute('''
+                    INSERT INTO settings (user_id, setting_key, setting_value)
+                    SELECT id, 'wallpaper', ? FROM users WHERE username = ?
+                    ON CONFLICT (user_id, setting_key)
+                    DO UPDATE SET setting_value = excluded.setting_value
+                ''', (self.setup_data['wallpaper'], self.os_app.current_user))
+                
             return f"✓ Applied {self.setup_data['theme']} theme"
         except Exception as e:
             return f"✗ Error applying theme: {str(e)}"
@@ -1117,22 +1131,15 @@ By proceeding, you agree to these terms."""
             apps_installed = 0
             app_list = self.setup_data.get('apps_to_install', [])
             
-            for app_name in app_list:
-                # Mark as installed in database
-                self.os_app.db.cursor.execute('''
-                    UPDATE installed_apps SET is_system_app = 1
-                    WHERE name = ? AND is_system_app = 0
-                ''', (app_name,))
-                apps_installed += 1
-                
-                # Simulate installation delay
-                time.sleep(0.1)
-                
-            self.os_app.db.connection.commit()
-            
-            # Reload installed apps
-            self.os_app.installed_apps = self.os_app.load_installed_apps()
-            
+            with self.os_app.db.transaction():
+                for app_name in app_list:
+                    # Mark as installed in database
+                    self.os_app.db.cursor.execute('''
+                        UPDATE installed_apps SET is_system_app = 1
+                        WHERE name = ? AND is_system_app = 0
+                    ''', (app_name,))
+                    apps_installed += 1
+                    
             return f"✓ Installed {apps_installed} applications"
         except Exception as e:
             return f"✗ Error installing applications: {str(e)}"
@@ -1152,12 +1159,13 @@ Theme: {self.setup_data['theme']}
 Thank you for choosing Python OS!
 """
             
-            self.os_app.db.cursor.execute('''
-                INSERT OR REPLACE INTO filesystem (name, type, path, content)
-                VALUES (?, 'file', '/home/admin', ?)
-            ''', ('welcome.txt', welcome_content))
-            
-            self.os_app.db.connection.commit()
+            with self.os_app.db.transaction():
+                file_id = self.os_app.db.create_file(
+                    '/home/admin', 'welcome.txt', welcome_content, replace=True
+                )
+                if file_id is None:
+                    return "✗ Error finalizing: cannot create welcome file"
+                
             return "✓ Created welcome files"
         except Exception as e:
             return f"✗ Error finalizing: {str(e)}"
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'system.db')
+
+
+@pytest.fixture
+def db(db_path):
+    manager = DatabaseManager(db_path)
+    manager.init_database()
+    yield manager
+    manager.close()
@@ -0,0 +1,28 @@
+import sqlite3
+
+from backup_chain import BackupChain
+from os_cli import OSCLI
+
+
+def test_incremental_backups_restore_each_point(db, tmp_path):
+    chain_dir = tmp_path / 'backups'
+    cli = OSCLI(db.db_path)
+    cli.backup_incremental(str(chain_dir))
+    cli.db.create_file('/home', 'later.txt', 'added after the base')
+    cli.db.connection.commit()
+    cli.backup_incremental(str(chain_dir))
+    cli.db.close()
+
+    chain = BackupChain(str(chain_dir))
+    base, delta = chain.entries()
+    assert base['base'] and not delta['base']
+    assert 0 < delta['changed_pages'] < delta['page_count']
+    assert not (chain_dir / 'snapshot.tmp').exists()
+
+    for entry, expected in ((base, 0), (delta, 1)):
+        target = tmp_path / f"restored-{entry['sequence']}.db"
+        chain.restore(str(target), entry['sequence'])
+        copy = sqlite3.connect(target)
+        found = copy.execute("SELECT COUNT(*) FROM filesystem WHERE name = 'later.txt'").fetchone()[0]
+        copy.close()
+        assert found == expected
@@ -0,0 +1,359 @@
+import gzip
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from database import DatabaseManager, SCHEMA_VERSION, find_query_plan_scans, join_path
+
+
+def start(db_path):
+    db = DatabaseManager(db_path)
+    try:
+        db.init_database()
+    finally:
+        db.close()
+
+
+def test_interrupted_migration_retries_on_next_start(db_path, monkeypatch):
+    original = DatabaseManager.migrate_v4_inode_tree
+
+    def stopped(self):
+        self.connection.commit()
+        raise sqlite3.OperationalError('stopped')
+
+    def interrupted(self):
+        self.cursor.execute('ALTER TABLE filesystem ADD COLUMN parent_id INTEGER')
+        raise sqlite3.OperationalError('interrupted')
+
+    # Leave a database at version 3, as an older release would
+    monkeypatch.setattr(DatabaseManager, 'migrate_v4_inode_tree', stopped)
+    with pytest.raises(sqlite3.OperationalError):
+        start(db_path)
+
+    monkeypatch.setattr(DatabaseManager, 'migrate_v4_inode_tree', interrupted)
+    with pytest.raises(sqlite3.OperationalError, match='interrupted'):
+        start(db_path)
+
+    monkeypatch.setattr(DatabaseManager, 'migrate_v4_inode_tree', original)
+    start(db_path)
+
+    connection = sqlite3.connect(db_path)
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(filesystem)')]
+    connection.close()
+
+    assert version == SCHEMA_VERSION
+    assert columns.count('parent_id') == 1
+
+
+def test_resaved_settings_keep_row_count(db):
+    with db.transaction():
+        db.cursor.execute("INSERT INTO users (username, password) VALUES ('alice', 'x')")
+        user_id = db.cursor.lastrowid
+    for value in ('light', 'dark', 'light'):
+        db.set_setting('theme', value)
+        db.set_setting('theme', value, user_id=user_id)
+
+    rows = db.connection.execute('SELECT COUNT(*) FROM settings').fetchone()[0]
+    assert rows == 2
+    assert db.get_row_counts()['settings'] == rows
+    assert db.get_setting('theme') == 'light'
+
+
+def test_trash_import_keeps_trash_stats(db, tmp_path):
+    db.ensure_directory('/home/admin/docs')
+    db.create_file('/home/admin/docs', 'a.txt', 'alpha')
+    db.create_file('/home/admin/docs', 'b.txt', 'beta')
+    db.create_file('/home/admin', 'c.txt', 'gamma')
+    db.connection.commit()
+    for path, name in (('/home/admin', 'docs'), ('/home/admin', 'c.txt')):
+        db.move_to_trash(db.resolve_path(join_path(path, name)), deleted_by='admin')
+    expected = db.get_trash_stats()
+    columns, rows = db.export_rows('trash')
+
+    target = DatabaseManager(str(tmp_path / 'target.db'))
+    target.init_database()
+    rows = list(rows)
+    # Small batches split the trashed directory across transactions
+    target.import_rows('trash', columns, rows, batch_size=2)
+    imported = target.get_trash_stats()
+    target.import_rows('trash', columns, rows, on_conflict='update', batch_size=2)
+    updated = target.get_trash_stats()
+    target.close()
+
+    assert expected['entries'] == 2 and expected['items'] == 4
+    assert imported == expected
+    assert updated == expected
+
+
+def test_move_directory_with_nested_children(db):
+    db.ensure_directory('/home/a/docs/sub/deep')
+    db.ensure_directory('/home/b')
+    db.create_file('/home/a/docs', 'x.txt', 'x')
+    db.create_file('/home/a/docs/sub', 'y.txt', 'y')
+    db.create_file('/home/a/docs/sub/deep', 'z.txt', 'z')
+    db.connection.commit()
+    # Warm the dentry cache so stale listings would show
+    db.list_directory('/home/a/docs/sub')
+    db.list_directory('/home/a')
+    docs = db.resolve_path('/home/a/docs')
+
+    assert db.move_entry(docs, '/home/b', 'papers') == (True, None)
+
+    assert db.resolve_path('/home/a/docs') is None
+    assert db.list_directory('/home/a/docs/sub') is None
+    assert db.list_directory('/home/a') == []
+    assert db.resolve_path('/home/b/papers') == docs
+    for name in ('x.txt', 'sub/y.txt', 'sub/deep/z.txt'):
+        entry = db.resolve_path(f'/home/b/papers/{name}')
+        parent = db.resolve_path(f'/home/b/papers/{name}'.rsplit('/', 1)[0])
+        assert entry is not None
+        assert db.connection.execute(
+            'SELECT parent_id FROM filesystem WHERE id = ?', (entry,)
+        ).fetchone()[0] == parent
+    assert [row[0] for row in db.list_directory('/home/b/papers/sub')] == ['deep', 'y.txt']
+
+    # Nor can it move below itself
+    assert db.move_entry(docs, '/home/b/papers/sub/deep')[0] is False
+
+
+def test_compressed_backup_round_trips(db, tmp_path):
+    db.create_file('/home', 'notes.txt', 'hello ' * 1000)
+    db.connection.commit()
+    target = tmp_path / 'backup.db.gz'
+
+    pages = db.backup(str(target), compress=True, pages=2)
+
+    assert not [path for path in tmp_path.iterdir() if path.suffix in ('.snapshot', '.tmp')]
+    restored = tmp_path / 'restored.db'
+    with gzip.open(target) as f_in:
+        restored.write_bytes(f_in.read())
+    copy = sqlite3.connect(restored)
+    assert copy.execute('PRAGMA page_count').fetchone()[0] == pages
+    assert copy.execute("SELECT COUNT(*) FROM filesystem WHERE name = 'notes.txt'").fetchone()[0] == 1
+    copy.close()
+
+
+def test_hot_queries_use_indexes(db):
+    assert find_query_plan_scans(db.cursor) == []
+    assert db.check_query_plans() == []
+
+    # A fresh connection, so no cached plan outlives the index
+    connection = sqlite3.connect(db.db_path)
+    connection.execute('DROP INDEX idx_trash_group')
+    scans = find_query_plan_scans(connection.cursor())
+    connection.close()
+    assert [name for name, detail in scans] == ['trash.group']
+
+
+def visible(db_path, sql):
+    """Run a read on a separate connection, as another process would see it"""
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute(sql).fetchall()
+    finally:
+        connection.close()
+
+
+def test_nested_transaction_commits_once_at_outermost_block(db):
+    commits = db.connection.commits
+    with db.transaction():
+        db.set_system_info('setup_completed', 'true')
+        with db.transaction():
+            db.create_file('/home', 'welcome.txt', 'hi')
+            db.set_setting('theme', 'dark')
+        assert visible(db.db_path, "SELECT value FROM system_info WHERE key = 'setup_completed'") == []
+        assert visible(db.db_path, "SELECT id FROM filesystem WHERE name = 'welcome.txt'") == []
+
+    assert db.connection.commits == commits + 1
+    assert db.connection.deferred_commits >= 3
+    assert visible(db.db_path, "SELECT value FROM system_info WHERE key = 'setup_completed'") == [('true',)]
+    assert len(visible(db.db_path, "SELECT id FROM filesystem WHERE name = 'welcome.txt'")) == 1
+    assert visible(db.db_path, "SELECT setting_value FROM settings WHERE setting_key = 'theme'") == [('dark',)]
+
+
+def test_failing_inner_block_rolls_back_alone(db):
+    # Shaped like setup's install_steps: one failing step inside the unit
+    with db.transaction():
+        db.set_system_info('first_step', 'done')
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.create_file('/home', 'partial.txt', 'x')
+                raise RuntimeError('step failed')
+        db.create_file('/home', 'after.txt', 'y')
+
+    names = {row[0] for row in visible(db.db_path, 'SELECT name FROM filesystem')}
+    assert 'after.txt' in names and 'partial.txt' not in names
+    assert visible(db.db_path, "SELECT value FROM system_info WHERE key = 'first_step'") == [('done',)]
+    rows = visible(db.db_path, 'SELECT COUNT(*) FROM filesystem')[0][0]
+    assert db.get_row_counts()['filesystem'] == rows
+
+
+def test_method_rollback_inside_transaction_undoes_only_its_block(db):
+    with db.transaction():
+        db.set_system_info('kept', 'yes')
+        with db.transaction():
+            db.cursor.execute("INSERT INTO system_info (key, value) VALUES ('undone', 'no')")
+            db.connection.rollback()
+        assert db.connection.in_transaction
+
+    assert visible(db.db_path, "SELECT key FROM system_info WHERE key IN ('kept', 'undone')") == [('kept',)]
+
+
+def test_failing_outer_block_rolls_back_everything(db):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.set_system_info('setup_completed', 'true')
+            db.create_file('/home', 'welcome.txt', 'hi')
+            raise RuntimeError('setup aborted')
+
+    assert not db.connection.in_transaction
+    assert db.get_system_info('setup_completed') is None
+    assert db.resolve_path('/home/welcome.txt') is None
+    assert visible(db.db_path, "SELECT value FROM system_info WHERE key = 'setup_completed'") == []
+
+
+def write_from_other_process(db_path, code):
+    """Run code against a DatabaseManager named db in a separate process"""
+    subprocess.run([sys.executable, '-c', (
+        'import sys\n'
+        'from database import DatabaseManager\n'
+        'db = DatabaseManager(sys.argv[1])\n'
+        'db.connect()\n'
+        f'{code}\n'
+        'db.close()\n'
+    ), db_path], check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_caches_see_other_process_writes_whichever_thread_loaded_them(db):
+    db.settings_watch.interval = db.dentry_watch.interval = 0
+    db.set_setting('theme', 'light')
+    db.ensure_directory('/home/shared')
+    db.connection.commit()
+
+    # A background thread (e.g. the trash sweeper) fills the caches first
+    def load():
+        db.get_setting('theme')
+        db.list_directory('/home/shared')
+        db.pool.release()
+    worker = threading.Thread(target=load)
+    worker.start()
+    worker.join()
+
+    assert db.get_setting('theme') == 'light'
+    assert db.list_directory('/home/shared') == []
+    write_from_other_process(db.db_path, "db.set_setting('theme', 'dark')")
+    write_from_other_process(db.db_path, "db.create_file('/home/shared', 'new.txt', 'hi')")
+
+    assert db.get_setting('theme') == 'dark'
+    assert [entry[0] for entry in db.list_directory('/home/shared')] == ['new.txt']
+
+    # Without writes, repeated reads stay cached
+    reads = db.dentry_cache.stats()['hits']
+    db.list_directory('/home/shared')
+    assert db.dentry_cache.stats()['hits'] == reads + 1
+
+
+def test_restore_relinks_tree_when_root_id_was_reused(db):
+    db.ensure_directory('/home/a/docs/sub')
+    db.create_file('/home/a/docs', 'x.txt', 'x')
+    db.create_file('/home/a/docs/sub', 'y.txt', 'y')
+    db.connection.commit()
+    docs = db.resolve_path('/home/a/docs')
+    assert db.move_to_trash(docs, deleted_by='admin')
+
+    # Something else now holds the root's old id (e.g. an imported row)
+    db.cursor.execute('''
+        INSERT INTO filesystem (id, name, type, path, parent_id)
+        VALUES (?, 'intruder', 'directory', '/home', ?)
+    ''', (docs, db.resolve_path('/home')))
+    db.connection.commit()
+
+    trash_id = db.connection.execute(
+        "SELECT id FROM trash WHERE name = 'docs'").fetchone()[0]
+    assert db.restore_many([trash_id]) == [(trash_id, True, None)]
+
+    restored = db.resolve_path('/home/a/docs')
+    assert restored not in (None, docs)
+    assert db.list_directory('/home/intruder') == []
+    for path, parent in (('/home/a/docs/x.txt', '/home/a/docs'),
+                         ('/home/a/docs/sub', '/home/a/docs'),
+                         ('/home/a/docs/sub/y.txt', '/home/a/docs/sub')):
+        parent_id = db.connection.execute(
+            'SELECT parent_id FROM filesystem WHERE id = ?', (db.resolve_path(path),)).fetchone()[0]
+        assert parent_id == db.resolve_path(parent)
+    assert [entry[0] for entry in db.list_directory('/home/a/docs')] == ['sub', 'x.txt']
+
+
+def build_tree(db, root, directories, files):
+    for directory in range(directories):
+        for file in range(files):
+            db.create_file(f'{root}/dir{directory}', f'file{file}.txt', f'{directory}/{file}')
+    db.connection.commit()
+    return db.resolve_path(root)
+
+
+class CountingCursor:
+    """Cursor proxy counting the statements a DatabaseManager method runs"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.statements = 0
+
+    def execute(self, *args):
+        self.statements += 1
+        return self.cursor.execute(*args)
+
+    def executemany(self, *args):
+        self.statements += 1
+        return self.cursor.executemany(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def statements_run(db, action):
+    """Run action, returning how many statements went through db.cursor"""
+    db.get_setting('trash_retention_days')
+    real = db.pool.cursor()
+    counting = db.pool.local.cursor = CountingCursor(real)
+    try:
+        action()
+    finally:
+        db.pool.local.cursor = real
+    return counting.statements
+
+
+def test_trash_and_restore_of_a_tree_are_set_based(db):
+    small = build_tree(db, '/home/small', 2, 2)
+    large = build_tree(db, '/home/large', 20, 25)
+    ids = {row[0] for row in db.connection.execute(
+        "SELECT id FROM filesystem WHERE path LIKE '/home/large%'")}
+
+    commits = db.connection.commits
+    small_trash = statements_run(db, lambda: db.move_to_trash(small, deleted_by='admin'))
+    large_trash = statements_run(db, lambda: db.move_to_trash(large, deleted_by='admin'))
+
+    # The statements issued do not grow with the tree, one commit each
+    assert large_trash == small_trash
+    assert db.connection.commits == commits + 2
+    root = db.connection.execute(
+        "SELECT id FROM trash WHERE name = 'large' AND original_path = '/home'").fetchone()[0]
+    assert db.connection.execute(
+        'SELECT COUNT(*) FROM trash WHERE group_id = ?', (root,)).fetchone()[0] == 1 + 20 + 20 * 25
+    assert db.get_trash_stats()['entries'] == 2
+
+    small_root = db.connection.execute(
+        "SELECT id FROM trash WHERE name = 'small' AND original_path = '/home'").fetchone()[0]
+    small_restore = statements_run(db, lambda: db.restore_from_trash(small_root))
+    large_restore = statements_run(db, lambda: db.restore_from_trash(root))
+
+    assert large_restore == small_restore
+    assert db.get_trash_stats()['entries'] == 0
+    assert {row[0] for row in db.connection.execute(
+        "SELECT id FROM filesystem WHERE path LIKE '/home/large%'")} == ids
+    assert db.list_directory('/home/large/dir19')[-1][0] == 'file9.txt'
@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+import time
+
+from database import EventLogger
+
+
+class GatedPool:
+    """Pool whose connections are handed out only once the gate opens"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.gate = threading.Event()
+
+    def get(self):
+        self.gate.wait()
+        return self.pool.get()
+
+    def release(self):
+        self.pool.release()
+
+
+def logged(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in connection.execute('SELECT event_type FROM system_log ORDER BY id')]
+    finally:
+        connection.close()
+
+
+def test_flush_writes_events_in_queue_order(db):
+    logger = EventLogger(db.pool, batch_size=3)
+    for number in range(10):
+        assert logger.log(f'event_{number}')
+
+    assert logger.flush()
+    assert logged(db.db_path) == [f'event_{number}' for number in range(10)]
+    assert logger.stats()['flushed'] == 10 and logger.stats()['batches'] == 4
+    logger.stop()
+
+
+def test_full_queue_drops_and_counts(db):
+    logger = EventLogger(db.pool, max_queue=3)
+    logger.start = lambda: None
+
+    results = [logger.log(f'event_{number}') for number in range(5)]
+
+    assert results == [True, True, True, False, False]
+    assert logger.stats()['dropped'] == 2 and logger.stats()['queued'] == 3
+
+
+def test_flush_and_stop_do_not_block_on_a_full_queue(db):
+    pool = GatedPool(db.pool)
+    logger = EventLogger(pool, max_queue=5, batch_size=2)
+    # The writer takes a batch and waits on the gate, then the queue fills
+    logger.log('event_0')
+    logger.log('event_1')
+    deadline = time.monotonic() + 5.0
+    while logger.stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for number in range(2, 8):
+        logger.log(f'event_{number}')
+    assert logger.stats()['pending'] == 5
+
+    started = time.monotonic()
+    assert logger.flush(timeout=0.2) is False
+    logger.stop(timeout=0.2)
+    assert time.monotonic() - started < 1.0
+
+    # Once it can write, the stopped writer drains the queue and exits
+    pool.gate.set()
+    logger.thread.join(5.0)
+    assert not logger.thread.is_alive()
+    assert logged(db.db_path) == [f'event_{number}' for number in range(7)]
+    assert logger.stats()['dropped'] == 1
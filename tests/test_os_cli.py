@@ -0,0 +1,109 @@
+import sys
+
+from database import DatabaseManager
+from os_cli import OSCLI
+
+
+def test_filesystem_import_into_new_system(db, tmp_path, capsys):
+    db.ensure_directory('/home/admin')
+    db.create_file('/home/admin', 'notes.txt', 'hello')
+    db.connection.commit()
+    export = str(tmp_path / 'filesystem.jsonl')
+    exporter = OSCLI(db.db_path)
+    exporter.export_table('filesystem', None, export)
+    exporter.db.close()
+
+    target_path = str(tmp_path / 'target.db')
+    target = DatabaseManager(target_path)
+    target.init_database()
+    target.close()
+    capsys.readouterr()
+
+    cli = OSCLI(target_path)
+    cli.import_table('filesystem', None, export)
+    assert '✓ Imported filesystem' in capsys.readouterr().err
+    rows = cli.db.connection.execute('SELECT COUNT(*) FROM filesystem').fetchone()[0]
+    assert cli.db.get_row_counts()['filesystem'] == rows
+    assert cli.db.resolve_path('/home/admin/notes.txt')
+
+    cli.import_table('filesystem', None, export, on_conflict='abort')
+    err = capsys.readouterr().err
+    assert 'UNIQUE constraint failed: filesystem.id' in err
+    assert '--on-conflict ignore' in err and '--on-conflict update' in err
+    cli.db.close()
+
+
+def fleet_with_expired_trash(tmp_path):
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        member = DatabaseManager(str(tmp_path / name / 'system.db'))
+        member.init_database()
+        member.create_file('/home', 'old.txt', 'stale')
+        member.move_to_trash(member.resolve_path('/home/old.txt'))
+        member.cursor.execute("UPDATE trash SET expires_at = datetime('now', '-1 day')")
+        member.connection.commit()
+        member.close()
+    return str(tmp_path / '*' / 'system.db')
+
+
+def run_cli(monkeypatch, *argv):
+    monkeypatch.setattr(sys, 'argv', ['os_cli.py', *argv])
+    try:
+        OSCLI(connect=False).run()
+    except SystemExit as e:
+        return e.code
+    return 0
+
+
+def test_fleet_prompting_command_needs_force(tmp_path, monkeypatch, capsys):
+    fleet = fleet_with_expired_trash(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    assert run_cli(monkeypatch, '--fleet', fleet, 'trash', '--cleanup') == 1
+    out = capsys.readouterr().out
+    for name in ('a', 'b'):
+        assert f'[{name}/system.db] ✗ Needs confirmation; pass --force' in out
+
+    assert run_cli(monkeypatch, '--fleet', fleet, 'trash', '--cleanup', '--force') == 0
+    out = capsys.readouterr().out
+    for name in ('a', 'b'):
+        assert f'[{name}/system.db] ✓ Cleaned up 1 expired item(s).' in out
+    for name in ('a', 'b'):
+        member = DatabaseManager(str(tmp_path / name / 'system.db'))
+        assert member.count_expired_trash() == 0
+        member.close()
+
+
+def test_status_reads_the_counters_in_one_query(db, capsys):
+    for number in range(30):
+        db.cursor.execute("INSERT INTO system_log (event_type) VALUES (?)", (f'event_{number}',))
+    db.connection.commit()
+    cli = OSCLI(db.db_path)
+    statements = []
+    cli.db.connection.set_trace_callback(statements.append)
+
+    cli.show_status()
+
+    cli.db.connection.set_trace_callback(None)
+    assert sum('FROM row_counts' in sql for sql in statements) == 1
+    for table in ('system_log', 'filesystem', 'settings', 'installed_apps'):
+        assert not [sql for sql in statements if 'COUNT(' in sql and f'FROM {table}' in sql]
+    assert 'Log entries: 30' in capsys.readouterr().out
+    cli.db.close()
+
+
+def test_exact_counts_run_on_read_only_connections(db, monkeypatch):
+    opened = []
+    open_connection = db.pool.open
+
+    def recording_open(read_only=False):
+        opened.append(read_only)
+        return open_connection(read_only)
+    monkeypatch.setattr(db.pool, 'open', recording_open)
+    tables = ('users', 'filesystem', 'system_log', 'settings')
+
+    counts = db.exact_row_counts(tables, threads=4)
+
+    assert counts == {table: db.connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                      for table in tables}
+    assert opened and all(opened) and len(opened) <= 4
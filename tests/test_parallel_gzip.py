@@ -0,0 +1,59 @@
+import gzip
+import os
+import threading
+
+import parallel_gzip
+from parallel_gzip import ParallelGzipReader, ParallelGzipWriter, deflate_member
+
+
+def sample(size):
+    # Compressible but not trivially so, like database pages
+    return (os.urandom(1024) + bytes(3072)) * (size // 4096) + os.urandom(size % 4096)
+
+
+def test_parallel_writer_output_reads_as_plain_gzip(tmp_path):
+    data = sample(7 * 64 * 1024 // 2)
+    path = tmp_path / 'data.gz'
+
+    with ParallelGzipWriter(str(path), threads=4, block_size=64 * 1024) as f_out:
+        for start in range(0, len(data), 10000):
+            f_out.write(data[start:start + 10000])
+
+    assert f_out.members == 4
+    with gzip.open(path) as f_in:
+        assert f_in.read() == data
+    with ParallelGzipReader(str(path), threads=4) as f_in:
+        assert f_in.read(12345) + f_in.read() == data
+
+
+def test_blocks_are_compressed_off_the_calling_thread(tmp_path, monkeypatch):
+    threads = []
+
+    def recording_deflate(block, level):
+        threads.append(threading.current_thread())
+        return deflate_member(block, level)
+    monkeypatch.setattr(parallel_gzip, 'deflate_member', recording_deflate)
+
+    with ParallelGzipWriter(str(tmp_path / 'data.gz'), threads=3, block_size=4096) as f_out:
+        f_out.write(sample(5 * 4096))
+
+    assert len(threads) == 5
+    assert threading.current_thread() not in threads
+
+
+def test_reader_falls_back_for_ordinary_gzip(tmp_path):
+    data = sample(100000)
+    path = tmp_path / 'plain.gz'
+    path.write_bytes(gzip.compress(data))
+
+    with ParallelGzipReader(str(path)) as f_in:
+        assert f_in.fallback is not None
+        assert f_in.read() == data
+
+
+def test_empty_input_is_valid_gzip(tmp_path):
+    path = tmp_path / 'empty.gz'
+    with ParallelGzipWriter(str(path)):
+        pass
+    with gzip.open(path) as f_in:
+        assert f_in.read() == b''